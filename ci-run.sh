@@ -4,7 +4,7 @@ set -euo pipefail
 # Script to run the stack in CI mode
 # Generates customized docker-compose files based on parameters
 #
-# Usage: ./ci-run.sh [HOLLOW] [HOST_NETWORK] [HTTP] [RUN_TESTS] [GENERATE] [DOWN_FIRST] [CLEAN] [LOOP] [PLAYWRIGHT_PARAMS]
+# Usage: ./ci-run.sh [HOLLOW] [HOST_NETWORK] [HTTP] [RUN_TESTS] [GENERATE] [DOWN_FIRST] [CLEAN] [LOOP] [PLAYWRIGHT_PARAMS] [BUILD]
 #
 # Parameters:
 #   HOLLOW (default: false)      - Use hollow build (true/false)
@@ -16,6 +16,28 @@ set -euo pipefail
 #   CLEAN (default: false)       - Run clean.py before starting (true/false)
 #   LOOP (default: false)        - Run services in a loop (true/false)
 #   PLAYWRIGHT_PARAMS (default: empty) - Additional parameters to pass to playwright test command
+#   BUILD (default: true)        - Build images whose fingerprint is not present yet; with false, images must already exist (true/false)
+#
+# Environment:
+#   BUILD_JOBS (default: 4)      - Maximum number of images built concurrently
+#   DEPS_CACHE_KEEP (default: 3) - Number of node_modules cache volumes (hollow mode) kept, least recently used are removed
+#   FAST_DB (default: false)     - Run MariaDB on tmpfs with durability turned off (true/false)
+#   BENCH (default: false)       - Pin services to their own cores with CPU/memory limits and size the
+#                                  Playwright workers to match, for comparable timings (true/false)
+#   PROFILE (default: false)     - Write CPU profiles of server, messages and admin (and heap profiles of node processes)
+#                                  into ci-artifacts/profiles; written when the services stop at shutdown (true/false)
+#   BENCH_SERVICE (default: false) - Add the WebSocket load generator service 'bench' (true/false)
+#   STACK_INDEX (default: 0)     - Run beside other stacks on this host: own ports (shifted by 10 * index), project
+#                                  name (COMPOSE_PROJECT_NAME, default <directory>-<index>) and last.stack<index>.yaml;
+#                                  its results and artifacts get the suffix -stack<index> (e.g. ci-artifacts/logs-stack1)
+#   SETTINGS_PROFILE (default: empty) - Comma-separated settings profiles from settings-profiles/ (e.g. perf)
+#   DETACH (default: false)      - Without tests: start the stack detached, wait until it is ready and exit (true/false)
+#   DB_SNAPSHOT (default: false) - Restore the MariaDB volume from a snapshot of an initialized database,
+#                                  or save one after the first healthy start (true/false)
+#   TIMING_KIND (default: ci-run) - Kind of run recorded in the timing history (.cache/timing-history.sqlite)
+#   TIMING_PHASES (default: empty) - Additional "name=seconds ..." phases recorded with the run
+#   STATS_INTERVAL (default: 1)  - Seconds between container resource samples (ci-artifacts/stats.json)
+#   LOG_FILTER (default: empty)  - pino-filter.json style file of per-module minimum levels applied while collecting logs
 #
 # Example: ./ci-run.sh false false true true true true true
 
@@ -29,26 +51,57 @@ DOWN_FIRST=${6:-false}
 CLEAN=${7:-false}
 LOOP=${8:-false}
 PLAYWRIGHT_PARAMS=${9:-}
+BUILD=${10:-true}
+FAST_DB=${FAST_DB:-false}
+DETACH=${DETACH:-false}
+BENCH=${BENCH:-false}
+BENCH_SERVICE=${BENCH_SERVICE:-false}
+PROFILE=${PROFILE:-false}
+SETTINGS_PROFILE=${SETTINGS_PROFILE:-}
+STACK_INDEX=${STACK_INDEX:-0}
+DB_SNAPSHOT=${DB_SNAPSHOT:-false}
+if [ "$FAST_DB" = "true" ] && [ "$DB_SNAPSHOT" = "true" ]; then
+  echo "FAST_DB keeps the database on tmpfs, there is no volume to snapshot; ignoring DB_SNAPSHOT"
+  DB_SNAPSHOT=false
+fi
 
 
 # Set environment variables and determine compose file name
 export HOLLOW
 export HOST_NETWORK
 export HTTP
+export FAST_DB
+export BENCH
+export PROFILE
+export SETTINGS_PROFILE
+export STACK_INDEX
 INSTANTIATION=`./instantiation.sh`
 COMPOSE_FILE="generated/docker-compose.${INSTANTIATION}.yml"
 
+# Every stack but the first gets its own compose project (containers, volumes, networks) and last.yaml
+LAST_COMPOSE="last.yaml"
+RESULTS_SUFFIX=""
+if [ "$STACK_INDEX" != "0" ]; then
+  DIRECTORY_NAME=$(basename "$PWD" | tr '[:upper:]' '[:lower:]' | tr -cd 'a-z0-9_-')
+  export COMPOSE_PROJECT_NAME=${COMPOSE_PROJECT_NAME:-${DIRECTORY_NAME}-${STACK_INDEX}}
+  LAST_COMPOSE="last.stack${STACK_INDEX}.yaml"
+  # The Playwright service of the stack mounts test-results-stackN/ etc. (see add_playwright_container()); the
+  # collectors' artifacts get the same suffix, so they don't overwrite those of the other stacks
+  RESULTS_SUFFIX="-stack${STACK_INDEX}"
+  echo "Stack index $STACK_INDEX: project $COMPOSE_PROJECT_NAME"
+fi
+
 # Bring down existing stack if requested
 if [ "$DOWN_FIRST" = "true" ]; then
   echo "Bringing down existing stack..."
 
-  if [ -f "last.yaml" ]; then
-    echo "Found last.yaml, using it to bring down the previous stack"
+  if [ -f "$LAST_COMPOSE" ]; then
+    echo "Found $LAST_COMPOSE, using it to bring down the previous stack"
     set +e
-    docker compose --project-directory . -f last.yaml down
+    docker compose --project-directory . -f $LAST_COMPOSE down
     set -e
   else
-    echo "No last.yaml found, trying to determine compose file from current parameters"
+    echo "No $LAST_COMPOSE found, trying to determine compose file from current parameters"
     if [ -f "$COMPOSE_FILE" ]; then
       echo "Using compose file: $COMPOSE_FILE"
       set +e
@@ -64,22 +117,39 @@ if [ "$CLEAN" = "true" ]; then
   ./clean.py
 fi
 
+# Set environment variables (also part of the image fingerprints, so export them before generating)
+#export CI=true
+export USER_ID=$(id -u)
+export GROUP_ID=$(id -g)
+echo "Running with USER_ID=$USER_ID and GROUP_ID=$GROUP_ID"
+
 if [ "$GENERATE" = "true" ]; then
   # Generate the customized docker-compose file with Dockerfiles
   echo "Generating Dockerfiles and compose file..."
-  scripts/generate_compose.py --hollow=$HOLLOW --host-network=$HOST_NETWORK --http=$HTTP
+  scripts/generate_compose.py --hollow=$HOLLOW --host-network=$HOST_NETWORK --http=$HTTP --fast-db=$FAST_DB --bench=$BENCH --profile=$PROFILE --bench-service=$BENCH_SERVICE \
+    --settings-profile="$SETTINGS_PROFILE" --stack-index=$STACK_INDEX ${COMPOSE_PROJECT_NAME:+--project-name=$COMPOSE_PROJECT_NAME}
 fi
 echo "Using compose file: $COMPOSE_FILE"
 
-# Set environment variables
-#export CI=true
-export USER_ID=$(id -u)
-export GROUP_ID=$(id -g)
-echo "Running with USER_ID=$USER_ID and GROUP_ID=$GROUP_ID"
+BUILD_DURATION=0
+if [ "$BUILD" = "true" ]; then
+  # Build only the images whose fingerprint is not present locally
+  echo "[CI-RUN] Building missing images..."
+  BUILD_START_TIME=$(date +%s)
+  scripts/build_images.py $COMPOSE_FILE
+  BUILD_END_TIME=$(date +%s)
+  BUILD_DURATION=$((BUILD_END_TIME - BUILD_START_TIME))
+  echo "[CI-RUN] Image build completed in ${BUILD_DURATION} seconds"
+fi
 
 # Create necessary directories for Playwright
 echo "Creating test result directories..."
-mkdir -p test-results playwright-report
+mkdir -p test-results$RESULTS_SUFFIX playwright-report$RESULTS_SUFFIX ci-artifacts
+if [ "$PROFILE" = "true" ]; then
+  # Profiles of a previous run must not mix in; server-init creates the service directories
+  rm -rf ci-artifacts/profiles$RESULTS_SUFFIX
+  mkdir -p ci-artifacts/profiles$RESULTS_SUFFIX
+fi
 
 if [ "$HTTP" = "false" ]; then
   # create a self-signed certificate if it doesn't exist
@@ -95,29 +165,65 @@ fi
 
 
 # Copy current compose file to last.yaml for future reference
-echo "Copying $COMPOSE_FILE to last.yaml..."
-cp "$COMPOSE_FILE" last.yaml
+echo "Copying $COMPOSE_FILE to $LAST_COMPOSE..."
+cp "$COMPOSE_FILE" $LAST_COMPOSE
 
 
 if [ "$RUN_TESTS" = "true" ]; then
   # Start services, run tests, then shut down
 
   # Time the stack startup
+  DB_SNAPSHOT_STATUS=0
+  if [ "$DB_SNAPSHOT" = "true" ]; then
+    echo "[CI-RUN] Restoring database snapshot..."
+    scripts/db_snapshot.py restore || DB_SNAPSHOT_STATUS=$?
+    if [ "$DB_SNAPSHOT_STATUS" != "0" ] && [ "$DB_SNAPSHOT_STATUS" != "3" ]; then
+      # The tests would run against the previous run's database
+      echo "[CI-RUN] Error: restoring the database snapshot failed with exit code $DB_SNAPSHOT_STATUS"
+      exit 1
+    fi
+  fi
+
+  # Follow the output of all containers into indexed chunks in ci-artifacts/logs until the stack is down
+  LOG_DIR=ci-artifacts/logs$RESULTS_SUFFIX
+  rm -rf $LOG_DIR
+  mkdir -p $LOG_DIR
+  scripts/log_collector.py --dir $LOG_DIR collect ${LOG_FILTER:+--filter $LOG_FILTER} \
+    > $LOG_DIR/collector.log 2>&1 &
+  LOG_COLLECTOR_PID=$!
+
   echo "[CI-RUN] Starting stack..."
   STACK_START_TIME=$(date +%s)
+  # Record the per-service startup timeline in the background
+  scripts/stack_timeline.py --compose-file $COMPOSE_FILE --since $STACK_START_TIME --until-ready \
+    --output-dir ci-artifacts --name timeline$RESULTS_SUFFIX > ci-artifacts/timeline$RESULTS_SUFFIX.log 2>&1 &
+  TIMELINE_PID=$!
+  # Sample CPU, memory, block I/O and network of every container until the tests are done
+  scripts/stats_sampler.py --interval ${STATS_INTERVAL:-1} --output ci-artifacts/stats$RESULTS_SUFFIX.json \
+    > ci-artifacts/stats$RESULTS_SUFFIX.log 2>&1 &
+  STATS_PID=$!
   set -x
-  docker compose --project-directory . -f $COMPOSE_FILE --parallel 1 up --build --remove-orphans --force-recreate --detach
+  docker compose --project-directory . -f $COMPOSE_FILE up --no-build --remove-orphans --force-recreate --detach
   set +x
+  # Probe all services concurrently instead of waiting for the next healthcheck interval
+  scripts/wait_ready.py --host-network=$HOST_NETWORK --http=$HTTP --stack-index=$STACK_INDEX --json ci-artifacts/readiness$RESULTS_SUFFIX.json \
+    || echo "[CI-RUN] Warning: not all services became ready"
   STACK_END_TIME=$(date +%s)
   STACK_DURATION=$((STACK_END_TIME - STACK_START_TIME))
   echo "[CI-RUN] Stack startup completed in ${STACK_DURATION} seconds"
 
+  # Exit code 3: no snapshot for these server/messages commits yet, so save the freshly initialized database
+  if [ "$DB_SNAPSHOT" = "true" ] && [ "$DB_SNAPSHOT_STATUS" = "3" ]; then
+    echo "[CI-RUN] Saving database snapshot..."
+    scripts/db_snapshot.py save || echo "[CI-RUN] Warning: saving the database snapshot failed"
+  fi
+
   # Run tests with the Playwright container
   echo "[CI-RUN] Running tests with Playwright container..."
   PLAYWRIGHT_START_TIME=$(date +%s)
   set +e
   set -x
-  docker compose --project-directory . -f $COMPOSE_FILE --parallel 1 run --build -e PLAYWRIGHT_PARAMS="$PLAYWRIGHT_PARAMS" playwright
+  docker compose --project-directory . -f $COMPOSE_FILE run -e PLAYWRIGHT_PARAMS="$PLAYWRIGHT_PARAMS" playwright
 
   TEST_EXIT_CODE=$?
 
@@ -130,20 +236,69 @@ if [ "$RUN_TESTS" = "true" ]; then
   PLAYWRIGHT_DURATION=$((PLAYWRIGHT_END_TIME - PLAYWRIGHT_START_TIME))
   echo "[CI-RUN] Playwright tests completed in ${PLAYWRIGHT_DURATION} seconds"
 
+  # The timeline ran on beside the tests until it saw the last healthchecks pass; stop it if some service never did
+  kill -INT $TIMELINE_PID 2>/dev/null || true
+  wait $TIMELINE_PID || echo "[CI-RUN] Warning: stack timeline failed, see ci-artifacts/timeline$RESULTS_SUFFIX.log"
+  sed -n '/CRITICAL PATH/,$p' ci-artifacts/timeline$RESULTS_SUFFIX.log
+
+  kill -INT $STATS_PID 2>/dev/null || true
+  wait $STATS_PID || echo "[CI-RUN] Warning: stats sampler failed, see ci-artifacts/stats$RESULTS_SUFFIX.log"
+
   # Print timing summary
   TOTAL_DURATION=$((PLAYWRIGHT_END_TIME - STACK_START_TIME))
   echo "[CI-RUN] ===== TIMING SUMMARY ====="
+  echo "[CI-RUN] Image build: ${BUILD_DURATION}s"
   echo "[CI-RUN] Stack startup: ${STACK_DURATION}s"
   echo "[CI-RUN] Playwright tests: ${PLAYWRIGHT_DURATION}s"
   echo "[CI-RUN] Total time: ${TOTAL_DURATION}s"
+  scripts/stats_sampler.py --summary ci-artifacts/stats$RESULTS_SUFFIX.json || true
   echo "[CI-RUN] ========================="
 
-  # Collect logs and shut down
-  echo "[CI-RUN] Collecting logs and shutting down..."
+  # Record phases, per-service startup and per-test results in the timing history
+  TIMING_ARGS=""
+  for PHASE in ${TIMING_PHASES:-}; do
+    TIMING_ARGS="$TIMING_ARGS --phase $PHASE"
+  done
+  scripts/timing_history.py record --kind ${TIMING_KIND:-ci-run} --instance $INSTANTIATION \
+    --started-at $STACK_START_TIME --exit-code $TEST_EXIT_CODE \
+    --phase build=$BUILD_DURATION --phase startup=$STACK_DURATION \
+    --phase tests=$PLAYWRIGHT_DURATION --phase total=$TOTAL_DURATION $TIMING_ARGS \
+    --readiness ci-artifacts/readiness$RESULTS_SUFFIX.json --timeline ci-artifacts/timeline$RESULTS_SUFFIX.json \
+    --report client=test-results$RESULTS_SUFFIX/results.json \
+    --report admin=yellow-admin/test-results$RESULTS_SUFFIX/results.json \
+    --report stack=stack_tests/test-results$RESULTS_SUFFIX/results.json \
+    || echo "[CI-RUN] Warning: recording the timing history failed"
+
+  # Shut down, then stop the log collector once it has read the containers' last output
+  echo "[CI-RUN] Shutting down..."
+  if [ "$PROFILE" = "true" ]; then
+    # The PID 1 of a service may be a shell that doesn't pass signals on, so send SIGINT to the bun and node processes
+    # themselves; the preloaded profiling/exit_on_signal.cjs makes them exit normally, which writes the profiles
+    echo "[CI-RUN] Stopping the profiled services..."
+    for SERVICE in server messages admin; do
+      docker compose --project-directory . -f $COMPOSE_FILE exec -T $SERVICE sh -c \
+        'for P in /proc/[0-9]*; do case "$(cat $P/comm 2>/dev/null)" in bun|node) kill -INT ${P#/proc/};; esac; done' \
+        || echo "[CI-RUN] Warning: could not signal the processes of $SERVICE"
+    done
+    # Waits for the containers to exit; SIGINT (their stop_signal) again for whatever still runs
+    docker compose --project-directory . -f $COMPOSE_FILE stop server messages admin \
+      || echo "[CI-RUN] Warning: stopping the profiled services failed"
+    if [ -n "$(find ci-artifacts/profiles$RESULTS_SUFFIX -type f -size +0 2>/dev/null)" ]; then
+      find ci-artifacts/profiles$RESULTS_SUFFIX -type f -printf "[CI-RUN] Profile: %p (%s bytes)\n"
+    else
+      echo "[CI-RUN] Warning: no profiles were written to ci-artifacts/profiles$RESULTS_SUFFIX, see the services' logs"
+    fi
+  fi
   set -x
-  docker compose --project-directory . -f $COMPOSE_FILE logs > docker-compose.log
   docker compose --project-directory . -f $COMPOSE_FILE down
   set +x
+  kill -INT $LOG_COLLECTOR_PID 2>/dev/null || true
+  wait $LOG_COLLECTOR_PID || echo "[CI-RUN] Warning: log collector failed, see $LOG_DIR/collector.log"
+
+  # Show the warnings and errors logged around every failed client test
+  if [ "$TEST_EXIT_CODE" != "0" ] && [ -f test-results$RESULTS_SUFFIX/results.json ]; then
+    scripts/log_collector.py --dir $LOG_DIR failures --report test-results$RESULTS_SUFFIX/results.json --limit 200 || true
+  fi
 
   # Exit with the test exit code
   exit $TEST_EXIT_CODE
@@ -153,7 +308,12 @@ else
 	echo "Running services without tests..."
 	set -x
 	./clean.py
-	docker compose --project-directory . -f $COMPOSE_FILE up --build --remove-orphans
+	if [ "$DETACH" = "true" ]; then
+	  docker compose --project-directory . -f $COMPOSE_FILE up --no-build --remove-orphans --force-recreate --detach
+	  scripts/wait_ready.py --host-network=$HOST_NETWORK --http=$HTTP --stack-index=$STACK_INDEX
+	else
+	  docker compose --project-directory . -f $COMPOSE_FILE up --no-build --remove-orphans
+	fi
 	set +x
   fi
 
@@ -161,7 +321,7 @@ else
 	  echo "Running services in loop..."
 	  set -x
 	  ./clean.py
-	  docker compose --project-directory . -f $COMPOSE_FILE up --build --remove-orphans
+	  docker compose --project-directory . -f $COMPOSE_FILE up --no-build --remove-orphans
 	  set +x
   done
 
@@ -1,46 +1,150 @@
 #!/usr/bin/env python3
+"""
+Remove the volumes and networks of a compose project, and its dangling images. The
+dependency cache volumes (see apply_deps_cache in scripts/generate_compose.py) are kept.
+Containers still holding the project's volumes are removed first; other containers
+of the project are left running, and so are the networks they use. Removals run
+concurrently and are retried with exponential backoff until --timeout.
+Usage:
+    ./clean.py [--project yellow-dev] [--timeout 120]
+"""
+
+import argparse
+import os
 import docker
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-def remove_volumes():
-    """Remove yellow-dev Docker volumes with retry logic."""
-    client = docker.from_env()
-    volumes_to_remove = [
-        'yellow-dev_mariadb',
-        'yellow-dev_mariadb_tmp',
-        'yellow-dev_server_logs',
-        'yellow-dev_server_tmp'
-    ]
-    
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from generate_compose import DEPS_CACHE_LABEL, FINGERPRINT_LABEL, get_project_name
+
+# Backoff between attempts to remove a resource that is still in use
+INITIAL_DELAY = 0.5
+MAX_DELAY = 8
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Remove the volumes, networks and dangling images of a compose project')
+    parser.add_argument('--project', default=None,
+                        help='Compose project name (default: $COMPOSE_PROJECT_NAME or the directory name)')
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='Give up after this many seconds (default: 120)')
+    parser.add_argument('--jobs', type=int, default=8,
+                        help='Number of concurrent removals (default: 8)')
+    return parser.parse_args()
+
+def project_filter(project):
+    """Docker API filter matching resources created by compose for the project."""
+    return {'label': f'com.docker.compose.project={project}'}
+
+def is_deps_cache(volume):
+    """Dependency cache volumes carry the label of the project that created them, but outlive it."""
+    return DEPS_CACHE_LABEL in (volume.attrs.get('Labels') or {})
+
+def find_volumes(client, project):
+    """
+    Find the project's volumes: compose-labelled ones, plus unlabelled ones named <project>_*. Returns (volumes to
+    remove, dependency cache volumes to keep).
+    """
+    volumes = {volume.name: volume for volume in client.volumes.list(filters=project_filter(project))}
+    for volume in client.volumes.list(filters={'name': f'{project}_'}):
+        if volume.name.startswith(f'{project}_'):
+            volumes.setdefault(volume.name, volume)
+    kept = [volume for volume in volumes.values() if is_deps_cache(volume)]
+    return [volume for volume in volumes.values() if not is_deps_cache(volume)], kept
+
+def find_containers(client, volumes):
+    """Find the containers, of the project or not, holding one of the volumes."""
+    containers = {}
+    for volume in volumes:
+        for container in client.containers.list(all=True, filters={'volume': volume.name}):
+            containers.setdefault(container.id, container)
+    return list(containers.values())
+
+def is_network_in_use(network):
+    """Whether containers are still attached to the network; says so if they are."""
+    try:
+        network.reload()
+    except docker.errors.NotFound:
+        return False
+    attached = network.attrs.get('Containers') or {}
+    if attached:
+        print(f"- Keeping network {network.name}, still used by {len(attached)} container(s)")
+    return bool(attached)
+
+def remove_with_retry(description, remove, deadline):
+    """Call remove() until it succeeds, the resource is gone, or the deadline passes. Returns True on success."""
+    delay = INITIAL_DELAY
     while True:
-        failed_volumes = []
-        
-        for volume_name in volumes_to_remove:
-            try:
-                volume = client.volumes.get(volume_name)
-                volume.remove(force=True)
-                print(f"✓ Removed volume: {volume_name}")
-            except docker.errors.NotFound:
-                print(f"- Volume not found (already removed): {volume_name}")
-            except docker.errors.APIError as e:
-                print(f"✗ Failed to remove volume {volume_name}: {e}")
-                failed_volumes.append(volume_name)
-        
-        if not failed_volumes:
-            print("\nSuccessfully removed all volumes!")
-            break
-        else:
-            print(f"\nFailed to remove {len(failed_volumes)} volume(s): {', '.join(failed_volumes)}")
-            print("Retrying in 5 seconds...")
-            time.sleep(5)
+        try:
+            remove()
+            print(f"✓ Removed {description}")
+            return True
+        except docker.errors.NotFound:
+            print(f"- Not found (already removed): {description}")
+            return True
+        except docker.errors.APIError as e:
+            if time.time() + delay > deadline:
+                print(f"✗ Failed to remove {description}: {e}")
+                return False
+            print(f"✗ Failed to remove {description}, retrying in {delay}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_DELAY)
+
+def remove_all(executor, tasks, deadline):
+    """Run (description, remove) tasks concurrently. Returns the descriptions that failed."""
+    futures = {executor.submit(remove_with_retry, description, remove, deadline): description
+               for description, remove in tasks}
+    return [futures[future] for future in futures if not future.result()]
+
+def clean(project, timeout=120, jobs=8):
+    """Remove the containers holding the project's volumes, then its volumes, unused networks and dangling images."""
+    client = docker.from_env()
+    deadline = time.time() + timeout
+
+    volumes, kept = find_volumes(client, project)
+    containers = find_containers(client, volumes)
+    networks = client.networks.list(filters=project_filter(project))
+    print(f"Cleaning project {project}: {len(containers)} container(s), {len(volumes)} volume(s), {len(networks)} network(s)")
+    for volume in kept:
+        print(f"- Keeping dependency cache volume {volume.name}")
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        # Containers first: a volume or network cannot be removed while a container uses it
+        failed = remove_all(executor, [
+            (f"container {container.name}", lambda container=container: container.remove(force=True))
+            for container in containers
+        ], deadline)
+
+        # Other containers of the project, e.g. one-off runs, are left alone, and so are the networks they use
+        networks = [network for network in networks if not is_network_in_use(network)]
+
+        failed += remove_all(executor, [
+            (f"volume {volume.name}", lambda volume=volume: volume.remove(force=True))
+            for volume in volumes
+        ] + [
+            (f"network {network.name}", network.remove)
+            for network in networks
+        ] + [
+            # Superseded builds of our fingerprinted images; the build cache itself is kept warm
+            ("dangling images", lambda: client.images.prune(filters={'dangling': True, 'label': FINGERPRINT_LABEL})),
+        ], deadline)
+
+    if failed:
+        print(f"\nFailed to remove {len(failed)} resource(s): {', '.join(failed)}")
+        return False
+
+    print("\nSuccessfully removed all resources!")
+    return True
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        remove_volumes()
+        sys.exit(0 if clean(args.project or get_project_name(), args.timeout, args.jobs) else 1)
     except docker.errors.DockerException as e:
         print(f"Docker error: {e}")
         sys.exit(1)
     except KeyboardInterrupt:
         print("\nOperation cancelled by user")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
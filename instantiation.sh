@@ -1,5 +1,7 @@
 #!/bin/bash
 
+# Keep in sync with get_instance_name() in scripts/generate_compose.py
+
 if [ "$HOLLOW" = "true" ]; then
   MODE="hollow"
 else
@@ -18,4 +20,34 @@ else
   PROTO="https"
 fi
 
-echo "${MODE}.${NETWORK}.${PROTO}"
+INSTANCE="${MODE}.${NETWORK}.${PROTO}"
+
+if [ "$FAST_DB" = "true" ]; then
+  INSTANCE="${INSTANCE}.fastdb"
+fi
+
+if [ "${BENCH:-false}" = "true" ]; then
+  INSTANCE="${INSTANCE}.bench"
+fi
+
+if [ "${PROFILE:-false}" = "true" ]; then
+  INSTANCE="${INSTANCE}.prof"
+fi
+
+if [ "${STACK_INDEX:-0}" != "0" ]; then
+  INSTANCE="${INSTANCE}.stack${STACK_INDEX}"
+fi
+
+# Like parse_settings_profile(): blanks and empty entries are dropped, and every profile counts once
+PROFILES=""
+IFS=',' read -ra NAMES <<< "${SETTINGS_PROFILE//[[:space:]]/}"
+for NAME in "${NAMES[@]}"; do
+  if [ -n "$NAME" ] && [[ "+${PROFILES}+" != *"+${NAME}+"* ]]; then
+    PROFILES="${PROFILES:+${PROFILES}+}${NAME}"
+  fi
+done
+if [ -n "$PROFILES" ]; then
+  INSTANCE="${INSTANCE}.${PROFILES}"
+fi
+
+echo "$INSTANCE"
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Run the enabled Playwright suites (client, admin, stack) of the Playwright container concurrently, sharing one
+worker budget. Instead of retrying every test of a suite, a failed suite reruns only its failed tests
+(npx playwright test --last-failed), and the reruns are merged into the suite's results.json as retries.
+Usage (configured by the environment of the playwright service, see run-tests.sh):
+    python3 /app/run_tests.py [--workers 4] [--reruns 4]
+"""
+
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Suites in the order their exit codes are reported. 'weight' is the share of the worker budget a suite gets while
+# the others are running; 'ready' are the services wait_ready.py waits for before the suite starts.
+SUITES = {
+    'client': {
+        'directory': '/app/yellow-client',
+        'enabled': 'RUN_CLIENT_TESTS',
+        'default': 'true',
+        'args': ['--project=chromium', '--project=Mobile Chrome', '--global-timeout', '2200000', '--timeout', '120000'],
+        'params': 'PLAYWRIGHT_PARAMS',
+        'ready': ['client'],
+        'weight': 2,
+    },
+    'admin': {
+        'directory': '/app/yellow-admin',
+        'enabled': 'RUN_ADMIN_TESTS',
+        'default': 'false',
+        'args': ['--project=chromium'],
+        'ready': ['admin'],
+        'weight': 1,
+    },
+    'stack': {
+        'directory': '/app/stack_tests',
+        'enabled': 'RUN_STACK_TESTS',
+        'default': 'false',
+        'args': [],
+        'ready': ['client', 'admin'],
+        'weight': 1,
+    },
+}
+
+print_lock = threading.Lock()
+# Guards the set of suites still running, which the worker budget is shared between
+running_lock = threading.Lock()
+
+def log(suite, message):
+    with print_lock:
+        print(f"[{suite}] {message}", flush=True)
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Run the enabled Playwright suites concurrently')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('PLAYWRIGHT_WORKERS', 4)),
+                        help='Worker budget shared by all running suites (default: $PLAYWRIGHT_WORKERS or 4)')
+    parser.add_argument('--reruns', type=int, default=int(os.environ.get('PLAYWRIGHT_RERUNS', 4)),
+                        help='How many times the failed tests of a suite are rerun (default: $PLAYWRIGHT_RERUNS or 4)')
+    parser.add_argument('--retries', type=int, default=int(os.environ.get('PLAYWRIGHT_RETRIES', 0)),
+                        help="Playwright's own in-run retries (default: $PLAYWRIGHT_RETRIES or 0)")
+    return parser.parse_args()
+
+def get_ready_targets(names):
+    urls = {
+        'client': os.environ.get('PLAYWRIGHT_CLIENT_URL', 'http://client:3000'),
+        'admin': os.environ.get('PLAYWRIGHT_ADMIN_URL', 'http://admin:4000'),
+    }
+    return [arg for name in names for arg in ['--target', f"{name}={urls[name]}/#health"]]
+
+def get_reporters():
+    # The JSON report (test-results/results.json of each suite) feeds the shard duration history,
+    # the blob report (test-results/blob-report/) is what sharding/shard.py merges across hosts
+    if os.environ.get('CI') == 'true':
+        return '--reporter=github,list,html,blob,json'
+    return '--reporter=list,html,blob,json'
+
+def merge_rerun(report, rerun):
+    """Append the results of a --last-failed rerun to the matching tests of the report, like Playwright retries."""
+    reruns = {}
+
+    def collect(suite):
+        for spec in suite.get('specs', []):
+            for test in spec.get('tests', []):
+                reruns[(spec.get('file'), spec.get('line'), spec.get('title'), test.get('projectName'))] = test
+        for child in suite.get('suites', []):
+            collect(child)
+
+    def merge(suite):
+        for spec in suite.get('specs', []):
+            for test in spec.get('tests', []):
+                rerun_test = reruns.get((spec.get('file'), spec.get('line'), spec.get('title'), test.get('projectName')))
+                if rerun_test is None:
+                    continue
+                offset = len(test['results'])
+                for result in rerun_test.get('results', []):
+                    test['results'].append(dict(result, retry=result.get('retry', 0) + offset))
+                if rerun_test.get('status') in ('expected', 'flaky'):
+                    test['status'] = 'flaky'
+                spec['ok'] = all(test['status'] in ('expected', 'flaky', 'skipped') for test in spec['tests'])
+        for child in suite.get('suites', []):
+            merge(child)
+
+    for suite in rerun.get('suites', []):
+        collect(suite)
+    for suite in report.get('suites', []):
+        merge(suite)
+
+    # Recount the outcomes of the merged report
+    stats = report.setdefault('stats', {})
+    counts = {'expected': 0, 'unexpected': 0, 'flaky': 0, 'skipped': 0}
+
+    def count(suite):
+        for spec in suite.get('specs', []):
+            for test in spec.get('tests', []):
+                counts[test['status']] = counts.get(test['status'], 0) + 1
+        for child in suite.get('suites', []):
+            count(child)
+
+    for suite in report.get('suites', []):
+        count(suite)
+    stats.update(counts)
+    stats['duration'] = stats.get('duration', 0) + rerun.get('stats', {}).get('duration', 0)
+    return report
+
+def strip_shard(params):
+    """Drop --shard from Playwright arguments: a rerun must run all failed tests of the shard, not a slice of them."""
+    stripped = []
+    skip_value = False
+    for param in params:
+        if skip_value:
+            skip_value = False
+        elif param == '--shard':
+            skip_value = True
+        elif not param.startswith('--shard='):
+            stripped.append(param)
+    return stripped
+
+def was_interrupted(report):
+    """
+    Whether a run did not get through all its tests, e.g. cut short by --global-timeout: then tests that never ran
+    are not among the failed ones, and rerunning those cannot show that the suite passes.
+    """
+    if report.get('errors'):
+        return True
+
+    def interrupted(suite):
+        for spec in suite.get('specs', []):
+            for test in spec.get('tests', []):
+                if any(result.get('status') == 'interrupted' for result in test.get('results', [])):
+                    return True
+        return any(interrupted(child) for child in suite.get('suites', []))
+
+    return any(interrupted(suite) for suite in report.get('suites', []))
+
+def get_exit_code(report, exit_code):
+    """The suite's exit code from its merged report: 1 if a test still fails or the first run was interrupted."""
+    if report is None:
+        return exit_code
+    return 1 if report.get('stats', {}).get('unexpected', 0) > 0 or was_interrupted(report) else 0
+
+class SuiteRunner:
+    """Runs one suite and its reruns, with a share of the worker budget that grows as other suites finish."""
+
+    def __init__(self, name, suite, args, running):
+        self.name = name
+        self.suite = suite
+        self.args = args
+        self.running = running
+        self.results_dir = os.path.join(suite['directory'], 'test-results')
+        self.report_path = os.path.join(self.results_dir, 'results.json')
+
+    def get_workers(self):
+        with running_lock:
+            total_weight = sum(SUITES[name]['weight'] for name in self.running)
+        return max(1, self.args.workers * self.suite['weight'] // total_weight)
+
+    def run_playwright(self, extra_args, env):
+        """Run npx playwright test, streaming its output prefixed with the suite name. Returns the exit code."""
+        workers = self.get_workers()
+        command = (['npx', 'playwright', 'test'] + self.suite['args'] + ['--retries', str(self.args.retries),
+                   '--workers', str(workers)] + extra_args + [get_reporters()])
+        log(self.name, f"Running {shlex.join(command)}")
+        # A report left over from an earlier run must not pass for this one's
+        if os.path.exists(self.report_path):
+            os.remove(self.report_path)
+        process = subprocess.Popen(command, cwd=self.suite['directory'], env=env, text=True, errors='replace',
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        for line in process.stdout:
+            log(self.name, line.rstrip())
+        return process.wait()
+
+    def load_report(self):
+        try:
+            with open(self.report_path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log(self.name, f"No JSON report: {e}")
+            return None
+
+    def keep_blob_report(self, blob_dir, attempts_dir, attempt):
+        """Copy the blob report of an attempt aside: Playwright empties test-results/ at the start of every run."""
+        for name in sorted(os.listdir(blob_dir)) if os.path.isdir(blob_dir) else []:
+            if name.endswith('.zip'):
+                shutil.copy(os.path.join(blob_dir, name), os.path.join(attempts_dir, f"attempt-{attempt:02d}-{name}"))
+
+    def merge_blob_reports(self, blob_dir, attempts_dir, env):
+        """
+        Replace the blob report with one merged from the blob reports of all attempts, so a test that passed on a rerun
+        is flaky in the HTML report sharding/shard.py merges, like in results.json. Falls back to the first attempt's.
+        """
+        blobs = sorted(os.listdir(attempts_dir))
+        shutil.rmtree(blob_dir, ignore_errors=True)
+        if len(blobs) > 1:
+            merge = subprocess.run(['npx', 'playwright', 'merge-reports', '--reporter', 'blob', attempts_dir],
+                                   cwd=self.suite['directory'], env=dict(env, PLAYWRIGHT_BLOB_OUTPUT_DIR=blob_dir),
+                                   text=True, errors='replace', capture_output=True)
+            if merge.returncode == 0:
+                return
+            log(self.name, f"Merging the blob reports of the reruns failed, keeping the first run's:\n{merge.stdout}{merge.stderr}")
+            shutil.rmtree(blob_dir, ignore_errors=True)
+        os.makedirs(blob_dir)
+        for blob in blobs:
+            if blob.startswith('attempt-00-'):
+                shutil.move(os.path.join(attempts_dir, blob), os.path.join(blob_dir, blob[len('attempt-00-'):]))
+
+    def run(self):
+        """Wait for the suite's services, run it, rerun its failed tests. Returns the exit code."""
+        started = time.time()
+        try:
+            ready = subprocess.run(['python3', '/app/wait_ready.py'] + get_ready_targets(self.suite['ready']))
+            if ready.returncode != 0:
+                log(self.name, "Services not ready, running the tests anyway")
+
+            env = dict(os.environ,
+                       PLAYWRIGHT_JSON_OUTPUT_FILE=self.report_path,
+                       PLAYWRIGHT_BLOB_OUTPUT_DIR=os.path.join(self.results_dir, 'blob-report'),
+                       PLAYWRIGHT_HTML_OPEN='never')
+            params = shlex.split(os.environ.get(self.suite.get('params', ''), '') or '')
+            exit_code = self.run_playwright(params, env)
+            report = self.load_report()
+
+            blob_dir = os.path.join(self.results_dir, 'blob-report')
+            attempts_dir = None
+            if exit_code != 0 and os.path.isdir(blob_dir):
+                attempts_dir = tempfile.mkdtemp(prefix=f'blob-report-{self.name}-')
+                self.keep_blob_report(blob_dir, attempts_dir, 0)
+
+            # Only a run that got through all its tests knows which ones failed
+            if report is not None and was_interrupted(report):
+                log(self.name, "The run was interrupted, not rerunning failed tests")
+            reruns = 0
+            for rerun in range(1, self.args.reruns + 1):
+                if report is None or was_interrupted(report) or report.get('stats', {}).get('unexpected', 0) == 0:
+                    break
+                log(self.name, f"Rerunning failed tests ({rerun}/{self.args.reruns})...")
+                rerun_env = dict(env, PLAYWRIGHT_HTML_OUTPUT_DIR=os.path.join(
+                    self.suite['directory'], 'playwright-report', f'rerun-{rerun}'))
+                self.run_playwright(strip_shard(params) + ['--last-failed'], rerun_env)
+                reruns = rerun
+                if attempts_dir is not None:
+                    self.keep_blob_report(blob_dir, attempts_dir, rerun)
+                rerun_report = self.load_report()
+                if rerun_report is not None:
+                    report = merge_rerun(report, rerun_report)
+            # After reruns the merged report decides; without, a failure Playwright reported only by its exit code counts too
+            exit_code = get_exit_code(report, exit_code) if reruns else (exit_code or get_exit_code(report, exit_code))
+
+            if report is not None:
+                with open(self.report_path, 'w') as f:
+                    json.dump(report, f, indent=2)
+            if attempts_dir is not None:
+                self.merge_blob_reports(blob_dir, attempts_dir, env)
+                shutil.rmtree(attempts_dir, ignore_errors=True)
+        finally:
+            with running_lock:
+                self.running.discard(self.name)
+
+        status = 'passed' if exit_code == 0 else f'failed with exit code {exit_code}'
+        log(self.name, f"Tests {status} after {time.time() - started:.0f}s")
+        return exit_code
+
+def main():
+    """Main function to run the enabled suites."""
+    args = parse_args()
+
+    enabled = [name for name, suite in SUITES.items() if os.environ.get(suite['enabled'], suite['default']) == 'true']
+    print(f"Running suites: {', '.join(enabled) or 'none'} (worker budget {args.workers}, "
+          f"{args.reruns} reruns of failed tests)", flush=True)
+    running = set(enabled)
+    runners = [SuiteRunner(name, SUITES[name], args, running) for name in enabled]
+
+    with ThreadPoolExecutor(max_workers=max(1, len(runners))) as executor:
+        exit_codes = list(executor.map(lambda runner: runner.run(), runners))
+
+    # Like the sequential runner: the exit code of the last failed suite
+    test_exit_code = 0
+    for name, exit_code in zip(enabled, exit_codes):
+        print(f"{name}: {'passed' if exit_code == 0 else f'failed ({exit_code})'}")
+        if exit_code != 0:
+            test_exit_code = exit_code
+    return test_exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
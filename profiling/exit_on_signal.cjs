@@ -0,0 +1,10 @@
+// Preloaded into server, messages and admin by the profiling mode (generate_compose.py --profile).
+// --cpu-prof and --heap-prof write their profiles only when the process exits normally, and a process that has no
+// handler for the stop signal is killed by it without writing anything. Turn SIGINT and SIGTERM into a normal exit,
+// after the application's own (synchronous) handlers have run.
+for (const signal of ['SIGINT', 'SIGTERM']) {
+	process.on(signal, () => {
+		console.log(`[profiling] ${signal} received, exiting to write the profiles`);
+		setImmediate(() => process.exit(0));
+	});
+}
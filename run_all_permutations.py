@@ -3,15 +3,32 @@
 Run ci-run.sh in all 8 possible permutations of hollow, host-network, and http flags.
 Clean between runs using clean.py.
 Stop if any run fails.
+
+Only the hollow/full axis changes what gets built. The generator names every image
+by a fingerprint of its build inputs, so each distinct image is built once and
+reused by every other permutation that shares it. ci-run.sh is then told not to build.
+FAST_DB, BENCH, PROFILE, BENCH_SERVICE, SETTINGS_PROFILE and STACK_INDEX select the instances
+like they do for ci-run.sh, which gets the same environment.
 """
 
+import os
 import subprocess
 import sys
 import time
 from itertools import product
 
-def run_command(cmd, description=None):
-    """Run a command and return True if successful, False otherwise."""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+import build_images
+from generate_compose import get_instance_name, get_stack_project_name, parse_settings_profile
+
+def format_duration(duration):
+    """Format seconds as 'Xm Y.Ys'."""
+    minutes = int(duration // 60)
+    seconds = duration % 60
+    return f"{minutes}m {seconds:.1f}s"
+
+def run_command(cmd, description=None, env=None):
+    """Run a command and return (success, duration in seconds)."""
     if description:
         print(f"\n{'='*80}")
         print(f"[PERMUTATION] {description}")
@@ -19,21 +36,29 @@ def run_command(cmd, description=None):
         print(f"{'='*80}\n")
     
     start_time = time.time()
-    result = subprocess.run(cmd, capture_output=False)
+    result = subprocess.run(cmd, capture_output=False, env=env)
     end_time = time.time()
     
     duration = end_time - start_time
-    minutes = int(duration // 60)
-    seconds = duration % 60
     
     if result.returncode == 0:
         if description:
-            print(f"\n[PERMUTATION] ✅ SUCCESS - {description} (took {minutes}m {seconds:.1f}s)")
-        return True
+            print(f"\n[PERMUTATION] ✅ SUCCESS - {description} (took {format_duration(duration)})")
+        return True, duration
     else:
-        print(f"\n[PERMUTATION] ❌ FAILED - {description} (took {minutes}m {seconds:.1f}s)")
+        print(f"\n[PERMUTATION] ❌ FAILED - {description} (took {format_duration(duration)})")
         print(f"[PERMUTATION] Exit code: {result.returncode}")
-        return False
+        return False, duration
+
+def prepare_images(compose_file):
+    """
+    Build the images of compose_file whose fingerprinted image is not present yet.
+
+    Returns (success, seconds spent, built services, reused services).
+    """
+    start_time = time.time()
+    success, built, reused = build_images.build_missing(compose_file, jobs=int(os.environ.get('BUILD_JOBS', '4')))
+    return success, time.time() - start_time, built, reused
 
 def main():
     """Run all permutations of ci-run.sh."""
@@ -49,25 +74,64 @@ def main():
     
     successful_runs = 0
     failed_runs = 0
+    timings = []
     
     overall_start = time.time()
+
+    # Build args and the server-init chown use them; ci-run.sh, which reuses these images, exports the same ids
+    os.environ['USER_ID'] = str(os.getuid())
+    os.environ['GROUP_ID'] = str(os.getgid())
+
+    # ci-run.sh derives its instance from these variables, so the instances generated here must carry them too
+    fast_db = os.environ.get('FAST_DB', 'false')
+    bench = os.environ.get('BENCH', 'false')
+    profile = os.environ.get('PROFILE', 'false')
+    bench_service = os.environ.get('BENCH_SERVICE', 'false')
+    settings_profile = os.environ.get('SETTINGS_PROFILE', '')
+    stack_index = int(os.environ.get('STACK_INDEX', '0'))
+    if stack_index:
+        # Like ci-run.sh; clean.py follows the project through this variable as well
+        os.environ.setdefault('COMPOSE_PROJECT_NAME', get_stack_project_name(stack_index))
+
+    # Generate all compose files, settings files and Dockerfiles in one pass
+    generate_cmd = ['scripts/generate_compose.py', '--all', f'--fast-db={fast_db}', f'--bench={bench}',
+                    f'--profile={profile}', f'--bench-service={bench_service}',
+                    f'--settings-profile={settings_profile}', f'--stack-index={stack_index}']
+    if os.environ.get('COMPOSE_PROJECT_NAME'):
+        generate_cmd.append(f"--project-name={os.environ['COMPOSE_PROJECT_NAME']}")
+    generate_result, _ = run_command(generate_cmd)
+    if not generate_result:
+        print(f"[PERMUTATION] Generating compose files failed, stopping.")
+        sys.exit(1)
     
     for i, (hollow, host_network, http) in enumerate(permutations, 1):
         # Create description
-        mode = "hollow" if hollow == 'true' else "full"
-        network = "hostnet" if host_network == 'true' else "stack"
-        protocol = "http" if http == 'true' else "https"
-        description = f"{mode}.{network}.{protocol} (permutation {i}/{len(permutations)})"
+        instance_name = get_instance_name(hollow == 'true', host_network == 'true', http == 'true', fast_db == 'true',
+                                          parse_settings_profile(settings_profile), bench == 'true', stack_index,
+                                          profile == 'true')
+        description = f"{instance_name} (permutation {i}/{len(permutations)})"
 
-        clean_result = run_command(['python3', 'clean.py'])
+        clean_result, clean_duration = run_command(['python3', 'clean.py'])
         if not clean_result:
             print(f"[PERMUTATION] Clean failed, stopping.")
             failed_runs += 1
             break
+
+        # Build or reuse the image set for this permutation
+        compose_file = f"generated/docker-compose.{instance_name}.yml"
+        images_ready, images_duration, built, reused = prepare_images(compose_file)
+        if not images_ready:
+            print(f"[PERMUTATION] Preparing images failed, stopping.")
+            failed_runs += 1
+            break
         
-        # Run ci-run.sh with the current permutation
-        cmd = ['./ci-run.sh', hollow, host_network, http, 'true', 'true']
-        success = run_command(cmd, description)
+        # Run ci-run.sh with the current permutation, without regenerating or rebuilding
+        cmd = ['./ci-run.sh', hollow, host_network, http, 'true', 'false', 'false', 'false', 'false', '', 'false']
+        # ci-run.sh records the run in the timing history, together with the phases that ran here
+        env = dict(os.environ, TIMING_KIND='permutation',
+                   TIMING_PHASES=f"clean={clean_duration:.1f} images={images_duration:.1f}")
+        success, run_duration = run_command(cmd, description, env)
+        timings.append((instance_name, images_duration, built, reused, run_duration))
         
         if success:
             successful_runs += 1
@@ -79,16 +143,20 @@ def main():
     # Final summary
     overall_end = time.time()
     total_duration = overall_end - overall_start
-    total_minutes = int(total_duration // 60)
-    total_seconds = total_duration % 60
+    total_build = sum(images_duration for _, images_duration, built, _, _ in timings if built)
+    total_reused = sum(len(reused) for _, _, _, reused, _ in timings)
     
     print(f"\n{'='*80}")
     print(f"[PERMUTATION] FINAL SUMMARY")
     print(f"{'='*80}")
+    for instance_name, images_duration, built, reused, run_duration in timings:
+        images = f"built {len(built)}, reused {len(reused)} in {format_duration(images_duration)}"
+        print(f"[PERMUTATION] {instance_name:<20} images: {images:<40} run: {format_duration(run_duration)}")
     print(f"[PERMUTATION] Total permutations attempted: {successful_runs + failed_runs}/{len(permutations)}")
     print(f"[PERMUTATION] Successful: {successful_runs}")
     print(f"[PERMUTATION] Failed: {failed_runs}")
-    print(f"[PERMUTATION] Total time: {total_minutes}m {total_seconds:.1f}s")
+    print(f"[PERMUTATION] Images built: {sum(len(built) for _, _, built, _, _ in timings)} ({format_duration(total_build)}), reused: {total_reused}")
+    print(f"[PERMUTATION] Total time: {format_duration(total_duration)}")
     
     if failed_runs > 0:
         print(f"[PERMUTATION] ❌ CI runs failed")
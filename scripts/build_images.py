@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Pre-flight image builder for generated docker-compose files.
+Builds only the services whose fingerprinted image (see apply_image_fingerprints in
+generate_compose.py) is not already present locally. Independent images are built
+concurrently; an image whose Dockerfile starts FROM another service's image waits
+for that one. Dependency cache volumes (see apply_deps_cache in generate_compose.py) beyond the
+--deps-cache-keep most recently used ones are removed first.
+Usage:
+    python3 build_images.py generated/docker-compose.full.stack.http.yml [--force] [--jobs N] [--deps-cache-keep N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import docker
+import yaml
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from generate_compose import (DEPS_CACHE_LABEL, FINGERPRINT_LABEL, get_project_root, load_deps_cache_uses,
+                              save_deps_cache_uses)
+
+# Serializes the prefixed build output of concurrent builds
+print_lock = threading.Lock()
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Build the images of a generated compose file that are not built yet')
+    parser.add_argument('compose_file', help='Generated docker-compose file')
+    parser.add_argument('--force', action='store_true',
+                        help='Build all images, even those whose fingerprint is already present')
+    parser.add_argument('--jobs', type=int, default=int(os.environ.get('BUILD_JOBS', '4')),
+                        help='Maximum number of concurrent image builds (default: $BUILD_JOBS or 4)')
+    parser.add_argument('--deps-cache-keep', type=int, default=int(os.environ.get('DEPS_CACHE_KEEP', '3')),
+                        help='Number of dependency cache volumes to keep (default: $DEPS_CACHE_KEEP or 3)')
+    return parser.parse_args()
+
+def load_build_plan(compose_file):
+    """Return {service: {'image', 'fingerprint', 'build'}} for every service of the compose file that is built locally."""
+    with open(compose_file, 'r') as f:
+        compose_data = yaml.safe_load(f)
+
+    plan = {}
+    for service_name, service_config in compose_data.get('services', {}).items():
+        if 'build' not in service_config:
+            continue
+        plan[service_name] = {
+            'image': service_config.get('image'),
+            'fingerprint': service_config['build'].get('labels', {}).get(FINGERPRINT_LABEL),
+            'build': service_config['build'],
+        }
+    return plan
+
+def get_base_images(build):
+    """Return the images named in the FROM instructions of a service's Dockerfile."""
+    context = os.path.join(get_project_root(), build.get('context', '.'))
+    dockerfile_path = os.path.join(context, build.get('dockerfile', 'Dockerfile'))
+    if not os.path.exists(dockerfile_path):
+        return []
+
+    base_images = []
+    with open(dockerfile_path, 'r') as f:
+        for line in f:
+            words = line.split()
+            if len(words) >= 2 and words[0].upper() == 'FROM':
+                base_images.extend(word for word in words[1:] if not word.startswith('--'))
+    return base_images
+
+def get_build_dependencies(plan):
+    """Return {service: set of services whose image it is built FROM}."""
+    image_names = {}
+    for service_name, service in plan.items():
+        if service['image']:
+            image_names[service['image']] = service_name
+            image_names[service['image'].split(':')[0]] = service_name
+
+    dependencies = {}
+    for service_name, service in plan.items():
+        dependencies[service_name] = {
+            image_names[base] for base in get_base_images(service['build'])
+            if base in image_names and image_names[base] != service_name
+        }
+    return dependencies
+
+def image_is_current(client, image, fingerprint):
+    """Check whether image exists locally and carries the expected fingerprint label."""
+    if not image or not fingerprint:
+        return False
+    try:
+        return client.images.get(image).labels.get(FINGERPRINT_LABEL) == fingerprint
+    except docker.errors.ImageNotFound:
+        return False
+
+def build_service(compose_file, service_name):
+    """Build one service with docker compose, prefixing its output. Returns (success, duration)."""
+    cmd = ['docker', 'compose', '--project-directory', '.', '-f', compose_file, '--profile', 'test', '--profile', 'bench',
+           '--progress', 'plain', 'build', service_name]
+    with print_lock:
+        print(f"[BUILD] Running: {' '.join(cmd)}", flush=True)
+
+    start_time = time.time()
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1) as proc:
+        for line in proc.stdout:
+            with print_lock:
+                print(f"[BUILD {service_name}] {line}", end='', flush=True)
+        proc.wait()
+    duration = time.time() - start_time
+
+    with print_lock:
+        status = 'done' if proc.returncode == 0 else f'FAILED (exit code {proc.returncode})'
+        print(f"[BUILD] {service_name}: {status} in {duration:.1f}s", flush=True)
+    return proc.returncode == 0, duration
+
+def build_services(compose_file, services, dependencies, jobs):
+    """
+    Build services concurrently, at most jobs at a time, never starting a build before
+    the builds it depends on have succeeded.
+
+    Returns {service: (success, duration)}; services skipped because a dependency failed are absent.
+    """
+    results = {}
+    pending = set(services)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        while pending or running:
+            for service_name in sorted(pending):
+                waiting_for = dependencies.get(service_name, set()) & (pending | set(running.values()))
+                failed = [dep for dep in dependencies.get(service_name, set()) if dep in results and not results[dep][0]]
+                if failed:
+                    print(f"[BUILD] {service_name}: skipped, dependency {', '.join(failed)} failed")
+                    pending.discard(service_name)
+                elif not waiting_for:
+                    pending.discard(service_name)
+                    running[executor.submit(build_service, compose_file, service_name)] = service_name
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    return results
+
+def build_missing(compose_file, force=False, jobs=4):
+    """
+    Build the services of compose_file whose fingerprinted image is missing.
+
+    Returns (success, built services, reused services).
+    """
+    client = docker.from_env()
+    plan = load_build_plan(compose_file)
+
+    reused = []
+    missing = []
+    for service_name, service in plan.items():
+        if not force and image_is_current(client, service['image'], service['fingerprint']):
+            print(f"[BUILD] {service_name}: {service['image']} is up to date, skipping")
+            reused.append(service_name)
+        else:
+            missing.append(service_name)
+
+    if not missing:
+        return True, missing, reused
+
+    print(f"[BUILD] Building {len(missing)} image(s) with up to {jobs} concurrent builds: {', '.join(missing)}")
+    results = build_services(compose_file, missing, get_build_dependencies(plan), jobs)
+
+    print(f"[BUILD] ===== IMAGE BUILD TIMES =====")
+    for service_name, (success, duration) in sorted(results.items(), key=lambda item: -item[1][1]):
+        print(f"[BUILD] {service_name}: {duration:.1f}s{'' if success else ' (FAILED)'}")
+
+    success = len(results) == len(missing) and all(ok for ok, _ in results.values())
+    return success, missing, reused
+
+def evict_deps_caches(compose_file, keep):
+    """
+    Remove the least recently used dependency cache volumes, keeping the keep most recently used ones and those of
+    compose_file. Volumes still mounted by a container are kept. Returns the names of the removed volumes.
+    """
+    client = docker.from_env()
+    with open(compose_file, 'r') as f:
+        compose_data = yaml.safe_load(f)
+    needed = {volume['name'] for volume in (compose_data.get('volumes') or {}).values()
+              if isinstance(volume, dict) and DEPS_CACHE_LABEL in (volume.get('labels') or {})}
+
+    project_root = get_project_root()
+    uses = load_deps_cache_uses(project_root)
+    volumes = sorted(client.volumes.list(filters={'label': DEPS_CACHE_LABEL}),
+                     key=lambda volume: uses.get(volume.name, 0), reverse=True)
+
+    removed = []
+    for volume in [volume for volume in volumes if volume.name not in needed][max(0, keep - len(needed)):]:
+        try:
+            volume.remove()
+        except docker.errors.APIError as e:
+            print(f"[BUILD] Keeping dependency cache {volume.name}: {e}")
+            continue
+        print(f"[BUILD] Evicted dependency cache {volume.name}")
+        removed.append(volume.name)
+        uses.pop(volume.name, None)
+
+    if removed:
+        save_deps_cache_uses(project_root, uses)
+    return removed
+
+def main():
+    """Main function to build missing images."""
+    args = parse_args()
+
+    evict_deps_caches(args.compose_file, args.deps_cache_keep)
+
+    start_time = time.time()
+    success, built, reused = build_missing(args.compose_file, args.force, args.jobs)
+    duration = time.time() - start_time
+
+    print(f"[BUILD] Built {len(built)}, reused {len(reused)} image(s) in {duration:.1f}s")
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except docker.errors.DockerException as e:
+        print(f"Docker error: {e}")
+        sys.exit(1)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Snapshot and restore an initialized MariaDB volume, so test runs start from a clean,
+already initialized database instead of initializing an empty one.
+Snapshots are keyed by the yellow-server and yellow-server-module-messages commits
+(their schema setup) and the MariaDB image.
+Usage:
+    python3 db_snapshot.py key
+    python3 db_snapshot.py save      # while the stack is up and healthy
+    python3 db_snapshot.py restore   # before 'up'; exits with 3 if there is no snapshot yet
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import docker
+import yaml
+
+from generate_compose import get_project_name, get_project_root, git
+
+# Exit code of 'restore' when no snapshot exists for the current key
+NO_SNAPSHOT_EXIT_CODE = 3
+
+# Helper image used to archive and extract the volume
+HELPER_IMAGE = 'alpine'
+
+# Submodules whose commits determine the initialized schema
+SCHEMA_SUBMODULES = ['yellow-server', 'yellow-server-module-messages']
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Snapshot and restore the initialized MariaDB volume')
+    parser.add_argument('command', choices=['key', 'save', 'restore'])
+    parser.add_argument('--project', default=None,
+                        help='Compose project name (default: $COMPOSE_PROJECT_NAME or the directory name)')
+    parser.add_argument('--volume', default='mariadb',
+                        help='Compose volume name of the MariaDB data directory (default: mariadb)')
+    parser.add_argument('--dir', default=os.path.join(get_project_root(), '.cache', 'db-snapshots'),
+                        help='Directory holding the snapshots (default: .cache/db-snapshots)')
+    parser.add_argument('--keep', type=int, default=5,
+                        help='Number of snapshots to keep when saving (default: 5)')
+    return parser.parse_args()
+
+def get_mariadb_image(project_root):
+    """Return the MariaDB image of the compose template."""
+    with open(os.path.join(project_root, 'docker-compose.template.yml'), 'r') as f:
+        compose_data = yaml.safe_load(f)
+    return compose_data['services']['mariadb']['image']
+
+def get_snapshot_key(project_root):
+    """Key snapshots by the commits of the submodules that set up the schema and by the MariaDB image."""
+    digest = hashlib.sha256(get_mariadb_image(project_root).encode())
+    for submodule in SCHEMA_SUBMODULES:
+        head = git(os.path.join(project_root, submodule), 'rev-parse', 'HEAD')
+        digest.update(f"{submodule}:".encode() + (head or b'unknown\n'))
+    return digest.hexdigest()[:16]
+
+def run_helper(client, command, volume_name, snapshot_dir, volume_mode):
+    """Run a shell command in a throwaway container with the volume at /data and the snapshots at /snapshots."""
+    client.containers.run(
+        HELPER_IMAGE, ['sh', '-c', command], remove=True,
+        volumes={
+            volume_name: {'bind': '/data', 'mode': volume_mode},
+            os.path.abspath(snapshot_dir): {'bind': '/snapshots', 'mode': 'rw'},
+        },
+    )
+
+def prune_snapshots(snapshot_dir, keep):
+    """Delete all but the keep most recently written snapshots."""
+    snapshots = sorted(
+        (os.path.join(snapshot_dir, name) for name in os.listdir(snapshot_dir) if name.endswith('.tar.gz')),
+        key=os.path.getmtime, reverse=True)
+    for path in snapshots[keep:]:
+        os.remove(path)
+        print(f"[DB-SNAPSHOT] Removed old snapshot {path}")
+
+def save(client, project, volume_name, snapshot_dir, key, keep):
+    """Archive the volume while the MariaDB container is paused, so the copy is crash-consistent."""
+    containers = client.containers.list(filters={'label': [f'com.docker.compose.project={project}',
+                                                           'com.docker.compose.service=mariadb']})
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    for container in containers:
+        container.pause()
+    try:
+        run_helper(client,
+                   f"tar czf /snapshots/{key}.tar.gz.tmp -C /data . && chown {os.getuid()}:{os.getgid()} /snapshots/{key}.tar.gz.tmp"
+                   f" && mv /snapshots/{key}.tar.gz.tmp /snapshots/{key}.tar.gz",
+                   volume_name, snapshot_dir, 'ro')
+    finally:
+        for container in containers:
+            container.unpause()
+
+    print(f"[DB-SNAPSHOT] Saved {volume_name} to {os.path.join(snapshot_dir, key)}.tar.gz")
+    prune_snapshots(snapshot_dir, keep)
+    return 0
+
+def remove_volume(client, volume_name):
+    """Remove the volume and the containers holding it, like clean.py does."""
+    try:
+        volume = client.volumes.get(volume_name)
+    except docker.errors.NotFound:
+        return
+    for container in client.containers.list(all=True, filters={'volume': volume_name}):
+        print(f"[DB-SNAPSHOT] Removing container {container.name}, which holds {volume_name}")
+        container.remove(force=True)
+    volume.remove(force=True)
+
+def restore(client, project, volume_name, snapshot_dir, key):
+    """
+    Recreate the volume from the snapshot for key. Without a snapshot the volume is removed all the same, so the stack
+    initializes a clean database and that is what gets saved.
+    """
+    remove_volume(client, volume_name)
+
+    snapshot_path = os.path.join(snapshot_dir, f"{key}.tar.gz")
+    if not os.path.exists(snapshot_path):
+        print(f"[DB-SNAPSHOT] No snapshot for key {key}")
+        return NO_SNAPSHOT_EXIT_CODE
+
+    # Label the volume like compose does, so compose adopts it instead of warning about it
+    client.volumes.create(volume_name, labels={
+        'com.docker.compose.project': project,
+        'com.docker.compose.volume': volume_name[len(project) + 1:],
+    })
+    run_helper(client, f"tar xzf /snapshots/{key}.tar.gz -C /data", volume_name, snapshot_dir, 'rw')
+    os.utime(snapshot_path)
+    print(f"[DB-SNAPSHOT] Restored {volume_name} from {snapshot_path}")
+    return 0
+
+def main():
+    """Main function to save or restore a snapshot."""
+    args = parse_args()
+    project = args.project or get_project_name()
+    key = get_snapshot_key(get_project_root())
+
+    if args.command == 'key':
+        print(key)
+        return 0
+
+    client = docker.from_env()
+    volume_name = f"{project}_{args.volume}"
+    if args.command == 'save':
+        return save(client, project, volume_name, args.dir, key, args.keep)
+    return restore(client, project, volume_name, args.dir, key)
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except docker.errors.DockerException as e:
+        print(f"Docker error: {e}")
+        sys.exit(1)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Hot-reload loop for a hollow-mode stack: watch the bind-mounted sources of the stack with inotify and, once the
+changes settle, restart only the services that mount a changed path and wait for their healthchecks. A changed
+lockfile or Dockerfile template in a service's build context rebuilds that service's image instead.
+Usage:
+    python3 dev_watch.py [--compose-file last.yaml] [--debounce 0.5] [--ignore client]
+"""
+
+import argparse
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import yaml
+
+from generate_compose import (LOCKFILES, apply_image_fingerprints, generate_hollow_dockerfile, get_project_root,
+                              write_if_changed)
+
+# Services that run against the stack rather than being part of it; they write into their bind mounts
+DEFAULT_IGNORED = ['playwright', 'bench']
+
+# Files in a build context that change the image itself, besides the lockfiles; Dockerfile_fragment_copy only goes
+# into the full mode's Dockerfile_full
+DOCKERFILES = ['Dockerfile_template']
+
+# Directories that are never watched: dependencies, VCS data, build and test output
+EXCLUDE_PATTERN = r'(^|/)(node_modules|\.git|\.svelte-kit|build|dist|test-results|playwright-report)(/|$)'
+
+# Editor swap and backup files
+IGNORED_SUFFIXES = ('~', '.swp', '.swx', '.tmp')
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Restart the services of a hollow-mode stack whose sources change')
+    parser.add_argument('--compose-file', default='last.yaml',
+                        help='Compose file the stack was started from (default: last.yaml)')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='Seconds without further changes before services are restarted (default: 0.5)')
+    parser.add_argument('--ignore', action='append', default=None, metavar='SERVICE',
+                        help='Service not to restart, e.g. one whose dev server reloads by itself; may be repeated '
+                             f"(default: {', '.join(DEFAULT_IGNORED)})")
+    return parser.parse_args()
+
+def load_compose(compose_file):
+    with open(compose_file, 'r') as f:
+        return yaml.safe_load(f)
+
+def get_bind_mounts(service_config, project_root):
+    """Return the absolute source paths of the writable bind mounts of a service."""
+    sources = []
+    for volume in service_config.get('volumes', []):
+        if isinstance(volume, str):
+            parts = volume.split(':')
+            if not parts[0].startswith(('.', '/')) or len(parts) < 2 or 'ro' in parts[2:]:
+                continue
+            source = parts[0]
+        elif volume.get('type') == 'bind' and not volume.get('read_only'):
+            source = volume['source']
+        else:
+            continue
+        sources.append(os.path.normpath(os.path.join(project_root, source)))
+    return sources
+
+def get_one_shot_services(compose_data):
+    """Return the services that others wait for to complete, like common-init."""
+    one_shot = set()
+    for service_config in compose_data.get('services', {}).values():
+        depends_on = service_config.get('depends_on', {})
+        if isinstance(depends_on, dict):
+            one_shot.update(name for name, dependency in depends_on.items()
+                            if (dependency or {}).get('condition') == 'service_completed_successfully')
+    return one_shot
+
+def build_watch_map(compose_data, project_root, ignored):
+    """Return ({mounted path: services mounting it}, {service: files that need a rebuild when they change})."""
+    watch_map = {}
+    rebuild_triggers = {}
+    for service_name, service_config in compose_data.get('services', {}).items():
+        if service_name in ignored:
+            continue
+        for source in get_bind_mounts(service_config, project_root):
+            watch_map.setdefault(source, set()).add(service_name)
+
+        build = service_config.get('build')
+        if isinstance(build, dict):
+            context = os.path.normpath(os.path.join(project_root, build.get('context', '.')))
+            names = LOCKFILES + DOCKERFILES + [build.get('dockerfile', 'Dockerfile')]
+            rebuild_triggers[service_name] = {os.path.normpath(os.path.join(context, name)) for name in names}
+    return watch_map, rebuild_triggers
+
+def get_affected_services(changed_paths, watch_map, rebuild_triggers):
+    """Return (services to restart, services to rebuild) for a batch of changed paths."""
+    restart, rebuild = set(), set()
+    for path in changed_paths:
+        for source, services in watch_map.items():
+            if path == source or path.startswith(source + os.sep):
+                restart.update(services)
+        rebuild.update(service for service, triggers in rebuild_triggers.items() if path in triggers)
+    return restart - rebuild, rebuild
+
+class Watcher:
+    """Collects the paths inotifywait reports into batches separated by a quiet period."""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.changes = queue.Queue()
+
+    def start(self):
+        command = ['inotifywait', '--quiet', '--monitor', '--recursive', '--format', '%w%f',
+                   '--exclude', EXCLUDE_PATTERN,
+                   '--event', 'close_write', '--event', 'create', '--event', 'delete', '--event', 'move'] + self.paths
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, errors='replace')
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        for line in self.process.stdout:
+            path = line.rstrip('\n')
+            if path and not path.endswith(IGNORED_SUFFIXES):
+                self.changes.put(os.path.normpath(path))
+        # Wakes up the main loop if inotifywait dies
+        self.changes.put(None)
+
+    def next_batch(self, debounce):
+        """Block until a change arrives, then collect changes until none arrived for debounce seconds."""
+        batch = {self.changes.get()}
+        while True:
+            try:
+                batch.add(self.changes.get(timeout=debounce))
+            except queue.Empty:
+                break
+        if None in batch:
+            raise RuntimeError(f"inotifywait exited with code {self.process.wait()}")
+        return batch
+
+class Reloader:
+    """Restarts and rebuilds services of the stack through docker compose."""
+
+    def __init__(self, compose_file, project_root, one_shot):
+        self.compose_file = compose_file
+        self.project_root = project_root
+        self.one_shot = one_shot
+
+    def compose(self, *args):
+        command = ['docker', 'compose', '--project-directory', self.project_root, '-f', self.compose_file, *args]
+        result = subprocess.run(command, cwd=self.project_root)
+        if result.returncode != 0:
+            print(f"[WATCH] Warning: docker compose {' '.join(args)} failed with exit code {result.returncode}")
+        return result.returncode == 0
+
+    def rebuild(self, services):
+        """Regenerate the services' Dockerfiles, re-fingerprint the images, build the missing ones and recreate the services."""
+        compose_data = load_compose(self.compose_file)
+        # The fingerprint covers the generated Dockerfile_hollow, not its Dockerfile_template
+        for service in services:
+            build = compose_data['services'][service].get('build')
+            if isinstance(build, dict) and build.get('dockerfile') == 'Dockerfile_hollow':
+                generate_hollow_dockerfile(self.project_root, build.get('context', '.'))
+        apply_image_fingerprints(compose_data, self.project_root)
+        write_if_changed(self.compose_file, yaml.dump(compose_data, default_flow_style=False))
+        build = subprocess.run([sys.executable, os.path.join(self.project_root, 'scripts', 'build_images.py'),
+                                self.compose_file], cwd=self.project_root)
+        if build.returncode != 0:
+            print(f"[WATCH] Warning: building the images failed, keeping the running containers")
+            return False
+        return self.recreate(services)
+
+    def recreate(self, services):
+        # One-shot services (installing dependencies) run to completion before the services that wait for them
+        for service in sorted(services & self.one_shot):
+            if not self.compose('run', '--rm', '--no-deps', service):
+                return False
+        long_running = sorted(services - self.one_shot)
+        return not long_running or self.compose('up', '--no-deps', '--no-build', '--force-recreate', '--wait', *long_running)
+
+    def restart(self, services):
+        services = sorted(services)
+        return self.compose('restart', *services) and self.compose('up', '--no-deps', '--no-build', '--wait', *services)
+
+def main():
+    """Main function to watch the stack's sources."""
+    args = parse_args()
+    project_root = get_project_root()
+    compose_file = os.path.abspath(args.compose_file)
+    ignored = set(args.ignore if args.ignore is not None else DEFAULT_IGNORED)
+
+    if shutil.which('inotifywait') is None:
+        print("Error: inotifywait not found, install inotify-tools")
+        return 1
+
+    compose_data = load_compose(compose_file)
+    services = compose_data.get('services', {})
+    if not any(str((service_config.get('environment') or {}).get('HOLLOW')) == 'true'
+               for service_config in services.values() if isinstance(service_config.get('environment'), dict)):
+        print(f"Error: {args.compose_file} is not a hollow-mode compose file, its services have no bind-mounted sources")
+        return 1
+
+    watch_map, rebuild_triggers = build_watch_map(compose_data, project_root, ignored)
+    for source, mounting in sorted(watch_map.items()):
+        print(f"[WATCH] {os.path.relpath(source, project_root)} -> {', '.join(sorted(mounting))}")
+
+    watcher = Watcher(sorted(source for source in watch_map if os.path.exists(source)))
+    watcher.start()
+    reloader = Reloader(compose_file, project_root, get_one_shot_services(compose_data))
+    print(f"[WATCH] Watching {len(watcher.paths)} paths, press Ctrl-C to stop")
+
+    try:
+        while True:
+            changed = watcher.next_batch(args.debounce)
+            restart, rebuild = get_affected_services(changed, watch_map, rebuild_triggers)
+            # Sources of one-shot services matter only through their lockfiles, which rebuild them
+            restart -= reloader.one_shot
+            if not restart and not rebuild:
+                continue
+
+            started = time.time()
+            shown = sorted(os.path.relpath(path, project_root) for path in changed)
+            print(f"[WATCH] Changed: {', '.join(shown[:5])}{f' and {len(shown) - 5} more' if len(shown) > 5 else ''}")
+            ok = True
+            if rebuild:
+                print(f"[WATCH] Rebuilding {', '.join(sorted(rebuild))}...")
+                ok = reloader.rebuild(rebuild)
+            if restart and ok:
+                print(f"[WATCH] Restarting {', '.join(sorted(restart))}...")
+                ok = reloader.restart(restart)
+            print(f"[WATCH] {'Ready' if ok else 'Failed'} after {time.time() - started:.1f}s")
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        watcher.process.terminate()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,16 +3,59 @@
 Script to generate customized docker-compose files and Dockerfiles.
 Usage:
     python3 generate_compose.py --hollow=true|false --host-network=true|false --http=true|false
+    python3 generate_compose.py --all
+    python3 generate_compose.py --stack-index=2 ...
+Options such as --fast-db, --bench, --profile, --bench-service, --settings-profile and --stack-index apply to every instance generated with --all.
 """
 
 import argparse
 import copy
+import hashlib
 import json
 import os
+import re
+import subprocess
 import sys
+import time
 import yaml
+from itertools import product
 from pathlib import Path
 
+# Image label carrying the build fingerprint; see apply_image_fingerprints()
+FINGERPRINT_LABEL = 'org.libersoft.yellow-dev.fingerprint'
+
+# Lockfiles that are part of a service's fingerprint when present in its build context
+LOCKFILES = ['bun.lock', 'bun.lockb', 'package-lock.json', 'package.json']
+
+# Label of the dependency cache volumes, carrying the hash of the lockfiles they hold the node_modules of
+DEPS_CACHE_LABEL = 'org.libersoft.yellow-dev.deps-key'
+
+# Last use of every dependency cache volume, for the LRU eviction in build_images.py
+DEPS_CACHE_USES = os.path.join('.cache', 'deps-cache.json')
+
+# JSON merge-patch overlays ({"server": ..., "messages": ..., "client": {env var: value}}), see load_settings_profiles()
+SETTINGS_PROFILES_DIR = 'settings-profiles'
+
+# Ports a stack listens on (host network) or publishes (stack network). Stack index N shifts all of them by
+# N * STACK_PORT_STRIDE; no two ports of different stacks collide as long as the index stays below MAX_STACKS.
+STACK_PORTS = {'server_http': 8084, 'server_https': 8085, 'messages': 25001, 'client': 3000, 'admin': 4000,
+               'mariadb': 3306}
+STACK_PORT_STRIDE = 10
+MAX_STACKS = 100
+
+# --bench: services that get cores of their own, in the order cores are handed out (see plan_bench_resources()),
+# and the share of the usable RAM of every group
+BENCH_CPU_GROUPS = [('mariadb',), ('server',), ('messages',), ('client', 'admin'), ('playwright', 'bench')]
+BENCH_MEMORY_SHARES = {'mariadb': 0.25, 'server': 0.15, 'messages': 0.1, 'client': 0.1, 'admin': 0.05,
+                       'playwright': 0.35, 'bench': 0.05}
+# RAM a Playwright worker (one browser) needs, to size the worker count
+BENCH_MB_PER_WORKER = 1024
+
+# --profile: services whose processes write CPU (and, under Node, heap) profiles into ci-artifacts/profiles/<service>
+PROFILED_SERVICES = ['server', 'messages', 'admin']
+# Seconds a profiled service gets to write its profiles after the stop signal
+PROFILE_STOP_GRACE_PERIOD = 30
+
 def parse_args():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description='Generate customized docker-compose file')
@@ -22,6 +65,25 @@ def parse_args():
                         help='Use host network mode (default: false)')
     parser.add_argument('--http', type=str, choices=['true', 'false'], default='false',
                         help='Use HTTP protocol (default: false)')
+    parser.add_argument('--all', '--matrix', dest='all', action='store_true',
+                        help='Generate all hollow x host-network x http instances in one pass')
+    parser.add_argument('--fast-db', type=str, choices=['true', 'false'], default='false',
+                        help='Run MariaDB on tmpfs with durability turned off, for tests only (default: false)')
+    parser.add_argument('--bench', type=str, choices=['true', 'false'], default='false',
+                        help='Pin every service to its own cores with CPU and memory limits, for comparable timings (default: false)')
+    parser.add_argument('--profile', type=str, choices=['true', 'false'], default='false',
+                        help='Write CPU profiles of server, messages and admin into ci-artifacts/profiles (default: false)')
+    parser.add_argument('--bench-service', type=str, choices=['true', 'false'], default='false',
+                        help='Add the WebSocket load generator as the bench service (default: false)')
+    parser.add_argument('--stack-index', type=int, choices=range(MAX_STACKS), default=0, metavar=f'0-{MAX_STACKS - 1}',
+                        help='Run beside other stacks on this host: shifts the ports by index * '
+                             f'{STACK_PORT_STRIDE} and names the project <directory>-<index> (default: 0, the plain stack)')
+    parser.add_argument('--project-name', default=None,
+                        help='Compose project name written into the compose file, which namespaces containers, '
+                             'volumes and networks (default: <directory>-<index> for --stack-index > 0)')
+    parser.add_argument('--settings-profile', default='',
+                        help=f'Comma-separated settings profiles from {SETTINGS_PROFILES_DIR}/, applied in order '
+                             '(e.g. perf or ci,debug; default: the settings templates as they are)')
     return parser.parse_args()
 
 def get_project_root():
@@ -29,58 +91,153 @@ def get_project_root():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     return os.path.dirname(script_dir)
 
+def get_project_name(project_root=None):
+    """Get the compose project name the way docker compose derives it (COMPOSE_PROJECT_NAME or the directory name)."""
+    if os.environ.get('COMPOSE_PROJECT_NAME'):
+        return os.environ['COMPOSE_PROJECT_NAME']
+    directory = os.path.basename(project_root or get_project_root())
+    return re.sub(r'[^a-z0-9_-]', '', directory.lower())
+
+def get_stack_project_name(stack_index, project_root=None):
+    """Get the default project name of the stack with the given index: the directory name, suffixed with the index."""
+    directory = re.sub(r'[^a-z0-9_-]', '', os.path.basename(project_root or get_project_root()).lower())
+    return f"{directory}-{stack_index}" if stack_index else directory
+
+def get_port(name, stack_index=0):
+    """Return the port of a stack's service (see STACK_PORTS)."""
+    return STACK_PORTS[name] + stack_index * STACK_PORT_STRIDE
+
 def load_docker_compose_template(project_root):
     """Load the docker-compose.template.yml file."""
     template_path = os.path.join(project_root, 'docker-compose.template.yml')
     with open(template_path, 'r') as f:
         return yaml.safe_load(f)
 
+def load_settings_templates(project_root):
+    """Load the server and messages settings templates."""
+    settings_templates = {}
+    for key, filename in [('server', 'template-yellow-server-settings.json'),
+                          ('messages', 'template-yellow-server-module-messages-settings.json')]:
+        with open(os.path.join(project_root, filename), 'r') as f:
+            settings_templates[key] = json.load(f)
+    return settings_templates
+
+def json_merge_patch(target, patch):
+    """Apply a JSON merge patch (RFC 7386): objects are merged recursively, null removes a key, anything else replaces."""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = copy.deepcopy(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = json_merge_patch(result.get(key), value)
+    return result
+
+def parse_settings_profile(value):
+    """Split a comma-separated --settings-profile value into profile names, without empty entries and repeats."""
+    names = []
+    for name in value.split(','):
+        if name.strip() and name.strip() not in names:
+            names.append(name.strip())
+    return names
+
+def load_settings_profiles(project_root, profile_names):
+    """Load the overlays of the given settings profiles, in the order they are applied."""
+    profiles_dir = os.path.join(project_root, SETTINGS_PROFILES_DIR)
+    profiles = []
+    for name in profile_names:
+        path = os.path.join(profiles_dir, f'{name}.json')
+        if not os.path.exists(path):
+            available = sorted(f[:-len('.json')] for f in os.listdir(profiles_dir) if f.endswith('.json'))
+            raise ValueError(f"Unknown settings profile '{name}' (available: {', '.join(available)})")
+        with open(path, 'r') as f:
+            profiles.append(json.load(f))
+    return profiles
+
+def apply_settings_profiles(settings_templates, profiles):
+    """Return the server and messages settings templates with the profiles' overlays applied."""
+    settings = dict(settings_templates)
+    for profile in profiles:
+        for key in ['server', 'messages']:
+            if key in profile:
+                settings[key] = json_merge_patch(settings[key], profile[key])
+    return settings
+
+def apply_client_profiles(compose_data, profiles):
+    """Apply the profiles' client overlays to the client's environment (VITE_* variables)."""
+    profiles = list(profiles)
+    client = compose_data.get('services', {}).get('client')
+    if client is None or not profiles:
+        return compose_data
+
+    environment = client.get('environment', {})
+    if isinstance(environment, list):
+        environment = dict(item.split('=', 1) for item in environment if isinstance(item, str) and '=' in item)
+    for profile in profiles:
+        environment = json_merge_patch(environment, profile.get('client', {}))
+    client['environment'] = {key: str(value) for key, value in environment.items()}
+    return compose_data
+
+def write_if_changed(path, content):
+    """Write content to path unless the file already has exactly that content, so unchanged files keep their mtime."""
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            if f.read() == content:
+                print(f"Unchanged {path}")
+                return False
+
+    with open(path, 'w') as f:
+        f.write(content)
+    print(f"Generated {path}")
+    return True
+
 def prepare_output_dir(project_root):
     """Create the generated directory if it doesn't exist."""
     output_dir = os.path.join(project_root, 'generated')
     os.makedirs(output_dir, exist_ok=True)
     return output_dir
 
-def get_server_url(host_network, http_mode):
+# The URLs below point at localhost when host_network is set, and only then use the ports shifted by the stack index:
+# inside the stack network, services listen on their usual ports.
+
+def get_server_url(host_network, http_mode, stack_index=0):
     """Generate the server URL based on network mode and HTTP/HTTPS mode."""
     ws_protocol = 'ws' if http_mode else 'wss'
     server_host = 'localhost' if host_network else 'server'
-    server_port = '8084' if http_mode else '8085'
+    server_port = get_port('server_http' if http_mode else 'server_https', stack_index if host_network else 0)
     return f'{ws_protocol}://{server_host}:{server_port}'
 
-def get_client_url(host_network, http_mode):
+def get_client_url(host_network, http_mode, stack_index=0):
     """Generate the client URL based on network mode and HTTP/HTTPS mode."""
     http_protocol = 'http' if http_mode else 'https'
     client_host = 'localhost' if host_network else 'client'
-    return f'{http_protocol}://{client_host}:3000'
+    return f"{http_protocol}://{client_host}:{get_port('client', stack_index if host_network else 0)}"
 
-def get_admin_url(host_network, http_mode):
+def get_admin_url(host_network, http_mode, stack_index=0):
     """Generate the admin URL based on network mode and HTTP/HTTPS mode."""
     http_protocol = 'http' if http_mode else 'https'
     admin_host = 'localhost' if host_network else 'admin'
-    return f'{http_protocol}://{admin_host}:4000'
-
-def get_instance_name(project_root, hollow_mode, host_network, http=False):
-    """Generate instance name using instantiation.sh script."""
-    import subprocess
-
-    env = os.environ.copy()
-    env['HOLLOW'] = 'true' if hollow_mode else 'false'
-    env['HOST_NETWORK'] = 'true' if host_network else 'false'
-    env['HTTP'] = 'true' if http else 'false'
-
-    instantiation_script = os.path.join(project_root, 'instantiation.sh')
-    result = subprocess.run(['bash', instantiation_script],
-                          capture_output=True, text=True, env=env)
-
-    if result.returncode == 0:
-        return result.stdout.strip()
-    else:
-        # Fallback to manual generation if script fails
-        mode = "hollow" if hollow_mode else "full"
-        network = "hostnet" if host_network else "stack"
-        proto = "http" if http else "https"
-        return f"{mode}.{network}.{proto}"
+    return f"{http_protocol}://{admin_host}:{get_port('admin', stack_index if host_network else 0)}"
+
+def get_instance_name(hollow_mode, host_network, http=False, fast_db=False, settings_profiles=(), bench=False,
+                      stack_index=0, profile=False):
+    """Generate instance name, mirroring instantiation.sh (keep the two in sync)."""
+    mode = "hollow" if hollow_mode else "full"
+    network = "hostnet" if host_network else "stack"
+    proto = "http" if http else "https"
+    instance_name = f"{mode}.{network}.{proto}"
+    if fast_db:
+        instance_name += ".fastdb"
+    if bench:
+        instance_name += ".bench"
+    if profile:
+        instance_name += ".prof"
+    if stack_index:
+        instance_name += f".stack{stack_index}"
+    if settings_profiles:
+        instance_name += "." + "+".join(settings_profiles)
+    return instance_name
 
 def generate_hollow_dockerfile(project_root, context_path):
     """Generate a Dockerfile_hollow from Dockerfile_template."""
@@ -95,10 +252,7 @@ def generate_hollow_dockerfile(project_root, context_path):
 
     # Generate Dockerfile_hollow
     hollow_path = os.path.join(project_root, context_path, 'Dockerfile_hollow')
-    with open(hollow_path, 'w') as dst:
-        dst.write(content)
-
-    print(f"Generated {hollow_path}")
+    write_if_changed(hollow_path, content)
     return True
 
 def generate_full_dockerfile(project_root, context_path):
@@ -138,14 +292,16 @@ def generate_full_dockerfile(project_root, context_path):
 
     # Write to Dockerfile_full
     full_path = os.path.join(project_root, context_path, 'Dockerfile_full')
-    with open(full_path, 'w') as f:
-        f.write('\n'.join(lines))
-
-    print(f"Generated {full_path}")
+    write_if_changed(full_path, '\n'.join(lines))
     return True
 
-def process_service_dockerfiles(compose_data, project_root, hollow):
-    """Generate appropriate Dockerfiles for all services."""
+def process_service_dockerfiles(compose_data, project_root, hollow, generated_dockerfiles=None):
+    """
+    Generate appropriate Dockerfiles for all services.
+
+    generated_dockerfiles, if given, is a set of (context, mode) pairs already generated in this run;
+    those are not generated again.
+    """
     print(f"Generating Dockerfiles for all services...")
 
     for service_name, service_config in compose_data.get('services', {}).items():
@@ -157,10 +313,14 @@ def process_service_dockerfiles(compose_data, project_root, hollow):
         if 'build' in service_config:
             context = service_config['build'] if isinstance(service_config['build'], str) else service_config['build'].get('context', '.')
 
-            if hollow:
-                generate_hollow_dockerfile(project_root, context)
-            else:
-                generate_full_dockerfile(project_root, context)
+            mode = 'hollow' if hollow else 'full'
+            if generated_dockerfiles is None or (context, mode) not in generated_dockerfiles:
+                if hollow:
+                    generate_hollow_dockerfile(project_root, context)
+                else:
+                    generate_full_dockerfile(project_root, context)
+                if generated_dockerfiles is not None:
+                    generated_dockerfiles.add((context, mode))
 
             # Update the build configuration to use the appropriate Dockerfile
             if isinstance(service_config['build'], str):
@@ -171,14 +331,22 @@ def process_service_dockerfiles(compose_data, project_root, hollow):
             else:
                 service_config['build']['dockerfile'] = f"Dockerfile_{'hollow' if hollow else 'full'}"
 
-def apply_host_network(compose_data, project_root, output_dir, instance_name, http_mode=False):
+def write_settings(output_dir, instance_name, server_settings, messages_settings):
+    """Write the server and messages settings files for an instance."""
+    server_settings_modified_path = os.path.join(output_dir, f'yellow-server-settings-{instance_name}.json')
+    write_if_changed(server_settings_modified_path, json.dumps(server_settings, indent=2))
+
+    messages_settings_modified_path = os.path.join(output_dir, f'yellow-server-module-messages-settings-{instance_name}.json')
+    write_if_changed(messages_settings_modified_path, json.dumps(messages_settings, indent=2))
+
+    return server_settings_modified_path, messages_settings_modified_path
+
+def apply_host_network(compose_data, settings_templates, output_dir, instance_name, http_mode=False, stack_index=0):
     """Apply host network mode to the compose file."""
     print("Applying host network mode...")
 
     # Create modified settings files for host network
-    server_settings_path = os.path.join(project_root, 'template-yellow-server-settings.json')
-    with open(server_settings_path, 'r') as f:
-        server_settings = json.load(f)
+    server_settings = copy.deepcopy(settings_templates['server'])
 
     # Set database host to localhost
     server_settings['database']['host'] = 'localhost'
@@ -186,20 +354,23 @@ def apply_host_network(compose_data, project_root, output_dir, instance_name, ht
     # Configure HTTPS settings
     server_settings['web']['https_disabled'] = http_mode
 
-    server_settings_modified_path = os.path.join(output_dir, f'yellow-server-settings-{instance_name}.json')
-    with open(server_settings_modified_path, 'w') as f:
-        json.dump(server_settings, f, indent=2)
-
     # Messages settings
-    messages_settings_path = os.path.join(project_root, 'template-yellow-server-module-messages-settings.json')
-    with open(messages_settings_path, 'r') as f:
-        messages_settings = json.load(f)
+    messages_settings = copy.deepcopy(settings_templates['messages'])
 
     # Set database host to localhost
     messages_settings['database']['host'] = 'localhost'
-    messages_settings_modified_path = os.path.join(output_dir, f'yellow-server-module-messages-settings-{instance_name}.json')
-    with open(messages_settings_modified_path, 'w') as f:
-        json.dump(messages_settings, f, indent=2)
+
+    # Every stack on the host listens on its own ports
+    if stack_index:
+        server_settings['web']['http_port'] = get_port('server_http', stack_index)
+        server_settings['web']['https_port'] = get_port('server_https', stack_index)
+        server_settings['database']['port'] = get_port('mariadb', stack_index)
+        messages_settings['web']['http_port'] = get_port('messages', stack_index)
+        messages_settings['database']['port'] = get_port('mariadb', stack_index)
+
+    server_settings_modified_path, messages_settings_modified_path = write_settings(
+        output_dir, instance_name, server_settings, messages_settings
+    )
 
     # Remove networks section
     if 'networks' in compose_data:
@@ -226,15 +397,15 @@ def apply_host_network(compose_data, project_root, output_dir, instance_name, ht
         if service_name in ['server', 'messages']:
             service_config['environment']['MARIA_HOST'] = 'localhost'
             service_config['environment']['MESSAGES_HOST'] = 'localhost'
-            service_config['environment']['SERVER_URL'] = get_server_url(True, http_mode)
+            service_config['environment']['SERVER_URL'] = get_server_url(True, http_mode, stack_index)
 
         # Set SERVER_URL for admin service
         if service_name == 'admin':
-            service_config['environment']['SERVER_URL'] = get_server_url(True, http_mode)
+            service_config['environment']['SERVER_URL'] = get_server_url(True, http_mode, stack_index)
 
         # Set CLIENT_URL for client service
         if service_name == 'client':
-            service_config['environment']['CLIENT_URL'] = get_client_url(True, http_mode)
+            service_config['environment']['CLIENT_URL'] = get_client_url(True, http_mode, stack_index)
 
     # Update settings paths in volumes
     for service_name in ['server', 'messages']:
@@ -251,32 +422,20 @@ def apply_host_network(compose_data, project_root, output_dir, instance_name, ht
 
     return server_settings_modified_path, messages_settings_modified_path
 
-def generate_stack_settings(project_root, output_dir, instance_name, http_mode=False):
+def generate_stack_settings(settings_templates, output_dir, instance_name, http_mode=False):
     """Generate settings files for stack network mode."""
     # Create server settings file for stack network
-    server_settings_path = os.path.join(project_root, 'template-yellow-server-settings.json')
-    with open(server_settings_path, 'r') as f:
-        server_settings = json.load(f)
+    server_settings = copy.deepcopy(settings_templates['server'])
 
     # Keep default database host (mariadb)
     # Configure HTTPS settings
     server_settings['web']['https_disabled'] = http_mode
 
-    server_settings_modified_path = os.path.join(output_dir, f'yellow-server-settings-{instance_name}.json')
-    with open(server_settings_modified_path, 'w') as f:
-        json.dump(server_settings, f, indent=2)
-
     # Messages settings
-    messages_settings_path = os.path.join(project_root, 'template-yellow-server-module-messages-settings.json')
-    with open(messages_settings_path, 'r') as f:
-        messages_settings = json.load(f)
+    messages_settings = copy.deepcopy(settings_templates['messages'])
 
     # Keep default database host (mariadb)
-    messages_settings_modified_path = os.path.join(output_dir, f'yellow-server-module-messages-settings-{instance_name}.json')
-    with open(messages_settings_modified_path, 'w') as f:
-        json.dump(messages_settings, f, indent=2)
-
-    return server_settings_modified_path, messages_settings_modified_path
+    return write_settings(output_dir, instance_name, server_settings, messages_settings)
 
 def apply_https_certificates(compose_data, http_mode):
     """Add certificate bind-mounts for HTTPS mode."""
@@ -304,13 +463,13 @@ def apply_https_certificates(compose_data, http_mode):
                     service_config['volumes'].append(cert_volume)
                     print(f"Added certificate bind-mount {cert_volume} to service {service_name}")
 
-def apply_stack_network(compose_data, project_root, output_dir, instance_name, http_mode=False):
+def apply_stack_network(compose_data, settings_templates, output_dir, instance_name, http_mode=False, stack_index=0):
     """Apply stack network mode (default) to the compose file."""
     print("Applying stack network mode...")
 
     # Generate settings files for stack network
     server_settings_modified_path, messages_settings_modified_path = generate_stack_settings(
-        project_root, output_dir, instance_name, http_mode
+        settings_templates, output_dir, instance_name, http_mode
     )
 
     # Ensure networks section exists
@@ -343,7 +502,7 @@ def apply_stack_network(compose_data, project_root, output_dir, instance_name, h
         # Set SERVER_URL for admin service
         if service_name == 'admin':
             # for admin service, SERVER_URL is used to fill in the default server for login, so, that's always localhost
-            service_config['environment']['SERVER_URL'] = get_server_url(True, http_mode)
+            service_config['environment']['SERVER_URL'] = get_server_url(True, http_mode, stack_index)
 
         # Set CLIENT_URL for client service
         if service_name == 'client':
@@ -368,6 +527,112 @@ def apply_stack_network(compose_data, project_root, output_dir, instance_name, h
 
     return server_settings_modified_path, messages_settings_modified_path
 
+def apply_stack_ports(compose_data, stack_index, host_network=False):
+    """Move the stack to the ports of its index: the published ports, or with host network the ports it listens on."""
+    print(f"Applying stack index {stack_index}: ports shifted by {stack_index * STACK_PORT_STRIDE}...")
+
+    services = compose_data.get('services', {})
+    usual_ports = set(STACK_PORTS.values())
+    shift = stack_index * STACK_PORT_STRIDE
+
+    if not host_network:
+        # Only the host side moves; inside the stack network the services keep their ports
+        for service_config in services.values():
+            ports = service_config.get('ports', [])
+            for i, mapping in enumerate(ports):
+                host_port, _, container_port = str(mapping).rpartition(':')
+                if host_port and int(container_port) in usual_ports:
+                    ports[i] = f"{int(host_port) + shift}:{container_port}"
+        return compose_data
+
+    # The settings files already carry the server's and messages' ports; their healthchecks probe them from the host
+    healthcheck_ports = {'server': ['server_http'], 'messages': ['messages'], 'admin': ['admin']}
+    for service_name, port_names in healthcheck_ports.items():
+        healthcheck = services.get(service_name, {}).get('healthcheck', {})
+        for port_name in port_names:
+            if 'test' in healthcheck:
+                healthcheck['test'] = healthcheck['test'].replace(
+                    f"localhost:{STACK_PORTS[port_name]}", f"localhost:{get_port(port_name, stack_index)}")
+
+    if 'mariadb' in services:
+        mariadb_port = get_port('mariadb', stack_index)
+        mariadb = services['mariadb']
+        mariadb['command'] = [f'--port={mariadb_port}']
+        mariadb['healthcheck']['test'] = mariadb['healthcheck']['test'].replace(
+            '--protocol=tcp', f'--protocol=tcp --port={mariadb_port}')
+
+    # The client and admin dev servers are told their port through the environment
+    for service_name in ['client', 'admin']:
+        if service_name in services:
+            services[service_name].setdefault('environment', {})['PORT'] = str(get_port(service_name, stack_index))
+
+    return compose_data
+
+def get_host_memory_mb():
+    """Return the total RAM of the host in MiB."""
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+
+def generate_fast_db_config(output_dir, memory_mb=None):
+    """Write a MariaDB config that trades durability for speed. Only for throwaway test databases."""
+    # An eighth of the RAM MariaDB may use (the host's, unless limited), within sane bounds; the tmpfs datadir lives in RAM as well
+    buffer_pool_mb = max(256, min(4096, (memory_mb or get_host_memory_mb()) // 8))
+
+    config = f"""# Generated by scripts/generate_compose.py --fast-db. Test databases only: not crash safe.
+[mysqld]
+skip-log-bin
+sync_binlog = 0
+innodb_doublewrite = 0
+innodb_flush_log_at_trx_commit = 0
+innodb_buffer_pool_size = {buffer_pool_mb}M
+# tmpfs does not support native AIO
+innodb_use_native_aio = 0
+performance_schema = OFF
+"""
+    # The memory limit of --bench sizes the buffer pool differently, so keep that config apart
+    config_path = os.path.join(output_dir, 'mariadb-fast.bench.cnf' if memory_mb else 'mariadb-fast.cnf')
+    write_if_changed(config_path, config)
+    return config_path
+
+def apply_fast_db(compose_data, output_dir, memory_mb=None):
+    """Put the MariaDB datadir and tmpdir on tmpfs and apply the fast test config."""
+    print("Applying fast DB mode: MariaDB on tmpfs, durability off...")
+
+    config_path = generate_fast_db_config(output_dir, memory_mb)
+
+    services = compose_data.get('services', {})
+    mariadb = services['mariadb']
+    mariadb['volumes'] = [
+        volume for volume in mariadb.get('volumes', [])
+        if not (isinstance(volume, str) and volume.split(':')[0] in ['mariadb', 'mariadb_tmp'])
+    ]
+    mariadb['volumes'].append(f'./generated/{os.path.basename(config_path)}:/etc/mysql/conf.d/zz-fast.cnf:ro')
+    mariadb['tmpfs'] = ['/var/lib/mysql', '/mariadb_tmp:mode=1777']
+
+    # An empty tmpfs datadir initializes in seconds, so poll quickly instead of waiting out the disk-sized timings
+    mariadb['healthcheck'].update({
+        'start_interval': '1s',
+        'start_period': '60s',
+        'interval': '5s',
+        'timeout': '5s',
+        'retries': 12,
+    })
+
+    # mariadb-init only prepares the mariadb_tmp volume, which tmpfs replaces
+    if 'mariadb-init' in services:
+        del services['mariadb-init']
+    depends_on = mariadb.get('depends_on')
+    if isinstance(depends_on, list) and 'mariadb-init' in depends_on:
+        depends_on.remove('mariadb-init')
+    elif isinstance(depends_on, dict):
+        depends_on.pop('mariadb-init', None)
+    if not depends_on:
+        mariadb.pop('depends_on', None)
+
+    for volume_name in ['mariadb', 'mariadb_tmp']:
+        compose_data.get('volumes', {}).pop(volume_name, None)
+
+    return compose_data
+
 def apply_hollow_mode(compose_data):
     """Apply hollow mode: keep bind mounts for source code."""
     print("Applying hollow mode: keeping bind mounts...")
@@ -379,6 +644,73 @@ def apply_hollow_mode(compose_data):
 
         service_config['environment']['HOLLOW'] = 'true'
 
+def compute_deps_key(project_root, path):
+    """Hash the lockfiles of a package directory, the key of the node_modules installed from them."""
+    digest = hashlib.sha256()
+    for lockfile in LOCKFILES:
+        lockfile_path = os.path.join(project_root, path, lockfile)
+        if os.path.exists(lockfile_path):
+            digest.update(f"{lockfile}\n".encode())
+            with open(lockfile_path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def load_deps_cache_uses(project_root):
+    """Return {volume name: time of its last use} of the dependency cache volumes."""
+    path = os.path.join(project_root, DEPS_CACHE_USES)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_deps_cache_uses(project_root, uses):
+    path = os.path.join(project_root, DEPS_CACHE_USES)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(uses, f, indent=2, sort_keys=True)
+
+def apply_deps_cache(compose_data, project_root):
+    """
+    Keep the node_modules common-init installs for yellow-server-common in a named volume keyed by the hash of its
+    lockfiles. The volume is shared by all projects, and the install is skipped when it already holds them.
+    """
+    services = compose_data.get('services', {})
+    if 'common-init' not in services:
+        return compose_data
+
+    key = compute_deps_key(project_root, 'yellow-server-common')
+    volume_name = f"yellow-dev-deps-yellow-server-common-{key}"
+    print(f"Using dependency cache volume {volume_name}")
+    compose_data.setdefault('volumes', {})['deps_common'] = {'name': volume_name, 'labels': {DEPS_CACHE_LABEL: key}}
+
+    for service_name, service_config in services.items():
+        if any(isinstance(volume, str) and volume.split(':')[0].rstrip('/') == './yellow-server-common'
+               for volume in service_config.get('volumes', [])):
+            service_config['volumes'].append('deps_common:/app/yellow-server-common/node_modules')
+
+    # A new volume belongs to root; server-init hands it to the user the services run as
+    if 'server-init' in services:
+        server_init = services['server-init']
+        server_init.setdefault('volumes', []).append('deps_common:/deps')
+        server_init['command'][-1] += '; chown ${USER_ID:-1000}:${GROUP_ID:-1000} /deps'
+        services['common-init'].setdefault('depends_on', {})['server-init'] = {'condition': 'service_completed_successfully'}
+
+    # The stamp is the hash of the lockfiles the volume was installed from, written only once the install succeeded,
+    # so an interrupted install or lockfiles changed after generating (scripts/dev_watch.py) still install.
+    # Stacks starting at the same time share the volume: a lock in it lets one install while the others wait and
+    # then find the stamp.
+    stamp = 'node_modules/.deps-key'
+    lockfiles_hash = f"$$(cat {' '.join(LOCKFILES)} 2>/dev/null | sha256sum)"
+    services['common-init']['command'] = ['sh', '-c', (
+        f"cd /app/yellow-server-common; exec 9> node_modules/.deps-lock && flock 9 && "
+        f"if [ \"$$(cat {stamp} 2>/dev/null)\" = \"{lockfiles_hash}\" ]; then echo 'Dependencies up to date, skipping install'; "
+        f"else ~/.bun/bin/bun i --frozen-lockfile && echo \"{lockfiles_hash}\" > {stamp}; fi")]
+
+    uses = load_deps_cache_uses(project_root)
+    uses[volume_name] = time.time()
+    save_deps_cache_uses(project_root, uses)
+    return compose_data
+
 def apply_full_mode(compose_data, host_network=False, http_mode=False):
     """Apply full mode: remove bind mounts for source code and the common-init service."""
     print("Applying full mode: removing bind mounts and common-init service...")
@@ -443,12 +775,122 @@ def apply_full_mode(compose_data, host_network=False, http_mode=False):
     return compose_data
 
 
-def update_client_healthcheck(compose_data, host_network=False, http_mode=False):
+def format_cpuset(cores):
+    """Format core ids as a cpuset string, e.g. [1, 2, 3, 6] -> '1-3,6'."""
+    ranges = []
+    for core in sorted(cores):
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ','.join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+def plan_bench_resources(cores=None, memory_mb=None):
+    """Split the host's cores and RAM between the services for --bench.
+
+    Returns ({service: {'cores': [...], 'memory_mb': n}}, playwright workers). The first core is left to the host
+    (docker, the collectors) on machines with 8 or more cores. Every group of BENCH_CPU_GROUPS but the last gets
+    an eighth of the remaining cores (at least one); the browsers get the rest. With fewer than 5 cores the client
+    and admin share the browsers' cores; with fewer than 4 nothing is pinned, only memory is limited.
+    """
+    cores = sorted(cores if cores is not None else os.sched_getaffinity(0))
+    memory_mb = memory_mb or get_host_memory_mb()
+    if len(cores) >= 8:
+        cores = cores[1:]
+
+    groups = [list(group) for group in BENCH_CPU_GROUPS]
+    if len(cores) < 5:
+        groups[-2:] = [groups[-2] + groups[-1]]
+    assigned = {}
+    if len(cores) >= len(groups):
+        size = max(1, len(cores) // 8)
+        position = 0
+        for group in groups[:-1]:
+            for service in group:
+                assigned[service] = cores[position:position + size]
+            position += size
+        for service in groups[-1]:
+            assigned[service] = cores[position:]
+    else:
+        print(f"Warning: only {len(cores)} cores, not pinning services to cores")
+
+    # A quarter of the RAM stays with the host and the page cache
+    usable_mb = memory_mb * 3 // 4
+    plan = {service: {'cores': assigned.get(service, []), 'memory_mb': max(256, int(usable_mb * share))}
+            for service, share in BENCH_MEMORY_SHARES.items()}
+
+    # One browser per core, as far as memory allows
+    browser_cores = len(plan['playwright']['cores']) or len(cores)
+    workers = max(1, min(browser_cores, plan['playwright']['memory_mb'] // BENCH_MB_PER_WORKER))
+    return plan, workers
+
+def apply_bench_resources(compose_data, plan, workers):
+    """Set cpus, cpuset and mem_limit of every planned service, and the Playwright worker count."""
+    print("Applying bench mode: pinning services to cores with memory limits...")
+
+    services = compose_data.get('services', {})
+    for service_name, resources in plan.items():
+        if service_name not in services:
+            continue
+        service_config = services[service_name]
+        if resources['cores']:
+            service_config['cpuset'] = format_cpuset(resources['cores'])
+            service_config['cpus'] = float(len(resources['cores']))
+        service_config['mem_limit'] = f"{resources['memory_mb']}m"
+        print(f"Service {service_name}: cpuset {service_config.get('cpuset', '-')}, mem_limit {service_config['mem_limit']}")
+
+    if 'playwright' in services:
+        services['playwright']['environment']['PLAYWRIGHT_WORKERS'] = str(workers)
+        print(f"Playwright workers: {workers}")
+
+    return compose_data
+
+def apply_profiling(compose_data, stack_index=0):
+    """
+    Start server, messages and admin with the runtime's profiling flags, writing into a bind-mounted profiles directory.
+    Bun and Node write the profiles only on a normal exit, so profiling/exit_on_signal.cjs is preloaded to exit on
+    SIGINT/SIGTERM; ci-run.sh signals the runtime processes themselves, as the PID 1 of a container may be a shell.
+    """
+    print("Applying profiling: CPU profiles of server, messages and admin...")
+
+    suffix = f"-stack{stack_index}" if stack_index else ''
+    profiles_dir = f"./ci-artifacts/profiles{suffix}"
+    preload = '/profiling/exit_on_signal.cjs'
+    services = compose_data.get('services', {})
+    for service_name in PROFILED_SERVICES:
+        if service_name not in services:
+            continue
+        service_config = services[service_name]
+        environment = service_config.get('environment', {})
+        if isinstance(environment, list):
+            environment = dict(item.split('=', 1) for item in environment if isinstance(item, str) and '=' in item)
+        # BUN_OPTIONS is prepended to the arguments of every bun process, NODE_OPTIONS to those of node (e.g. vite)
+        output_dir = f"/profiles/{service_name}"
+        environment['BUN_OPTIONS'] = f"--preload {preload} --cpu-prof --cpu-prof-dir={output_dir}"
+        environment['NODE_OPTIONS'] = (f"--require {preload} --cpu-prof --cpu-prof-dir={output_dir} "
+                                       f"--heap-prof --heap-prof-dir={output_dir}")
+        service_config['environment'] = environment
+        service_config.setdefault('volumes', []).extend([f'{profiles_dir}:/profiles', f'./profiling:/profiling:ro'])
+        service_config['stop_signal'] = 'SIGINT'
+        service_config['stop_grace_period'] = f'{PROFILE_STOP_GRACE_PERIOD}s'
+        print(f"Service {service_name}: profiles in {profiles_dir[2:]}/{service_name}")
+
+    # Docker creates a missing bind mount source as root; server-init, which everything profiled waits for, hands the
+    # profiles directories to the user the services run as
+    if 'server-init' in services:
+        server_init = services['server-init']
+        server_init.setdefault('volumes', []).append(f'{profiles_dir}:/profiles')
+        server_init['command'][-1] += ('; mkdir -p ' + ' '.join(f'/profiles/{name}' for name in PROFILED_SERVICES) +
+                                       '; chown -R ${USER_ID:-1000}:${GROUP_ID:-1000} /profiles')
+
+    return compose_data
+
+def update_client_healthcheck(compose_data, host_network=False, http_mode=False, stack_index=0):
     """Update the client service healthcheck test to use the CLIENT_URL."""
     print("Updating client healthcheck...")
 
     if 'client' in compose_data.get('services', {}):
-        client_url = get_client_url(host_network, http_mode)
+        client_url = get_client_url(host_network, http_mode, stack_index)
 
         # Update the healthcheck test command
         if 'healthcheck' not in compose_data['services']['client']:
@@ -460,7 +902,7 @@ def update_client_healthcheck(compose_data, host_network=False, http_mode=False)
     return compose_data
 
 
-def add_playwright_container(compose_data, host_network=False, http_mode=False):
+def add_playwright_container(compose_data, host_network=False, http_mode=False, stack_index=0):
     """Add a Playwright container for testing."""
     print("Adding Playwright container for testing...")
 
@@ -469,9 +911,12 @@ def add_playwright_container(compose_data, host_network=False, http_mode=False):
     os.makedirs(playwright_dir, exist_ok=True)
 
     # Determine URLs based on network mode and HTTP/HTTPS
-    playwright_client_url = get_client_url(host_network, http_mode)
-    playwright_server_url = get_server_url(host_network, http_mode)
-    playwright_admin_url = get_admin_url(host_network, http_mode)
+    playwright_client_url = get_client_url(host_network, http_mode, stack_index)
+    playwright_server_url = get_server_url(host_network, http_mode, stack_index)
+    playwright_admin_url = get_admin_url(host_network, http_mode, stack_index)
+
+    # Stacks beside the first one keep their reports apart; Playwright empties its output directory on every run
+    suffix = f"-stack{stack_index}" if stack_index else ''
 
     # Add the Playwright service to the compose file
     compose_data['services']['playwright'] = {
@@ -491,17 +936,20 @@ def add_playwright_container(compose_data, host_network=False, http_mode=False):
             'PLAYWRIGHT_ADMIN_URL': playwright_admin_url,
             'RUN_CLIENT_TESTS': '${RUN_CLIENT_TESTS:-true}',
             'RUN_ADMIN_TESTS': '${RUN_ADMIN_TESTS:-false}',
-            'RUN_STACK_TESTS': '${RUN_STACK_TESTS:-false}'
+            'RUN_STACK_TESTS': '${RUN_STACK_TESTS:-false}',
+            'PLAYWRIGHT_WORKERS': '${PLAYWRIGHT_WORKERS:-4}',
+            'PLAYWRIGHT_RERUNS': '${PLAYWRIGHT_RERUNS:-4}',
+            'PLAYWRIGHT_RETRIES': '${PLAYWRIGHT_RETRIES:-0}'
         },
         'network_mode': 'service:client',  # Share network with client container
         'volumes': [
-            './test-results:/app/yellow-client/test-results',
-            './playwright-report:/app/yellow-client/playwright-report',
-            './yellow-admin/test-results:/app/yellow-admin/test-results',
-            './yellow-admin/playwright-report:/app/yellow-admin/playwright-report',
+            f'./test-results{suffix}:/app/yellow-client/test-results',
+            f'./playwright-report{suffix}:/app/yellow-client/playwright-report',
+            f'./yellow-admin/test-results{suffix}:/app/yellow-admin/test-results',
+            f'./yellow-admin/playwright-report{suffix}:/app/yellow-admin/playwright-report',
             './stack_tests:/app/stack_tests',
-            './stack_tests/test-results:/app/stack_tests/test-results',
-            './stack_tests/playwright-report:/app/stack_tests/playwright-report'
+            f'./stack_tests/test-results{suffix}:/app/stack_tests/test-results',
+            f'./stack_tests/playwright-report{suffix}:/app/stack_tests/playwright-report'
         ],
         'depends_on': {
             'client': {'condition': 'service_healthy'}
@@ -511,72 +959,295 @@ def add_playwright_container(compose_data, host_network=False, http_mode=False):
 
     return compose_data
 
+def add_bench_container(compose_data, host_network=False, http_mode=False, stack_index=0):
+    """Add the WebSocket load generator (scripts/ws_bench.py), run with 'docker compose run bench'."""
+    print("Adding bench container for load tests...")
+    suffix = f"-stack{stack_index}" if stack_index else ''
 
-def main():
-    """Main function to generate customized docker-compose files."""
-    args = parse_args()
-    project_root = get_project_root()
+    compose_data['services']['bench'] = {
+        'profiles': ['bench'],  # Only start when explicitly run
+        'build': {
+            'context': '.',
+            'dockerfile': './bench-container/Dockerfile'
+        },
+        'user': "${USER_ID:-1000}:${GROUP_ID:-1000}",
+        'environment': {
+            'SERVER_URL': get_server_url(host_network, http_mode, stack_index),
+            'BENCH_SESSIONS': '${BENCH_SESSIONS:-1000}',
+            'BENCH_ACCOUNTS': '${BENCH_ACCOUNTS:-100}',
+            'BENCH_RATE': '${BENCH_RATE:-100}',
+            'BENCH_DURATION': '${BENCH_DURATION:-60}',
+            'BENCH_JSON': f'/app/ci-artifacts/bench{suffix}.json'
+        },
+        'network_mode': 'service:server',  # Share network with server container
+        'ulimits': {
+            'nofile': {'soft': 65536, 'hard': 65536}
+        },
+        'volumes': [
+            './ci-artifacts:/app/ci-artifacts'
+        ],
+        'depends_on': {
+            'server': {'condition': 'service_healthy'},
+            'messages': {'condition': 'service_healthy'}
+        },
+    }
 
-    hollow_mode = args.hollow.lower() == 'true'
-    host_network = args.host_network.lower() == 'true'
-    http_mode = args.http.lower() == 'true'
+    return compose_data
 
-    print(f"Generating customized docker-compose file...")
+def expand_env(value):
+    """Expand ${VAR}, ${VAR:-default} and ${VAR-default} the way compose would, using the current environment."""
+    def replace(match):
+        name, separator, default = match.group(1), match.group(2), match.group(3)
+        current = os.environ.get(name)
+        if current is None or (separator == ':-' and current == ''):
+            return default or ''
+        return current
+    return re.sub(r'\$\{([A-Za-z_][A-Za-z0-9_]*)(?:(:?-)([^}]*))?\}', replace, value)
+
+def git(path, *args):
+    """Run a git command in path and return its stdout, or None if it fails."""
+    result = subprocess.run(['git', '-C', path, *args], capture_output=True)
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+def fingerprint_path(digest, project_root, path):
+    """Feed the content of a file or directory into digest, using git tree hashes where possible."""
+    digest.update(f"path:{os.path.relpath(path, project_root)}\n".encode())
+
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        return
+
+    if not os.path.isdir(path):
+        digest.update(b'missing\n')
+        return
+
+    toplevel = git(path, 'rev-parse', '--show-toplevel')
+    if toplevel is None:
+        # Not in a git checkout: hash every file
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d != 'node_modules')
+            for name in sorted(files):
+                fingerprint_path(digest, project_root, os.path.join(root, name))
+        return
+
+    prefix = os.path.relpath(os.path.realpath(path), os.path.realpath(toplevel.decode().strip()))
+    tree = git(path, 'rev-parse', 'HEAD^{tree}' if prefix == '.' else f'HEAD:{prefix}')
+    digest.update(tree or b'no-tree\n')
+
+    # Uncommitted changes are part of the build context too
+    status = git(path, 'status', '--porcelain', '--untracked-files=all', '--', '.') or b''
+    if status:
+        digest.update(status)
+        digest.update(git(path, 'diff', 'HEAD', '--', '.') or b'')
+        # status prints paths relative to the repository root, ls-files relative to path
+        untracked = git(path, 'ls-files', '--others', '--exclude-standard', '-z') or b''
+        for name in sorted(untracked.decode().split('\0')):
+            if name:
+                fingerprint_path(digest, project_root, os.path.join(path, name))
+
+def get_copy_sources(dockerfile_content):
+    """Return the source paths of all COPY/ADD instructions that copy from the build context."""
+    sources = []
+    for line in dockerfile_content.splitlines():
+        words = line.strip().split()
+        if not words or words[0].upper() not in ['COPY', 'ADD']:
+            continue
+        args = [word for word in words[1:] if not word.startswith('--')]
+        if any(word.startswith('--from') for word in words[1:]) or len(args) < 2:
+            continue
+        sources.extend(args[:-1])
+    return sources
+
+def compute_build_fingerprint(project_root, service_config):
+    """
+    Compute a fingerprint of everything that goes into building a service's image:
+    the Dockerfile, the git tree (plus uncommitted changes) of everything it copies,
+    the lockfiles in the build context and the build args.
+    """
+    build = service_config['build']
+    context = os.path.join(project_root, build.get('context', '.'))
+    dockerfile_path = os.path.join(context, build.get('dockerfile', 'Dockerfile'))
+
+    digest = hashlib.sha256()
+    digest.update(f"context:{build.get('context', '.')}\n".encode())
+    args = {key: expand_env(str(value)) for key, value in build.get('args', {}).items()}
+    digest.update(json.dumps(args, sort_keys=True).encode())
+
+    dockerfile_content = ''
+    if os.path.exists(dockerfile_path):
+        with open(dockerfile_path, 'r') as f:
+            dockerfile_content = f.read()
+    digest.update(dockerfile_content.encode())
+
+    for lockfile in LOCKFILES:
+        lockfile_path = os.path.join(context, lockfile)
+        if os.path.exists(lockfile_path):
+            fingerprint_path(digest, project_root, lockfile_path)
+
+    for source in sorted(set(get_copy_sources(dockerfile_content))):
+        fingerprint_path(digest, project_root, os.path.normpath(os.path.join(context, source)))
+
+    return digest.hexdigest()[:16]
+
+def apply_image_fingerprints(compose_data, project_root):
+    """Name every built image by its fingerprint and stamp the fingerprint as an image label."""
+    print("Computing image fingerprints...")
+
+    for service_name, service_config in compose_data.get('services', {}).items():
+        if 'build' not in service_config:
+            continue
+        if isinstance(service_config['build'], str):
+            service_config['build'] = {'context': service_config['build']}
+
+        fingerprint = compute_build_fingerprint(project_root, service_config)
+        service_config['image'] = f"yellow-dev-{service_name}:{fingerprint}"
+        service_config['build'].setdefault('labels', {})[FINGERPRINT_LABEL] = fingerprint
+        print(f"Service {service_name} fingerprint: {fingerprint}")
+
+    return compose_data
+
+
+def generate_instance(compose_template, settings_templates, project_root, output_dir,
+                      hollow_mode, host_network, http_mode, generated_dockerfiles=None, fast_db=False,
+                      bench_service=False, settings_profiles=None, bench=False, stack_index=0, project_name=None,
+                      profile=False):
+    """Generate the compose file (and its settings files and Dockerfiles) for one instance.
+
+    settings_profiles maps profile names to their overlays, see load_settings_profiles(). A stack_index other than 0
+    moves the instance to its own ports and project (project_name, or <directory>-<index>), see apply_stack_ports().
+    """
     print(f"Hollow mode: {hollow_mode}")
     print(f"Host network: {host_network}")
     print(f"HTTP mode: {http_mode}")
 
-    # Prepare output directory
-    output_dir = prepare_output_dir(project_root)
-
-    # Generate instance name using instantiation.sh
-    instance_name = get_instance_name(project_root, hollow_mode, host_network, http_mode)
+    settings_profiles = settings_profiles or {}
+    instance_name = get_instance_name(hollow_mode, host_network, http_mode, fast_db, list(settings_profiles), bench,
+                                      stack_index, profile)
     print(f"Instance name: {instance_name}")
 
-    # Load docker-compose template
-    compose_data = load_docker_compose_template(project_root)
+    # Overlay the settings profiles; the network and protocol settings below still take precedence
+    settings_templates = apply_settings_profiles(settings_templates, settings_profiles.values())
 
     # Make a deep copy to avoid modifying the original data
-    modified_compose = copy.deepcopy(compose_data)
+    modified_compose = copy.deepcopy(compose_template)
 
     # Process Dockerfiles for all services
-    process_service_dockerfiles(modified_compose, project_root, hollow_mode)
+    process_service_dockerfiles(modified_compose, project_root, hollow_mode, generated_dockerfiles)
 
     # Apply network mode
     if host_network:
-        apply_host_network(modified_compose, project_root, output_dir, instance_name, http_mode)
-        network_suffix = "hostnet"
+        apply_host_network(modified_compose, settings_templates, output_dir, instance_name, http_mode, stack_index)
     else:
-        apply_stack_network(modified_compose, project_root, output_dir, instance_name, http_mode)
-        network_suffix = "stack"
+        apply_stack_network(modified_compose, settings_templates, output_dir, instance_name, http_mode, stack_index)
 
     # Apply HTTPS certificates if enabled
     apply_https_certificates(modified_compose, http_mode)
 
     # Update client healthcheck
-    update_client_healthcheck(modified_compose, host_network, http_mode)
+    update_client_healthcheck(modified_compose, host_network, http_mode, stack_index)
+
+    # Split cores and RAM between the services if requested
+    if bench:
+        bench_plan, bench_workers = plan_bench_resources()
+
+    # Run MariaDB from tmpfs if requested
+    if fast_db:
+        apply_fast_db(modified_compose, output_dir, bench_plan['mariadb']['memory_mb'] if bench else None)
 
     # Apply hollow/full mode
     if hollow_mode:
         apply_hollow_mode(modified_compose)
-        mode_suffix = "hollow"
+        apply_deps_cache(modified_compose, project_root)
     else:
         apply_full_mode(modified_compose, host_network, http_mode)
-        mode_suffix = "full"
+
+    # Apply the client part of the settings profiles
+    apply_client_profiles(modified_compose, settings_profiles.values())
+
+    # Profile the server-side processes if requested
+    if profile:
+        apply_profiling(modified_compose, stack_index)
 
     # Add playwright container for all permutations
-    add_playwright_container(modified_compose, host_network, http_mode)
+    add_playwright_container(modified_compose, host_network, http_mode, stack_index)
 
-    # Generate the output filename
-    output_filename = f"docker-compose.{instance_name}.yml"
-    output_path = os.path.join(output_dir, output_filename)
+    # Add the load generator if requested
+    if bench_service:
+        add_bench_container(modified_compose, host_network, http_mode, stack_index)
+
+    # Move the stack to its own ports and project, so that it runs beside the others
+    if stack_index:
+        apply_stack_ports(modified_compose, stack_index, host_network)
+    if stack_index or project_name:
+        modified_compose['name'] = project_name or get_stack_project_name(stack_index, project_root)
+
+    # Pin the services, now that all of them are in place
+    if bench:
+        apply_bench_resources(modified_compose, bench_plan, bench_workers)
+
+    # Tag images by the content they are built from
+    apply_image_fingerprints(modified_compose, project_root)
 
     # Write the modified compose file
-    with open(output_path, 'w') as f:
-        yaml.dump(modified_compose, f, default_flow_style=False)
+    output_path = os.path.join(output_dir, f"docker-compose.{instance_name}.yml")
+    compose_content = yaml.dump(modified_compose, default_flow_style=False)
+    write_if_changed(output_path, compose_content)
+
+    return output_path, compose_content
+
+
+def main():
+    """Main function to generate customized docker-compose files."""
+    args = parse_args()
+    project_root = get_project_root()
+
+    # Prepare output directory
+    output_dir = prepare_output_dir(project_root)
+
+    # Load templates once, even when generating every instance
+    compose_template = load_docker_compose_template(project_root)
+    settings_templates = load_settings_templates(project_root)
+
+    fast_db = args.fast_db == 'true'
+    bench_service = args.bench_service == 'true'
+    bench = args.bench == 'true'
+    profile = args.profile == 'true'
+
+    profile_names = parse_settings_profile(args.settings_profile)
+    try:
+        settings_profiles = dict(zip(profile_names, load_settings_profiles(project_root, profile_names)))
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+    if args.all:
+        print(f"Generating all docker-compose instances...")
+        generated_dockerfiles = set()
+        for hollow_mode, host_network, http_mode in product([True, False], repeat=3):
+            output_path, _ = generate_instance(compose_template, settings_templates, project_root, output_dir,
+                                               hollow_mode, host_network, http_mode, generated_dockerfiles,
+                                               fast_db=fast_db, bench_service=bench_service,
+                                               settings_profiles=settings_profiles, bench=bench,
+                                               stack_index=args.stack_index, project_name=args.project_name,
+                                               profile=profile)
+            print(f"Generated customized docker-compose file: {output_path}")
+        return 0
+
+    hollow_mode = args.hollow.lower() == 'true'
+    host_network = args.host_network.lower() == 'true'
+    http_mode = args.http.lower() == 'true'
+
+    print(f"Generating customized docker-compose file...")
+    output_path, compose_content = generate_instance(compose_template, settings_templates, project_root, output_dir,
+                                                     hollow_mode, host_network, http_mode, fast_db=fast_db,
+                                                     bench_service=bench_service, settings_profiles=settings_profiles,
+                                                     bench=bench, stack_index=args.stack_index,
+                                                     project_name=args.project_name, profile=profile)
 
-    with open(os.path.join(output_dir, 'last.yml'), 'w') as f:
-        yaml.dump(modified_compose, f, default_flow_style=False)
+    write_if_changed(os.path.join(output_dir, 'last.yml'), compose_content)
 
     print(f"Generated customized docker-compose file: {output_path}")
 
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Follow the output of every container of a compose project while it runs, and store it as
+per-service gzip chunks with a small SQLite index (time range, levels, modules and request ids
+per chunk). pino/JSON lines are parsed; a pino-filter.json style file can drop lines below a
+per-module level at collection time. The query commands only decompress the chunks that can match.
+Usage:
+    python3 log_collector.py --dir ci-artifacts/logs collect [--filter pino-filter.json]
+    python3 log_collector.py query --level error --since 2024-05-01T12:00:00 --until 2024-05-01T12:05:00
+    python3 log_collector.py failures --report test-results/results.json --window 10
+"""
+
+import argparse
+import fnmatch
+import gzip
+import heapq
+import json
+import os
+import re
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import docker
+
+from generate_compose import get_project_name
+
+# pino numeric levels, and the names used for them
+LEVELS = {'trace': 10, 'debug': 20, 'info': 30, 'warn': 40, 'error': 50, 'fatal': 60}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+LEVEL_ALIASES = {'warning': 'warn', 'err': 'error', 'critical': 'fatal'}
+
+# Fields that carry the module and the request id, in order of preference
+MODULE_FIELDS = ['module', 'name', 'component']
+REQUEST_ID_FIELDS = ['requestID', 'requestId', 'reqId', 'req_id', 'request_id']
+
+# Level of lines that are not JSON, guessed from the first word that looks like one
+PLAIN_LEVEL_PATTERN = re.compile(r'\b(trace|debug|info|warn(?:ing)?|error|fatal)\b', re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    service TEXT NOT NULL,
+    container TEXT NOT NULL,
+    path TEXT NOT NULL,
+    first_time REAL NOT NULL,
+    last_time REAL NOT NULL,
+    lines INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunk_levels (chunk_id INTEGER NOT NULL, level INTEGER NOT NULL, count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS chunk_modules (chunk_id INTEGER NOT NULL, module TEXT NOT NULL, count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS chunk_requests (chunk_id INTEGER NOT NULL, request_id TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS chunks_time ON chunks(first_time, last_time);
+CREATE INDEX IF NOT EXISTS chunk_requests_id ON chunk_requests(request_id);
+"""
+
+class StopCollecting(Exception):
+    """Raised by the signal handler to stop following containers."""
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Collect, index and query the logs of a compose project')
+    parser.add_argument('--dir', dest='log_dir', default='ci-artifacts/logs',
+                        help='Directory of the chunks and index.sqlite (default: ci-artifacts/logs)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    collect = subparsers.add_parser('collect', help='Follow the containers of the project until interrupted')
+    collect.add_argument('--project', default=None,
+                         help='Compose project name (default: $COMPOSE_PROJECT_NAME or the directory name)')
+    collect.add_argument('--filter', dest='filter_path', default=None,
+                         help='pino-filter.json style {"levels": {"module": "level", "*": "level"}} applied while collecting')
+    collect.add_argument('--chunk-lines', type=int, default=20000, help='Lines per chunk (default: 20000)')
+    collect.add_argument('--chunk-seconds', type=float, default=30,
+                         help='Close chunks older than this, so the index stays current (default: 30)')
+
+    query = subparsers.add_parser('query', help='Print matching lines of all services in time order')
+    add_query_arguments(query)
+    query.add_argument('--since', help='ISO time or unix time')
+    query.add_argument('--until', help='ISO time or unix time')
+    query.add_argument('--around', help='ISO time or unix time; with --window, instead of --since/--until')
+    query.add_argument('--window', type=float, default=30, help='Seconds before and after --around (default: 30)')
+
+    failures = subparsers.add_parser('failures', help='Print the log window around every failed test of a Playwright JSON report')
+    add_query_arguments(failures, default_level='warn')
+    failures.add_argument('--report', default='test-results/results.json',
+                          help='Playwright JSON report (default: test-results/results.json)')
+    failures.add_argument('--window', type=float, default=10,
+                          help='Seconds before the start and after the end of each failed attempt (default: 10)')
+    return parser.parse_args()
+
+def add_query_arguments(parser, default_level=None):
+    parser.add_argument('--service', action='append', default=[], help='Only this service; may be repeated')
+    parser.add_argument('--level', default=default_level, choices=list(LEVELS),
+                        help=f"Only lines at or above this level (default: {default_level or 'all'})")
+    parser.add_argument('--module', default=None, help='Only this module (shell-style pattern)')
+    parser.add_argument('--request-id', default=None, help='Only lines of this request id')
+    parser.add_argument('--grep', default=None, help='Only lines matching this regular expression')
+    parser.add_argument('--limit', type=int, default=None, help='Print at most this many lines')
+    parser.add_argument('--raw', action='store_true', help='Print the original lines instead of a summary')
+
+def parse_level(value):
+    """Return the numeric pino level of a level number or name, or None."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        name = value.lower()
+        return LEVELS.get(LEVEL_ALIASES.get(name, name))
+    return None
+
+def parse_time(value):
+    """Parse unix time or an ISO time (UTC unless it has an offset) into unix time."""
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+def parse_line(line):
+    """Return (level, module, request id, message) of a pino/JSON or plain log line."""
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = None
+        if isinstance(record, dict):
+            module = next((str(record[field]) for field in MODULE_FIELDS if record.get(field)), None)
+            request_id = next((str(record[field]) for field in REQUEST_ID_FIELDS if record.get(field)), None)
+            message = record.get('msg', record.get('message', line))
+            return parse_level(record.get('level')), module, request_id, str(message)
+    match = PLAIN_LEVEL_PATTERN.search(line[:200])
+    return (parse_level(match.group(1)) if match else None), None, None, line
+
+class LevelFilter:
+    """Minimum level per module, configured like pino-filter.json: exact module names first, then patterns, then '*'."""
+
+    def __init__(self, path):
+        with open(path, 'r') as f:
+            levels = json.load(f).get('levels', {})
+        self.exact = {module: parse_level(level) for module, level in levels.items() if not any(c in module for c in '*?[')}
+        self.patterns = [(module, parse_level(level)) for module, level in levels.items()
+                         if module != '*' and module not in self.exact]
+        self.default = parse_level(levels.get('*', 'trace'))
+
+    def minimum(self, module):
+        if module in self.exact:
+            return self.exact[module]
+        for pattern, level in self.patterns:
+            if module is not None and fnmatch.fnmatchcase(module, pattern):
+                return level
+        return self.default
+
+    def accepts(self, level, module):
+        # Lines without a level are never dropped
+        return level is None or level >= (self.minimum(module) or 0)
+
+class ChunkWriter:
+    """Writes the lines of one container into gzip chunks and indexes every closed chunk."""
+
+    def __init__(self, collector, service, container_name):
+        self.collector = collector
+        self.service = service
+        self.container_name = container_name
+        self.sequence = 0
+        self.file = None
+        # The follower thread writes, and the collector closes the last chunk when it stops
+        self.lock = threading.Lock()
+        self.finished = False
+
+    def open_chunk(self, timestamp):
+        self.sequence += 1
+        directory = os.path.join(self.collector.log_dir, self.service)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{self.container_name}-{int(timestamp)}-{self.sequence:05d}.jsonl.gz")
+        self.file = gzip.open(self.path, 'wt', compresslevel=5)
+        self.opened_at = time.time()
+        self.first_time = timestamp
+        self.last_time = timestamp
+        self.lines = 0
+        self.levels = {}
+        self.modules = {}
+        self.request_ids = set()
+
+    def write(self, timestamp, raw):
+        level, module, request_id, message = parse_line(raw)
+        if self.collector.level_filter and not self.collector.level_filter.accepts(level, module):
+            return
+        with self.lock:
+            if self.finished:
+                return
+            if self.file is None:
+                self.open_chunk(timestamp)
+            self.file.write(json.dumps({'t': timestamp, 'l': level, 'm': module, 'r': request_id,
+                                        'msg': message, 'raw': raw}, ensure_ascii=False) + '\n')
+            self.last_time = max(self.last_time, timestamp)
+            self.lines += 1
+            self.levels[level] = self.levels.get(level, 0) + 1
+            if module is not None:
+                self.modules[module] = self.modules.get(module, 0) + 1
+            if request_id is not None:
+                self.request_ids.add(request_id)
+            if self.lines >= self.collector.chunk_lines or time.time() - self.opened_at >= self.collector.chunk_seconds:
+                self.end_chunk()
+
+    def end_chunk(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        self.collector.index_chunk(self)
+
+    def close_chunk(self, final=False):
+        """Close and index the current chunk. After the final close, further lines are dropped."""
+        with self.lock:
+            self.finished = self.finished or final
+            self.end_chunk()
+
+    def close_if_stale(self):
+        """Close the current chunk once it is older than --chunk-seconds, also when no further line arrives."""
+        with self.lock:
+            if self.file is not None and time.time() - self.opened_at >= self.collector.chunk_seconds:
+                self.end_chunk()
+
+class Collector:
+    """Follows every container of the project (also ones started later) in its own thread."""
+
+    def __init__(self, client, project, log_dir, level_filter, chunk_lines, chunk_seconds):
+        self.client = client
+        self.project = project
+        self.log_dir = log_dir
+        self.level_filter = level_filter
+        self.chunk_lines = chunk_lines
+        self.chunk_seconds = chunk_seconds
+        self.index_lock = threading.Lock()
+        self.index = connect(log_dir)
+        self.followed = {}
+        self.writers = []
+        self.stopped = threading.Event()
+
+    def index_chunk(self, writer):
+        with self.index_lock, self.index:
+            chunk_id = self.index.execute(
+                'INSERT INTO chunks (service, container, path, first_time, last_time, lines) VALUES (?, ?, ?, ?, ?, ?)',
+                (writer.service, writer.container_name, os.path.relpath(writer.path, self.log_dir),
+                 writer.first_time, writer.last_time, writer.lines)).lastrowid
+            self.index.executemany('INSERT INTO chunk_levels VALUES (?, ?, ?)',
+                                   [(chunk_id, level if level is not None else -1, count) for level, count in writer.levels.items()])
+            self.index.executemany('INSERT INTO chunk_modules VALUES (?, ?, ?)',
+                                   [(chunk_id, module, count) for module, count in writer.modules.items()])
+            self.index.executemany('INSERT INTO chunk_requests VALUES (?, ?)',
+                                   [(chunk_id, request_id) for request_id in writer.request_ids])
+
+    def follow(self, container, since):
+        """Copy the container's output into its chunks until the container stops."""
+        service = container.labels.get('com.docker.compose.service', container.name)
+        writer = ChunkWriter(self, service, container.name)
+        self.writers.append(writer)
+        buffer = b''
+        try:
+            for data in container.logs(stream=True, follow=True, timestamps=True, since=int(since)):
+                buffer += data
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    stamp, _, raw = line.decode('utf-8', errors='replace').partition(' ')
+                    try:
+                        timestamp = parse_time(stamp[:26] + 'Z' if len(stamp) > 26 else stamp)
+                    except ValueError:
+                        timestamp, raw = time.time(), f"{stamp} {raw}"
+                    writer.write(timestamp, raw.rstrip('\r'))
+        except docker.errors.DockerException as e:
+            print(f"[LOGS] {container.name}: {e}", flush=True)
+        finally:
+            writer.close_chunk()
+            self.followed.pop(container.id, None)
+
+    def start_following(self, container, since):
+        if container.id in self.followed:
+            return
+        thread = threading.Thread(target=self.follow, args=(container, since), daemon=True)
+        self.followed[container.id] = thread
+        print(f"[LOGS] Following {container.name}", flush=True)
+        thread.start()
+
+    def sweep(self):
+        """Close the stale chunks of quiet containers, which write() would only close with their next line."""
+        while not self.stopped.wait(min(1, self.chunk_seconds)):
+            for writer in list(self.writers):
+                writer.close_if_stale()
+
+    def run(self):
+        start_time = time.time()
+        label = f'com.docker.compose.project={self.project}'
+        events = self.client.events(decode=True, since=int(start_time),
+                                    filters={'type': 'container', 'event': 'start', 'label': label})
+        for container in self.client.containers.list(filters={'label': label}):
+            self.start_following(container, start_time)
+        threading.Thread(target=self.sweep, daemon=True).start()
+        try:
+            for event in events:
+                try:
+                    container = self.client.containers.get(event['id'])
+                except docker.errors.NotFound:
+                    continue
+                self.start_following(container, event['time'])
+        except StopCollecting:
+            print("[LOGS] Stopping", flush=True)
+        finally:
+            events.close()
+            self.stopped.set()
+            # Give the followers a moment to read what the containers wrote last, then close their chunks
+            deadline = time.time() + 5
+            while self.followed and time.time() < deadline:
+                time.sleep(0.1)
+            for writer in list(self.writers):
+                writer.close_chunk(final=True)
+
+def connect(log_dir):
+    os.makedirs(log_dir, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(log_dir, 'index.sqlite'), check_same_thread=False)
+    connection.executescript(SCHEMA)
+    return connection
+
+def find_chunks(connection, since=None, until=None, services=None, level=None, module=None, request_id=None):
+    """Return [(service, path)] of the chunks that can contain matching lines, oldest first."""
+    conditions, params = [], []
+    if since is not None:
+        conditions.append('last_time >= ?')
+        params.append(since)
+    if until is not None:
+        conditions.append('first_time <= ?')
+        params.append(until)
+    if services:
+        conditions.append(f"service IN ({','.join('?' * len(services))})")
+        params += services
+    if level is not None:
+        conditions.append('id IN (SELECT chunk_id FROM chunk_levels WHERE level >= ?)')
+        params.append(level)
+    if module is not None:
+        conditions.append('id IN (SELECT chunk_id FROM chunk_modules WHERE module GLOB ?)')
+        params.append(module)
+    if request_id is not None:
+        conditions.append('id IN (SELECT chunk_id FROM chunk_requests WHERE request_id = ?)')
+        params.append(request_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return connection.execute(f'SELECT service, path FROM chunks {where} ORDER BY first_time', params).fetchall()
+
+def read_chunk(log_dir, service, path):
+    """Yield (time, service, entry) of a chunk; tolerates a chunk that is still being written."""
+    try:
+        with gzip.open(os.path.join(log_dir, path), 'rt') as f:
+            for line in f:
+                entry = json.loads(line)
+                yield entry['t'], service, entry
+    except (EOFError, OSError, json.JSONDecodeError):
+        return
+
+def query_lines(log_dir, since=None, until=None, services=None, level=None, module=None, request_id=None, grep=None):
+    """Yield (time, service, entry) of every matching line of all services, in time order."""
+    connection = connect(log_dir)
+    chunks = find_chunks(connection, since, until, services, level, module, request_id)
+    pattern = re.compile(grep) if grep else None
+    # Chunks of one container are in time order, so merging them keeps the order across services
+    for timestamp, service, entry in heapq.merge(*[read_chunk(log_dir, service, path) for service, path in chunks],
+                                                 key=lambda item: item[0]):
+        if since is not None and timestamp < since or until is not None and timestamp > until:
+            continue
+        if level is not None and (entry['l'] is None or entry['l'] < level):
+            continue
+        if module is not None and not fnmatch.fnmatchcase(entry['m'] or '', module):
+            continue
+        if request_id is not None and entry['r'] != request_id:
+            continue
+        if pattern is not None and not pattern.search(entry['raw']):
+            continue
+        yield timestamp, service, entry
+
+def print_lines(lines, limit=None, raw=False):
+    """Print lines as '<time> <service> <level> <module>: <message>'. Returns the number printed."""
+    count = 0
+    for timestamp, service, entry in lines:
+        if limit is not None and count >= limit:
+            print(f"... (--limit {limit} reached)")
+            break
+        if raw:
+            print(f"{format_time(timestamp)} {service} {entry['raw']}")
+        else:
+            level = LEVEL_NAMES.get(entry['l'], str(entry['l'] or '-'))
+            print(f"{format_time(timestamp)} {service:<12} {level:<5} {entry['m'] or '-'}: {entry['msg']}")
+        count += 1
+    return count
+
+def iter_failed_attempts(report):
+    """Yield (title, status, start, end) of every failed attempt in a Playwright JSON report."""
+    def walk(suite, titles):
+        for spec in suite.get('specs', []):
+            for test in spec.get('tests', []):
+                for result in test.get('results', []):
+                    if result.get('status') in ('failed', 'timedOut', 'interrupted') and result.get('startTime'):
+                        start = parse_time(result['startTime'])
+                        title = ' › '.join(titles + [spec['title']]) + f" [{test.get('projectName')}]"
+                        yield title, result['status'], start, start + result.get('duration', 0) / 1000
+        for child in suite.get('suites', []):
+            yield from walk(child, titles + [child['title']])
+
+    for suite in report.get('suites', []):
+        yield from walk(suite, [suite.get('file') or suite.get('title')])
+
+def main():
+    """Main function to collect or query logs."""
+    args = parse_args()
+
+    if args.command == 'collect':
+        level_filter = LevelFilter(args.filter_path) if args.filter_path else None
+
+        def stop(signum, frame):
+            raise StopCollecting()
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        project = args.project or get_project_name()
+        print(f"[LOGS] Collecting logs of project {project} into {args.log_dir}", flush=True)
+        Collector(docker.from_env(), project, args.log_dir, level_filter,
+                  args.chunk_lines, args.chunk_seconds).run()
+        return 0
+
+    level = LEVELS[args.level] if args.level else None
+    filters = dict(services=args.service, level=level, module=args.module, request_id=args.request_id, grep=args.grep)
+
+    if args.command == 'query':
+        if args.around:
+            around = parse_time(args.around)
+            since, until = around - args.window, around + args.window
+        else:
+            since = parse_time(args.since) if args.since else None
+            until = parse_time(args.until) if args.until else None
+        print_lines(query_lines(args.log_dir, since, until, **filters), args.limit, args.raw)
+        return 0
+
+    with open(args.report, 'r') as f:
+        report = json.load(f)
+    failed = list(iter_failed_attempts(report))
+    if not failed:
+        print("No failed tests in the report")
+    for title, status, start, end in failed:
+        print(f"\n===== {title}: {status} {format_time(start)} - {format_time(end)} =====")
+        count = print_lines(query_lines(args.log_dir, start - args.window, end + args.window, **filters),
+                            args.limit, args.raw)
+        if not count:
+            print("(no matching log lines)")
+    return 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except docker.errors.DockerException as e:
+        print(f"Docker error: {e}")
+        sys.exit(1)
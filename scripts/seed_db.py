@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Seed the stack's MariaDB with synthetic users, conversations and message histories.
+Rows are generated lazily and streamed through the mariadb client's stdin, as TSV into
+LOAD DATA LOCAL INFILE (or as batched multi-row INSERTs), so memory stays flat whatever the size.
+Activity is skewed (Zipf): a few users and conversations hold most of the messages.
+Users are <prefix><i>@<domain> sharing one password, so ws_bench.py can log them in.
+By default the client runs inside the mariadb container of the stack ('docker compose exec'),
+connecting to MARIA_HOST or the database host of the settings files.
+Usage:
+    python3 seed_db.py --users 100000 --conversations 500000 --messages 10000000 --jobs 4
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from generate_compose import get_project_root
+
+# Rows handed to the client per write
+CHUNK_ROWS = 10000
+
+# Vocabulary of the generated messages
+WORDS = ('hello hi yes no maybe ok thanks sure when where why how what today tomorrow tonight later soon now '
+         'meeting call lunch dinner coffee work home office project deadline report update news photo video '
+         'link file document great good nice cool awesome sorry please again late early here there see you '
+         'the a an and or but so if then because with without about for from to in on at by of is are was').split()
+
+FIRST_NAMES = 'Alice Bob Carol Dave Eve Frank Grace Heidi Ivan Judy Mallory Niaj Olivia Peggy Rupert Sybil Trent Victor Walter'.split()
+LAST_NAMES = 'Smith Novak Müller García Rossi Dubois Kowalski Svoboda Jensen Silva Horvat Nagy Popescu Ivanova Tanaka'.split()
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Seed MariaDB with synthetic users and message histories')
+    parser.add_argument('--users', type=int, default=1000, help='Number of users (default: 1000)')
+    parser.add_argument('--conversations', type=int, default=5000,
+                        help='Number of distinct user pairs that exchange messages (default: 5000)')
+    parser.add_argument('--messages', type=int, default=100000, help='Number of messages (default: 100000)')
+    parser.add_argument('--skew', type=float, default=1.1,
+                        help='Zipf exponent of user and conversation activity; 0 is uniform (default: 1.1)')
+    parser.add_argument('--days', type=float, default=365, help='Messages are spread over the last N days (default: 365)')
+    parser.add_argument('--domain', default='localhost', help='Domain of the users (default: localhost)')
+    parser.add_argument('--user-prefix', default='bench', help='Usernames are <prefix><i> (default: bench)')
+    parser.add_argument('--password', default='password', help='Password of every user (default: password)')
+    parser.add_argument('--password-hash', default=None,
+                        help='Stored password hash; computed from --password with argon2-cffi if not given')
+    parser.add_argument('--method', choices=['load', 'insert'], default='load',
+                        help='LOAD DATA LOCAL INFILE, or batched multi-row INSERTs if local_infile is disabled (default: load)')
+    parser.add_argument('--batch', type=int, default=1000, help='Rows per INSERT with --method insert (default: 1000)')
+    parser.add_argument('--jobs', type=int, default=4, help='Concurrent message loaders (default: 4)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed; the same seed generates the same data (default: 1)')
+    parser.add_argument('--instance', default=None,
+                        help='Read the database settings of this generated instance (default: the settings templates)')
+    parser.add_argument('--compose-file', default='last.yaml',
+                        help='Compose file of the running stack (default: last.yaml)')
+    parser.add_argument('--local-client', action='store_true',
+                        help='Run the mariadb client on this machine instead of in the mariadb container')
+    return parser.parse_args()
+
+def load_database_settings(project_root, instance=None):
+    """Return the 'database' settings of the server and of the messages module."""
+    if instance:
+        paths = [os.path.join(project_root, 'generated', f'yellow-server-settings-{instance}.json'),
+                 os.path.join(project_root, 'generated', f'yellow-server-module-messages-settings-{instance}.json')]
+    else:
+        paths = [os.path.join(project_root, 'template-yellow-server-settings.json'),
+                 os.path.join(project_root, 'template-yellow-server-module-messages-settings.json')]
+    settings = []
+    for path in paths:
+        with open(path, 'r') as f:
+            settings.append(json.load(f)['database'])
+    return settings
+
+def hash_password(password):
+    """Hash the password the way Bun.password.hash does by default (argon2id, 64 MiB, t=2)."""
+    try:
+        from argon2 import PasswordHasher
+    except ImportError:
+        sys.exit("argon2-cffi is not installed: pip install argon2-cffi, or pass --password-hash")
+    return PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1).hash(password)
+
+class MariaDB:
+    """Runs the mariadb command line client against one database."""
+
+    def __init__(self, database, compose_file, local_client):
+        host = os.environ.get('MARIA_HOST') or database['host']
+        self.command = ['mariadb', f"--host={host}", f"--port={database.get('port', 3306)}",
+                        f"--user={database['user']}", f"--password={database['password']}",
+                        '--local-infile=1', '--batch', '--skip-column-names', database['name']]
+        if not local_client:
+            self.command = ['docker', 'compose', '--project-directory', get_project_root(), '-f', compose_file,
+                            'exec', '-T', 'mariadb', *self.command]
+        self.name = database['name']
+
+    def query(self, sql):
+        """Run statements and return the result rows as lists of strings."""
+        result = subprocess.run(self.command, input=sql, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{self.name}: {result.stderr.strip()}")
+        return [line.split('\t') for line in result.stdout.splitlines()]
+
+    def columns(self, table):
+        """Return the column names of a table, in order."""
+        return [row[0] for row in self.query(
+            f"SELECT column_name FROM information_schema.columns "
+            f"WHERE table_schema = DATABASE() AND table_name = '{table}' ORDER BY ordinal_position")]
+
+    def stream(self, table, columns, rows, method, batch):
+        """Stream rows (tuples matching columns) into table. Returns the number of rows sent."""
+        sent = 0
+
+        def counted(rows):
+            nonlocal sent
+            for row in rows:
+                sent += 1
+                yield row
+
+        rows = counted(rows)
+        prelude = "SET SESSION unique_checks = 0; SET SESSION foreign_key_checks = 0;"
+        column_list = ', '.join(f"`{column}`" for column in columns)
+        if method == 'load':
+            sql = (f"{prelude} LOAD DATA LOCAL INFILE '/dev/stdin' IGNORE INTO TABLE `{table}` CHARACTER SET utf8mb4 "
+                   f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({column_list})")
+            command = [*self.command, '-e', sql]
+            chunks = ('\n'.join('\t'.join(map(tsv_value, row)) for row in chunk) + '\n'
+                      for chunk in iter_chunks(rows, CHUNK_ROWS))
+        else:
+            command = self.command
+            chunks = itertools.chain([prelude + '\n'], (
+                f"INSERT IGNORE INTO `{table}` ({column_list}) VALUES "
+                + ','.join('(' + ','.join(map(sql_value, row)) + ')' for row in chunk) + ';\n'
+                for chunk in iter_chunks(rows, batch)))
+
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8')
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"{self.name}.{table}: {process.stderr.read().strip()}")
+        return sent
+
+def iter_chunks(rows, size):
+    """Yield lists of up to size rows."""
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def tsv_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+def sql_value(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+def project(fields, available):
+    """Return (columns, function selecting those fields of a full row) for the fields the table has."""
+    indexes = [i for i, field in enumerate(fields) if field in available]
+    return [fields[i] for i in indexes], (lambda row: tuple(row[i] for i in indexes))
+
+def zipf_cum_weights(count, skew, rng):
+    """Cumulative Zipf weights over count items, with the ranks shuffled so heavy items are spread out."""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return list(itertools.accumulate(1 / rank ** skew for rank in ranks))
+
+def build_conversations(users, count, skew, seed):
+    """Pick count distinct pairs of user indexes, heavy users taking part in more conversations."""
+    rng = random.Random(seed)
+    cum_weights = zipf_cum_weights(users, skew, rng)
+    pairs = set()
+    limit = min(count, users * (users - 1) // 2)
+    while len(pairs) < limit:
+        a, b = rng.choices(range(users), cum_weights=cum_weights, k=2)
+        if a != b:
+            pairs.add((min(a, b), max(a, b)))
+    return sorted(pairs)
+
+USER_FIELDS = ['id', 'username', 'id_domains', 'visible_name', 'password', 'created']
+
+def generate_users(args, first_id, domain_id, password_hash, created):
+    rng = random.Random(args.seed)
+    for i in range(args.users):
+        visible_name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        yield (first_id + i, f"{args.user_prefix}{i + 1}", domain_id, visible_name, password_hash, created)
+
+MESSAGE_FIELDS = ['id', 'uid', 'id_users', 'address_from', 'address_to', 'message', 'format', 'seen', 'created']
+
+def generate_messages(args, users, conversations, first_id, start, stop, seed):
+    """
+    Yield two rows (the sender's and the recipient's copy) for each message index in [start, stop),
+    in time order, spread over the last --days days.
+    """
+    rng = random.Random(seed)
+    cum_weights = zipf_cum_weights(len(conversations), args.skew, random.Random(args.seed))
+    now = time.time()
+    first_time = now - args.days * 86400
+    step = args.days * 86400 / max(1, args.messages)
+    unseen_after = now - 86400
+    last_second, created = None, None
+
+    for index in range(start, stop):
+        a, b = rng.choices(conversations, cum_weights=cum_weights)[0]
+        sender, recipient = (users[a], users[b]) if rng.random() < 0.5 else (users[b], users[a])
+        timestamp = int(first_time + index * step)
+        if timestamp != last_second:
+            last_second = timestamp
+            created = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+        message = ' '.join(rng.choices(WORDS, k=min(60, int(rng.lognormvariate(1.8, 0.7)) + 1)))
+        uid = f"seed-{args.seed}-{index}"
+        seen = created if timestamp < unseen_after else None
+        row_id = first_id + 2 * index
+        yield (row_id, uid, sender[0], sender[1], recipient[1], message, 'plaintext', created, created)
+        yield (row_id + 1, uid, recipient[0], sender[1], recipient[1], message, 'plaintext', seen, created)
+
+def seed_messages_part(args, databases, users, first_id, columns, start, stop, part):
+    """Load the messages [start, stop) over one client connection. Returns (rows, seconds)."""
+    begin = time.time()
+    conversations = build_conversations(len(users), args.conversations, args.skew, args.seed)
+    messages_db = MariaDB(databases[1], args.compose_file, args.local_client)
+    fields, select = project(MESSAGE_FIELDS, columns)
+    rows = messages_db.stream('messages', fields,
+                              map(select, generate_messages(args, users, conversations, first_id, start, stop,
+                                                            args.seed * 1000 + part)),
+                              args.method, args.batch)
+    return rows, time.time() - begin
+
+def seed_users(args, server_db):
+    """Create the domain and the users. Returns [(id, address)] of all <prefix><i> users."""
+    domain = args.domain.replace("'", "")
+    server_db.query(f"INSERT IGNORE INTO domains (name) VALUES ('{domain}')")
+    domain_id = int(server_db.query(f"SELECT id FROM domains WHERE name = '{domain}'")[0][0])
+    first_id = int(server_db.query("SELECT COALESCE(MAX(id), 0) + 1 FROM users")[0][0])
+
+    password_hash = args.password_hash or hash_password(args.password)
+    fields, select = project(USER_FIELDS, server_db.columns('users'))
+    created = datetime.fromtimestamp(time.time() - args.days * 86400).strftime('%Y-%m-%d %H:%M:%S')
+    server_db.stream('users', fields, map(select, generate_users(args, first_id, domain_id, password_hash, created)),
+                     args.method, args.batch)
+
+    # Users that already existed keep their ids; existing rows were skipped by IGNORE
+    prefix = args.user_prefix.replace("'", "")
+    ids = {username: int(user_id) for user_id, username in server_db.query(
+        f"SELECT id, username FROM users WHERE id_domains = {domain_id} AND username LIKE '{prefix}%'")}
+    return [(ids[f"{prefix}{i + 1}"], f"{prefix}{i + 1}@{args.domain}")
+            for i in range(args.users) if f"{prefix}{i + 1}" in ids]
+
+def main():
+    """Main function to seed the database."""
+    args = parse_args()
+    project_root = get_project_root()
+    databases = load_database_settings(project_root, args.instance)
+    server_db = MariaDB(databases[0], args.compose_file, args.local_client)
+    messages_db = MariaDB(databases[1], args.compose_file, args.local_client)
+
+    start_time = time.time()
+    print(f"[SEED] Seeding {args.users} users...", flush=True)
+    users = seed_users(args, server_db)
+    print(f"[SEED] {len(users)} users ready in {time.time() - start_time:.1f}s", flush=True)
+    if len(users) < 2:
+        print("[SEED] Need at least two users to create conversations")
+        return 1
+
+    columns = messages_db.columns('messages')
+    missing = {'id_users', 'address_from', 'address_to', 'message'} - set(columns)
+    if missing:
+        print(f"[SEED] Table messages has no column(s) {', '.join(sorted(missing))}; schema not supported")
+        return 1
+    first_id = int(messages_db.query("SELECT COALESCE(MAX(id), 0) + 1 FROM messages")[0][0])
+
+    # Contiguous id ranges per job, so every loader appends in primary key order
+    jobs = max(1, min(args.jobs, args.messages))
+    bounds = [args.messages * part // jobs for part in range(jobs + 1)]
+    print(f"[SEED] Loading {args.messages} messages ({2 * args.messages} rows) in {args.conversations} conversations "
+          f"with {jobs} jobs ({args.method})...", flush=True)
+    messages_start = time.time()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(seed_messages_part, args, databases, users, first_id, columns,
+                                   bounds[part], bounds[part + 1], part) for part in range(jobs)]
+        for part, future in enumerate(futures):
+            rows, seconds = future.result()
+            print(f"[SEED] Job {part}: {rows} rows in {seconds:.1f}s ({rows / max(seconds, 0.001):.0f} rows/s)", flush=True)
+    seconds = time.time() - messages_start
+
+    print(f"[SEED] Loaded {2 * args.messages} message rows in {seconds:.1f}s "
+          f"({2 * args.messages / max(seconds, 0.001):.0f} rows/s), total {time.time() - start_time:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except RuntimeError as e:
+        print(f"[SEED] Database error: {e}")
+        sys.exit(1)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Record a per-service startup timeline of a compose project from the Docker events API.
+Writes a JSON timeline and a Chrome trace (open in chrome://tracing or ui.perfetto.dev),
+and reports the critical path through the depends_on graph of the compose file.
+Usage:
+    python3 stack_timeline.py --compose-file generated/docker-compose.full.stack.http.yml --until-ready
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+import docker
+import yaml
+
+from generate_compose import get_project_name
+
+# Docker container event actions recorded in the timeline
+RECORDED_ACTIONS = {
+    'create': 'create',
+    'start': 'start',
+    'health_status: healthy': 'healthy',
+    'health_status: unhealthy': 'unhealthy',
+    'die': 'exit',
+}
+
+class StopRecording(Exception):
+    """Raised by the signal handler to stop following events."""
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Record a per-service startup timeline of a compose project')
+    parser.add_argument('--compose-file', default='docker-compose.template.yml',
+                        help='Compose file providing the services and their depends_on graph')
+    parser.add_argument('--project', default=None,
+                        help='Compose project name (default: $COMPOSE_PROJECT_NAME or the directory name)')
+    parser.add_argument('--since', type=float, default=None,
+                        help='Unix time to replay events from (default: now)')
+    parser.add_argument('--until-ready', action='store_true',
+                        help='Stop once every service is ready (healthy, exited successfully, or started without healthcheck)')
+    parser.add_argument('--timeout', type=float, default=900,
+                        help='Stop after this many seconds (default: 900)')
+    parser.add_argument('--output-dir', default='ci-artifacts',
+                        help='Directory for <name>.json and <name>.trace.json (default: ci-artifacts)')
+    parser.add_argument('--name', default='timeline',
+                        help='Base name of the output files (default: timeline)')
+    return parser.parse_args()
+
+def load_services(compose_file):
+    """Return {service: {'depends_on': [...], 'healthcheck': bool}} for the services started by 'up'."""
+    with open(compose_file, 'r') as f:
+        compose_data = yaml.safe_load(f)
+
+    services = {}
+    for service_name, service_config in compose_data.get('services', {}).items():
+        # Services behind a profile (playwright) are not part of the stack startup
+        if service_config.get('profiles'):
+            continue
+        depends_on = service_config.get('depends_on', [])
+        healthcheck = service_config.get('healthcheck', {})
+        services[service_name] = {
+            'depends_on': list(depends_on),
+            'healthcheck': bool(healthcheck) and not healthcheck.get('disable', False),
+        }
+    return services
+
+def get_ready_time(record, has_healthcheck):
+    """Return when a service became ready: healthy, exited successfully, or started (no healthcheck)."""
+    if has_healthcheck:
+        return record.get('healthy')
+    if 'exit' in record:
+        return record['exit'] if record.get('exit_code') == 0 else None
+    return record.get('start')
+
+def all_ready(services, records):
+    """Check whether every service is ready or has failed."""
+    for service_name, service in services.items():
+        record = records.get(service_name, {})
+        failed = record.get('exit_code') not in [None, 0]
+        if not failed and get_ready_time(record, service['healthcheck']) is None:
+            return False
+    return True
+
+def record_events(client, project, services, since, timeout, until_ready):
+    """Follow container events of the project and return {service: {event: time}}."""
+    records = {}
+    events = client.events(
+        decode=True,
+        since=int(since),
+        filters={'type': 'container', 'label': f'com.docker.compose.project={project}'},
+    )
+    print(f"[TIMELINE] Recording events of project {project}...", flush=True)
+
+    def stop(signum, frame):
+        raise StopRecording()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGALRM, stop)
+    signal.alarm(max(1, int(timeout)))
+
+    try:
+        for event in events:
+            action = RECORDED_ACTIONS.get(event.get('Action') or event.get('status'))
+            if action is None:
+                continue
+            attributes = event.get('Actor', {}).get('Attributes', {})
+            service_name = attributes.get('com.docker.compose.service')
+            if service_name is None:
+                continue
+
+            timestamp = event['timeNano'] / 1e9
+            if timestamp < since:
+                continue
+            record = records.setdefault(service_name, {})
+            # Keep the first occurrence; restarts show up as later events in the raw list
+            record.setdefault(action, timestamp)
+            record.setdefault('events', []).append({'action': action, 'time': timestamp})
+            if action == 'exit':
+                record['exit_code'] = int(attributes.get('exitCode', 0))
+            print(f"[TIMELINE] {timestamp - since:8.1f}s {service_name}: {action}", flush=True)
+
+            if until_ready and all_ready(services, records):
+                print("[TIMELINE] All services ready", flush=True)
+                break
+    except StopRecording:
+        print("[TIMELINE] Stopped", flush=True)
+    finally:
+        signal.alarm(0)
+        events.close()
+
+    return records
+
+def get_critical_path(services, records):
+    """
+    Walk back from the service that became ready last, always following the dependency
+    that became ready last, i.e. the one that actually gated the next service's start.
+    """
+    ready_times = {}
+    for service_name, service in services.items():
+        record = records.get(service_name, {})
+        ready_time = get_ready_time(record, service['healthcheck'])
+        if ready_time is not None:
+            ready_times[service_name] = ready_time
+
+    if not ready_times:
+        return []
+
+    path = []
+    current = max(ready_times, key=ready_times.get)
+    while current is not None:
+        path.append(current)
+        dependencies = [dep for dep in services.get(current, {}).get('depends_on', []) if dep in ready_times]
+        current = max(dependencies, key=ready_times.get) if dependencies else None
+    path.reverse()
+    return path
+
+def build_timeline(project, since, services, records):
+    """Build the JSON timeline, with times in seconds relative to since."""
+    def relative(timestamp):
+        return None if timestamp is None else round(timestamp - since, 3)
+
+    timeline = {'project': project, 'since': since, 'services': {}}
+    for service_name, service in services.items():
+        record = records.get(service_name, {})
+        timeline['services'][service_name] = {
+            'depends_on': service['depends_on'],
+            'create': relative(record.get('create')),
+            'start': relative(record.get('start')),
+            'healthy': relative(record.get('healthy')),
+            'exit': relative(record.get('exit')),
+            'exit_code': record.get('exit_code'),
+            'ready': relative(get_ready_time(record, service['healthcheck'])),
+            'events': [{'action': e['action'], 'time': relative(e['time'])} for e in record.get('events', [])],
+        }
+
+    critical_path = get_critical_path(services, records)
+    timeline['critical_path'] = [
+        {'service': service_name,
+         'start': timeline['services'][service_name]['start'],
+         'ready': timeline['services'][service_name]['ready']}
+        for service_name in critical_path
+    ]
+    timeline['total'] = timeline['critical_path'][-1]['ready'] if critical_path else None
+    return timeline
+
+def build_chrome_trace(timeline):
+    """Convert the timeline into Chrome trace event format (one track per service)."""
+    trace_events = []
+    critical = {step['service'] for step in timeline['critical_path']}
+
+    for tid, (service_name, service) in enumerate(timeline['services'].items(), 1):
+        trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+                             'args': {'name': service_name}})
+        phases = [
+            ('created', service['create'], service['start']),
+            ('starting' if service['ready'] is not None else 'running', service['start'],
+             service['ready'] if service['ready'] is not None else service['exit']),
+        ]
+        for name, begin, end in phases:
+            if begin is None or end is None:
+                continue
+            trace_events.append({
+                'name': name, 'cat': 'critical' if service_name in critical else 'service',
+                'ph': 'X', 'pid': 1, 'tid': tid,
+                'ts': int(begin * 1e6), 'dur': int((end - begin) * 1e6),
+            })
+        for event in service['events']:
+            trace_events.append({'name': event['action'], 'ph': 'i', 's': 't', 'pid': 1, 'tid': tid,
+                                 'ts': int(event['time'] * 1e6)})
+
+    return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+def main():
+    """Main function to record the timeline."""
+    args = parse_args()
+    project = args.project or get_project_name()
+    since = args.since if args.since is not None else time.time()
+    services = load_services(args.compose_file)
+
+    client = docker.from_env()
+    records = record_events(client, project, services, since, args.timeout, args.until_ready)
+    timeline = build_timeline(project, since, services, records)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timeline_path = os.path.join(args.output_dir, f'{args.name}.json')
+    with open(timeline_path, 'w') as f:
+        json.dump(timeline, f, indent=2)
+    trace_path = os.path.join(args.output_dir, f'{args.name}.trace.json')
+    with open(trace_path, 'w') as f:
+        json.dump(build_chrome_trace(timeline), f)
+
+    print("[TIMELINE] ===== CRITICAL PATH =====")
+    for step in timeline['critical_path']:
+        print(f"[TIMELINE] {step['service']}: started {step['start']}s, ready {step['ready']}s")
+    print(f"[TIMELINE] Stack ready after {timeline['total']}s")
+    print(f"[TIMELINE] Wrote {timeline_path} and {trace_path}")
+    return 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except docker.errors.DockerException as e:
+        print(f"Docker error: {e}")
+        sys.exit(1)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Sample CPU, memory, block I/O and network of every container of a compose project at a fixed interval
+until interrupted, and write them as a compact per-service time series. Prints, or with --summary reads back,
+the average and peak figures of every service.
+Usage:
+    python3 stats_sampler.py --output ci-artifacts/stats.json --interval 1
+    python3 stats_sampler.py --summary ci-artifacts/stats.json
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import docker
+
+from generate_compose import get_project_name
+
+# Columns of every sample: seconds since the start, CPU in % of one core, RSS in MiB, and MiB read/written
+# from block devices and received/sent over the network since the previous sample
+COLUMNS = ['t', 'cpu', 'rss', 'blk_read', 'blk_write', 'net_rx', 'net_tx']
+
+MB = 1024 * 1024
+
+class StopSampling(Exception):
+    """Raised by the signal handler to stop sampling."""
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Sample the resource usage of the containers of a compose project')
+    parser.add_argument('--project', default=None,
+                        help='Compose project name (default: $COMPOSE_PROJECT_NAME or the directory name)')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='Seconds between samples (default: 1; docker updates stats about once a second)')
+    parser.add_argument('--output', default='ci-artifacts/stats.json',
+                        help='Time series output (default: ci-artifacts/stats.json)')
+    parser.add_argument('--summary', metavar='STATS_JSON', default=None,
+                        help='Only print the summary of a previously written time series')
+    return parser.parse_args()
+
+def get_cpu_percent(stats):
+    """CPU usage since docker's previous reading, in % of one core."""
+    cpu, precpu = stats.get('cpu_stats', {}), stats.get('precpu_stats', {})
+    cpu_delta = cpu.get('cpu_usage', {}).get('total_usage', 0) - precpu.get('cpu_usage', {}).get('total_usage', 0)
+    system_delta = cpu.get('system_cpu_usage', 0) - precpu.get('system_cpu_usage', 0)
+    if cpu_delta <= 0 or system_delta <= 0:
+        return 0.0
+    online_cpus = cpu.get('online_cpus') or len(cpu.get('cpu_usage', {}).get('percpu_usage') or [1])
+    return cpu_delta / system_delta * online_cpus * 100
+
+def get_rss_bytes(stats):
+    """Memory usage without the reclaimable page cache, like 'docker stats' shows it."""
+    memory = stats.get('memory_stats', {})
+    details = memory.get('stats', {})
+    # cgroup v2 reports inactive_file, v1 total_inactive_file
+    inactive = details.get('inactive_file', details.get('total_inactive_file', 0))
+    return max(0, memory.get('usage', 0) - inactive)
+
+def get_counters(stats):
+    """Return the cumulative (block read, block write, net rx, net tx) bytes of a container."""
+    blk_read = blk_write = 0
+    for entry in (stats.get('blkio_stats', {}).get('io_service_bytes_recursive') or []):
+        op = entry.get('op', '').lower()
+        if op == 'read':
+            blk_read += entry.get('value', 0)
+        elif op == 'write':
+            blk_write += entry.get('value', 0)
+    networks = (stats.get('networks') or {}).values()
+    return (blk_read, blk_write,
+            sum(network.get('rx_bytes', 0) for network in networks),
+            sum(network.get('tx_bytes', 0) for network in networks))
+
+class Sampler:
+    """Streams the stats of every container (also ones started later) and takes a sample per service every interval."""
+
+    def __init__(self, client, project, interval):
+        self.client = client
+        self.project = project
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.latest = {}
+        self.previous_counters = {}
+        self.series = {}
+
+    def stream(self, container):
+        """Keep the latest stats of a container until it stops."""
+        service = container.labels.get('com.docker.compose.service', container.name)
+        try:
+            for stats in container.stats(stream=True, decode=True):
+                # An exited container keeps streaming empty stats; its last reading must not count any longer
+                if not stats.get('read') or stats['read'].startswith('0001-') or not stats.get('memory_stats'):
+                    with self.lock:
+                        self.latest[container.id] = None
+                    continue
+                with self.lock:
+                    self.latest[container.id] = (service, stats)
+        except docker.errors.DockerException:
+            pass
+        finally:
+            with self.lock:
+                self.latest.pop(container.id, None)
+
+    def follow_new_containers(self):
+        for container in self.client.containers.list(filters={'label': f'com.docker.compose.project={self.project}'}):
+            with self.lock:
+                if container.id in self.latest:
+                    continue
+                self.latest[container.id] = None
+            threading.Thread(target=self.stream, args=(container,), daemon=True).start()
+
+    def take_sample(self, elapsed):
+        """Append one sample per service, summing the containers of a service."""
+        samples = {}
+        with self.lock:
+            latest = [(container_id, entry) for container_id, entry in self.latest.items() if entry is not None]
+        for container_id, (service, stats) in latest:
+            counters = get_counters(stats)
+            previous = self.previous_counters.get(container_id, counters)
+            self.previous_counters[container_id] = counters
+            sample = samples.setdefault(service, [round(elapsed, 1), 0, 0, 0, 0, 0, 0])
+            sample[1] += get_cpu_percent(stats)
+            sample[2] += get_rss_bytes(stats) / MB
+            for i, (value, previous_value) in enumerate(zip(counters, previous)):
+                # Counters start over when a container restarts
+                sample[3 + i] += max(0, value - previous_value) / MB
+        for service, sample in samples.items():
+            self.series.setdefault(service, []).append([sample[0], round(sample[1], 1)] + [round(value, 2) for value in sample[2:]])
+
+    def run(self):
+        started_at = time.time()
+
+        def stop(signum, frame):
+            raise StopSampling()
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        print(f"[STATS] Sampling containers of project {self.project} every {self.interval}s...", flush=True)
+        try:
+            while True:
+                self.follow_new_containers()
+                self.take_sample(time.time() - started_at)
+                time.sleep(max(0, self.interval - (time.time() - started_at) % self.interval))
+        except StopSampling:
+            pass
+        return {'project': self.project, 'started_at': started_at, 'interval': self.interval,
+                'columns': COLUMNS, 'services': self.series}
+
+def summarize(data):
+    """Return [(service, cpu avg, cpu peak, rss avg, rss peak, blk read, blk write, net rx, net tx)]."""
+    rows = []
+    for service, samples in sorted(data['services'].items()):
+        columns = dict(zip(data['columns'], zip(*samples)))
+        # The first reading of a container has no previous CPU reading to compare with
+        cpu = columns['cpu'][1:] or columns['cpu']
+        rows.append((service,
+                     sum(cpu) / len(cpu), max(cpu),
+                     sum(columns['rss']) / len(samples), max(columns['rss']),
+                     sum(columns['blk_read']), sum(columns['blk_write']),
+                     sum(columns['net_rx']), sum(columns['net_tx'])))
+    return rows
+
+def print_summary(data):
+    print("[STATS] ===== RESOURCE SUMMARY =====")
+    print(f"[STATS] {'service':<16} {'cpu avg':>8} {'cpu peak':>9} {'rss avg':>9} {'rss peak':>9} "
+          f"{'blk read':>9} {'blk write':>10} {'net rx':>8} {'net tx':>8}")
+    for service, cpu_avg, cpu_peak, rss_avg, rss_peak, blk_read, blk_write, net_rx, net_tx in summarize(data):
+        print(f"[STATS] {service:<16} {cpu_avg:>7.0f}% {cpu_peak:>8.0f}% {rss_avg:>7.0f}MB {rss_peak:>7.0f}MB "
+              f"{blk_read:>7.0f}MB {blk_write:>8.0f}MB {net_rx:>6.0f}MB {net_tx:>6.0f}MB")
+    print("[STATS] cpu in % of one core; rss without page cache; I/O and network are totals")
+
+def main():
+    """Main function to sample container stats."""
+    args = parse_args()
+
+    if args.summary:
+        with open(args.summary, 'r') as f:
+            print_summary(json.load(f))
+        return 0
+
+    project = args.project or get_project_name()
+    data = Sampler(docker.from_env(), project, args.interval).run()
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    samples = sum(len(samples) for samples in data['services'].values())
+    print(f"[STATS] Wrote {samples} samples of {len(data['services'])} services to {args.output}")
+    print_summary(data)
+    return 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except docker.errors.DockerException as e:
+        print(f"Docker error: {e}")
+        sys.exit(1)
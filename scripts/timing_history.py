@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+SQLite store of CI timing history: per-phase durations of ci-run.sh, permutation and shard runs,
+per-test durations and outcomes from Playwright JSON reports, and the commits of yellow-dev and its
+submodules. Reports the slowest and flakiest tests and phase regressions between commits.
+Usage:
+    python3 timing_history.py record --kind ci-run --instance hollow.hostnet.http --phase build=12 \
+        --readiness ci-artifacts/readiness.json --timeline ci-artifacts/timeline.json \
+        --report client=test-results/results.json --exit-code 0
+    python3 timing_history.py runs|slowest|flaky|regressions
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import statistics
+import sys
+import time
+
+from generate_compose import get_project_root, git
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    instance TEXT,
+    host TEXT,
+    started_at REAL NOT NULL,
+    exit_code INTEGER,
+    commit_key TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_commits (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    repo TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    PRIMARY KEY (run_id, repo)
+);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    phase TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (run_id, phase)
+);
+CREATE TABLE IF NOT EXISTS tests (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    suite TEXT NOT NULL,
+    file TEXT NOT NULL,
+    title TEXT NOT NULL,
+    project TEXT,
+    status TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    attempts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_kind_instance ON runs(kind, instance, started_at);
+CREATE INDEX IF NOT EXISTS tests_run ON tests(run_id);
+CREATE INDEX IF NOT EXISTS tests_test ON tests(suite, file, title, project);
+"""
+
+DEFAULT_DB = os.path.join(get_project_root(), '.cache', 'timing-history.sqlite')
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Record and report CI timing history')
+    parser.add_argument('--db', default=os.environ.get('TIMING_DB', DEFAULT_DB),
+                        help='SQLite database (default: $TIMING_DB or .cache/timing-history.sqlite)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record = subparsers.add_parser('record', help='Record one run')
+    record.add_argument('--kind', default='ci-run', help='Kind of run: ci-run, permutation, shard (default: ci-run)')
+    record.add_argument('--instance', default=None, help='Instance name, e.g. hollow.hostnet.http')
+    record.add_argument('--host', default=socket.gethostname(), help='Host the run ran on (default: this host)')
+    record.add_argument('--started-at', type=float, default=None, help='Unix time the run started (default: now)')
+    record.add_argument('--exit-code', type=int, default=None, help='Exit code of the run')
+    record.add_argument('--phase', action='append', default=[], metavar='NAME=SECONDS',
+                        help='Duration of a phase; may be repeated')
+    record.add_argument('--readiness', help='wait_ready.py JSON, recorded as ready.<service> phases')
+    record.add_argument('--timeline', help='stack_timeline.py JSON, recorded as startup.<service> phases')
+    record.add_argument('--report', action='append', default=[], metavar='SUITE=PATH',
+                        help='Playwright JSON report of a suite; may be repeated. Missing files, and with --started-at '
+                             'files older than that (left over from an earlier run), are skipped')
+
+    runs = subparsers.add_parser('runs', help='List recent runs')
+    runs.add_argument('--limit', type=int, default=20)
+
+    slowest = subparsers.add_parser('slowest', help='Slowest tests over recent runs')
+    slowest.add_argument('--limit', type=int, default=20)
+    slowest.add_argument('--last', type=int, default=50, help='Consider the last N runs with tests (default: 50)')
+
+    flaky = subparsers.add_parser('flaky', help='Flakiest tests over recent runs')
+    flaky.add_argument('--limit', type=int, default=20)
+    flaky.add_argument('--last', type=int, default=50, help='Consider the last N runs with tests (default: 50)')
+
+    regressions = subparsers.add_parser('regressions', help='Phases that got slower between the last two commit sets')
+    regressions.add_argument('--kind', default='ci-run')
+    regressions.add_argument('--instance', default=None, help='Only this instance (default: every instance)')
+    regressions.add_argument('--threshold', type=float, default=1.2,
+                             help='Report phases whose median grew by at least this factor (default: 1.2)')
+    regressions.add_argument('--min-seconds', type=float, default=2,
+                             help='...and by at least this many seconds (default: 2)')
+    return parser.parse_args()
+
+def connect(db_path):
+    """Open the database, creating it and its schema if needed."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    connection = sqlite3.connect(db_path)
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.executescript(SCHEMA)
+    return connection
+
+def get_commits(project_root=None):
+    """Return {repo: sha} of yellow-dev ('.') and every checked out submodule."""
+    project_root = project_root or get_project_root()
+    commits = {}
+    head = git(project_root, 'rev-parse', 'HEAD')
+    if head:
+        commits['.'] = head.decode().strip()
+    paths = git(project_root, 'config', '-f', '.gitmodules', '--get-regexp', r'submodule\..*\.path') or b''
+    for line in paths.decode().splitlines():
+        path = line.split(' ', 1)[1]
+        head = git(os.path.join(project_root, path), 'rev-parse', 'HEAD')
+        if head:
+            commits[path] = head.decode().strip()
+    return commits
+
+def get_commit_key(commits):
+    """Short hash identifying a combination of commits."""
+    digest = hashlib.sha256(''.join(f"{repo}:{sha}\n" for repo, sha in sorted(commits.items())).encode())
+    return digest.hexdigest()[:12]
+
+def iter_report_tests(report):
+    """Yield (file, title, project, status, seconds, attempts) for every test of a Playwright JSON report."""
+    def walk(suite, test_file, titles):
+        for spec in suite.get('specs', []):
+            title = ' › '.join(titles + [spec['title']])
+            for test in spec.get('tests', []):
+                results = test.get('results', [])
+                seconds = sum(result.get('duration', 0) for result in results) / 1000
+                yield test_file, title, test.get('projectName'), test.get('status', 'unknown'), seconds, len(results)
+        for child in suite.get('suites', []):
+            yield from walk(child, test_file, titles + [child['title']])
+
+    for suite in report.get('suites', []):
+        yield from walk(suite, suite.get('file') or suite.get('title'), [])
+
+def load_json(path):
+    """Load a JSON file, or return None if it does not exist or is not valid JSON."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def get_artifact_phases(readiness_path=None, timeline_path=None):
+    """Per-service startup phases from wait_ready.py and stack_timeline.py output."""
+    phases = {}
+    for result in (load_json(readiness_path) if readiness_path else None) or []:
+        if result.get('ready'):
+            phases[f"ready.{result['name']}"] = result['seconds']
+    timeline = (load_json(timeline_path) if timeline_path else None) or {}
+    for service_name, service in timeline.get('services', {}).items():
+        if service.get('ready') is not None:
+            phases[f"startup.{service_name}"] = service['ready']
+    if timeline.get('total') is not None:
+        phases['startup.critical_path'] = timeline['total']
+    return phases
+
+def record_run(connection, kind, instance=None, phases=None, reports=None, exit_code=None,
+               host=None, started_at=None, commits=None):
+    """
+    Record a run with its phases ({name: seconds}) and Playwright JSON reports ([(suite, path)]).
+    Returns the run id.
+    """
+    commits = commits if commits is not None else get_commits()
+    with connection:
+        cursor = connection.execute(
+            'INSERT INTO runs (kind, instance, host, started_at, exit_code, commit_key) VALUES (?, ?, ?, ?, ?, ?)',
+            (kind, instance, host or socket.gethostname(), started_at or time.time(), exit_code, get_commit_key(commits)))
+        run_id = cursor.lastrowid
+        connection.executemany('INSERT INTO run_commits (run_id, repo, sha) VALUES (?, ?, ?)',
+                               [(run_id, repo, sha) for repo, sha in commits.items()])
+        connection.executemany('INSERT OR REPLACE INTO phases (run_id, phase, seconds) VALUES (?, ?, ?)',
+                               [(run_id, phase, seconds) for phase, seconds in (phases or {}).items()])
+        for suite, path in reports or []:
+            report = load_json(path)
+            if report is None:
+                continue
+            connection.executemany(
+                'INSERT INTO tests (run_id, suite, file, title, project, status, seconds, attempts) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, suite, *test) for test in iter_report_tests(report)])
+    return run_id
+
+def recent_test_runs(last):
+    """SQL selecting the ids of the last N runs that recorded tests."""
+    return f"SELECT id FROM runs WHERE id IN (SELECT DISTINCT run_id FROM tests) ORDER BY started_at DESC LIMIT {int(last)}"
+
+def print_table(headers, rows, indent=''):
+    """Print rows as aligned columns."""
+    rows = [[str(value) for value in row] for row in rows]
+    widths = [max(len(str(header)), *(len(row[i]) for row in rows)) for i, header in enumerate(headers)]
+    print(indent + '  '.join(header.ljust(width) for header, width in zip(headers, widths)).rstrip())
+    for row in rows:
+        print(indent + '  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+def report_runs(connection, limit):
+    """List the most recent runs with their phases."""
+    rows = []
+    for run_id, kind, instance, host, started_at, exit_code, commit_key in connection.execute(
+            'SELECT id, kind, instance, host, started_at, exit_code, commit_key FROM runs ORDER BY started_at DESC LIMIT ?', (limit,)):
+        phases = connection.execute(
+            "SELECT phase, seconds FROM phases WHERE run_id = ? AND phase NOT LIKE '%.%' ORDER BY phase", (run_id,)).fetchall()
+        rows.append([run_id, time.strftime('%Y-%m-%d %H:%M', time.localtime(started_at)), kind, instance or '-', host,
+                     exit_code if exit_code is not None else '-', commit_key,
+                     ' '.join(f"{phase}={seconds:.0f}s" for phase, seconds in phases)])
+    if not rows:
+        print("No runs recorded")
+        return
+    print_table(['id', 'started', 'kind', 'instance', 'host', 'exit', 'commits', 'phases'], rows)
+
+def report_slowest(connection, limit, last):
+    """Tests with the highest mean duration (all attempts) over the last runs."""
+    rows = connection.execute(f"""
+        SELECT suite, file, title, project, COUNT(*), AVG(seconds), MAX(seconds)
+        FROM tests WHERE run_id IN ({recent_test_runs(last)}) AND status != 'skipped'
+        GROUP BY suite, file, title, project ORDER BY AVG(seconds) DESC LIMIT ?""", (limit,)).fetchall()
+    if not rows:
+        print("No tests recorded")
+        return
+    print_table(['mean', 'max', 'runs', 'suite', 'project', 'test'], [
+        [f"{mean:.1f}s", f"{maximum:.1f}s", runs, suite, project or '-', f"{test_file} › {title}"]
+        for suite, test_file, title, project, runs, mean, maximum in rows])
+
+def report_flaky(connection, limit, last):
+    """Tests that needed retries (flaky) or failed most often over the last runs."""
+    rows = connection.execute(f"""
+        SELECT suite, file, title, project, COUNT(*),
+               SUM(status = 'flaky'), SUM(status = 'unexpected'), SUM(attempts) - COUNT(*)
+        FROM tests WHERE run_id IN ({recent_test_runs(last)}) AND status != 'skipped'
+        GROUP BY suite, file, title, project
+        HAVING SUM(status = 'flaky') + SUM(status = 'unexpected') > 0
+        ORDER BY (SUM(status = 'flaky') + SUM(status = 'unexpected')) * 1.0 / COUNT(*) DESC, COUNT(*) DESC
+        LIMIT ?""", (limit,)).fetchall()
+    if not rows:
+        print("No flaky or failing tests recorded")
+        return
+    print_table(['rate', 'flaky', 'failed', 'retries', 'runs', 'suite', 'project', 'test'], [
+        [f"{(flaky + failed) / runs:.0%}", flaky, failed, retries, runs, suite, project or '-', f"{test_file} › {title}"]
+        for suite, test_file, title, project, runs, flaky, failed, retries in rows])
+
+def get_commit_groups(connection, kind, instance):
+    """Return [(commit_key, [run ids])] of the kind and instance, the most recently run commit set first."""
+    groups = {}
+    for run_id, commit_key in connection.execute(
+            'SELECT id, commit_key FROM runs WHERE kind = ? AND instance IS ? ORDER BY started_at DESC', (kind, instance)):
+        groups.setdefault(commit_key, []).append(run_id)
+    return list(groups.items())
+
+def get_median_phases(connection, run_ids):
+    """Return {phase: median seconds} over the runs."""
+    values = {}
+    placeholders = ','.join('?' * len(run_ids))
+    for phase, seconds in connection.execute(f'SELECT phase, seconds FROM phases WHERE run_id IN ({placeholders})', run_ids):
+        values.setdefault(phase, []).append(seconds)
+    return {phase: statistics.median(seconds) for phase, seconds in values.items()}
+
+def get_changed_repos(connection, old_run_id, new_run_id):
+    """Return [(repo, old sha, new sha)] that differ between two runs."""
+    def commits(run_id):
+        return dict(connection.execute('SELECT repo, sha FROM run_commits WHERE run_id = ?', (run_id,)).fetchall())
+    old, new = commits(old_run_id), commits(new_run_id)
+    return [(repo, old.get(repo), new.get(repo)) for repo in sorted(set(old) | set(new)) if old.get(repo) != new.get(repo)]
+
+def report_regressions(connection, kind, instance, threshold, min_seconds):
+    """Compare median phase durations of the last two commit sets of every instance. Returns the number of regressions."""
+    if instance is not None:
+        instances = [instance]
+    else:
+        instances = [row[0] for row in connection.execute('SELECT DISTINCT instance FROM runs WHERE kind = ?', (kind,))]
+
+    regressions = 0
+    for instance_name in instances:
+        groups = get_commit_groups(connection, kind, instance_name)
+        if len(groups) < 2:
+            print(f"{kind} {instance_name}: fewer than two commit sets recorded")
+            continue
+        (new_key, new_runs), (old_key, old_runs) = groups[0], groups[1]
+        new_phases = get_median_phases(connection, new_runs)
+        old_phases = get_median_phases(connection, old_runs)
+
+        print(f"{kind} {instance_name}: {old_key} ({len(old_runs)} runs) -> {new_key} ({len(new_runs)} runs)")
+        for repo, old_sha, new_sha in get_changed_repos(connection, old_runs[0], new_runs[0]):
+            print(f"    {repo}: {(old_sha or '-')[:10]} -> {(new_sha or '-')[:10]}")
+        rows = []
+        for phase in sorted(set(new_phases) & set(old_phases)):
+            old, new = old_phases[phase], new_phases[phase]
+            if new - old >= min_seconds and new >= old * threshold:
+                rows.append([phase, f"{old:.1f}s", f"{new:.1f}s", f"+{new - old:.1f}s",
+                             f"x{new / old:.2f}" if old else '-'])
+        if rows:
+            regressions += len(rows)
+            print_table(['phase', 'before', 'after', 'diff', 'ratio'], rows, indent='    ')
+        else:
+            print("    no regressions")
+    return regressions
+
+def main():
+    """Main function to record or report."""
+    args = parse_args()
+    connection = connect(args.db)
+
+    if args.command == 'record':
+        phases = get_artifact_phases(args.readiness, args.timeline)
+        phases.update({name: float(seconds) for name, seconds in (phase.split('=', 1) for phase in args.phase)})
+        reports = [report.split('=', 1) for report in args.report]
+        if args.started_at is not None:
+            reports = [(suite, path) for suite, path in reports
+                       if os.path.exists(path) and os.path.getmtime(path) >= args.started_at]
+        run_id = record_run(connection, args.kind, args.instance, phases, reports, args.exit_code,
+                            args.host, args.started_at)
+        tests = connection.execute('SELECT COUNT(*) FROM tests WHERE run_id = ?', (run_id,)).fetchone()[0]
+        print(f"[TIMING] Recorded run {run_id} ({len(phases)} phases, {tests} tests) in {args.db}")
+        return 0
+    if args.command == 'runs':
+        report_runs(connection, args.limit)
+    elif args.command == 'slowest':
+        report_slowest(connection, args.limit, args.last)
+    elif args.command == 'flaky':
+        report_flaky(connection, args.limit, args.last)
+    elif args.command == 'regressions':
+        return 1 if report_regressions(connection, args.kind, args.instance, args.threshold, args.min_seconds) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Wait until the services of a stack are ready, probing all of them concurrently.
+Targets are tcp://host:port (ready once a connection is accepted) or http(s)://... URLs
+(ready once the response status is below 400; certificates are not verified).
+Usage:
+    python3 wait_ready.py --host-network=true|false --http=true|false [--stack-index=N]
+    python3 wait_ready.py --target client=http://client:3000/#health --target admin=http://admin:4000/#health
+"""
+
+import argparse
+import asyncio
+import json
+import ssl
+import sys
+import time
+from urllib.parse import urlsplit
+
+# Backoff between attempts: starts fast, grows to at most MAX_DELAY
+INITIAL_DELAY = 0.05
+MAX_DELAY = 1.0
+BACKOFF_FACTOR = 1.5
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Wait until stack services are ready')
+    parser.add_argument('--target', action='append', default=[], metavar='NAME=URL',
+                        help='Service to wait for; may be repeated. Replaces the default targets.')
+    parser.add_argument('--host-network', type=str, choices=['true', 'false'], default='false',
+                        help='Stack uses host network mode, used for the default targets (default: false)')
+    parser.add_argument('--http', type=str, choices=['true', 'false'], default='false',
+                        help='Stack uses HTTP, used for the default targets (default: false)')
+    parser.add_argument('--stack-index', type=int, default=0,
+                        help='Index of the stack on this host (generate_compose.py --stack-index), used for the default targets (default: 0)')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='Seconds to wait for all targets (default: 600)')
+    parser.add_argument('--attempt-timeout', type=float, default=2,
+                        help='Seconds a single probe may take (default: 2)')
+    parser.add_argument('--json', dest='json_path',
+                        help='Write time-to-ready per service to this JSON file')
+    return parser.parse_args()
+
+def get_default_targets(host_network, http_mode, stack_index=0):
+    """Return {name: url} for probing a stack from the docker host through its published ports."""
+    from generate_compose import get_client_url, get_port
+
+    targets = {
+        'server': f"http://localhost:{get_port('server_http', stack_index)}/health",
+        'messages': f"http://localhost:{get_port('messages', stack_index)}/health",
+        'admin': f"http://localhost:{get_port('admin', stack_index)}/#health",
+        'client': f"{get_client_url(True, http_mode, stack_index)}/#health",
+    }
+    # MariaDB publishes no port in stack network mode
+    if host_network:
+        targets = {'mariadb': f"tcp://localhost:{get_port('mariadb', stack_index)}", **targets}
+    return targets
+
+async def probe_tcp(parsed, attempt_timeout):
+    """Return True once a TCP connection is accepted."""
+    _, writer = await asyncio.wait_for(asyncio.open_connection(parsed.hostname, parsed.port), attempt_timeout)
+    writer.close()
+    return True
+
+async def probe_http(parsed, attempt_timeout):
+    """Return True if a GET request is answered with a status below 400."""
+    https = parsed.scheme == 'https'
+    ssl_context = None
+    if https:
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+
+    port = parsed.port or (443 if https else 80)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parsed.hostname, port, ssl=ssl_context), attempt_timeout)
+    try:
+        path = (parsed.path or '/') + (f"?{parsed.query}" if parsed.query else '')
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {parsed.netloc}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), attempt_timeout)
+    finally:
+        writer.close()
+
+    parts = status_line.split()
+    if len(parts) < 2:
+        raise ConnectionError(f"invalid response {status_line!r}")
+    status = int(parts[1])
+    if status >= 400:
+        raise ConnectionError(f"HTTP status {status}")
+    return True
+
+async def wait_for_target(name, url, deadline, attempt_timeout, start_time):
+    """Probe url with backoff until it is ready or the deadline passes. Returns a result dict."""
+    parsed = urlsplit(url)
+    probe = probe_tcp if parsed.scheme == 'tcp' else probe_http
+    delay = INITIAL_DELAY
+    attempts = 0
+    last_error = None
+
+    while True:
+        attempts += 1
+        try:
+            await probe(parsed, attempt_timeout)
+            elapsed = time.monotonic() - start_time
+            print(f"[READY] {name} ready after {elapsed:.1f}s ({attempts} attempts)", flush=True)
+            return {'name': name, 'url': url, 'ready': True, 'seconds': round(elapsed, 3), 'attempts': attempts}
+        except (OSError, asyncio.TimeoutError, ValueError, ConnectionError) as e:
+            last_error = str(e) or type(e).__name__
+
+        if time.monotonic() + delay > deadline:
+            print(f"[READY] {name} NOT ready after {attempts} attempts: {last_error}", flush=True)
+            return {'name': name, 'url': url, 'ready': False, 'attempts': attempts, 'error': last_error}
+        await asyncio.sleep(delay)
+        delay = min(delay * BACKOFF_FACTOR, MAX_DELAY)
+
+async def wait_ready(targets, timeout=600, attempt_timeout=2):
+    """Wait for all targets ({name: url}) concurrently. Returns the list of result dicts."""
+    start_time = time.monotonic()
+    deadline = start_time + timeout
+    return await asyncio.gather(*[
+        wait_for_target(name, url, deadline, attempt_timeout, start_time)
+        for name, url in targets.items()
+    ])
+
+def main():
+    """Main function to wait for the stack."""
+    args = parse_args()
+
+    if args.target:
+        targets = dict(target.split('=', 1) for target in args.target)
+    else:
+        targets = get_default_targets(args.host_network == 'true', args.http == 'true', args.stack_index)
+
+    print(f"[READY] Waiting for: {', '.join(f'{name} ({url})' for name, url in targets.items())}", flush=True)
+    results = asyncio.run(wait_ready(targets, args.timeout, args.attempt_timeout))
+
+    print("[READY] ===== TIME TO READY =====")
+    for result in sorted(results, key=lambda result: result.get('seconds', float('inf'))):
+        status = f"{result['seconds']:.1f}s" if result['ready'] else 'not ready'
+        print(f"[READY] {result['name']}: {status}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    return 0 if all(result['ready'] for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+WebSocket load generator for yellow-server and the messages module.
+Opens many concurrent sessions to the server, logs in test accounts, sends messages between the
+accounts at a fixed total rate, and reports throughput and latency percentiles as JSON:
+    send:     from the scheduled send time until the server acknowledges message_send
+    delivery: from the scheduled send time until a session of the recipient gets the new_message event
+Latencies are measured from the scheduled time, so a stalled server cannot hide its queueing delay
+by slowing the sender down.
+Accounts are --user-pattern with {i} = 1..--accounts; they must exist, e.g. created with the seeder.
+Usage:
+    python3 ws_bench.py --server-url ws://localhost:8084 --sessions 2000 --rate 200 --duration 60
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import ssl
+import sys
+import time
+import uuid
+from collections import Counter
+
+import websockets
+
+# Protocol of yellow-server: requests are {requestID, sessionID?, target, data: {command, params}},
+# responses carry the requestID, events carry the event name
+CORE_TARGET = 'core'
+MESSAGES_TARGET = 'org.libersoft.messages'
+LOGIN_COMMAND = 'user_login'
+SUBSCRIBE_COMMAND = 'subscribe'
+SEND_COMMAND = 'message_send'
+NEW_MESSAGE_EVENT = 'new_message'
+
+# Seconds to wait for outstanding deliveries after the last message was sent
+DRAIN_TIMEOUT = 10
+
+def parse_args():
+    """Parse command line arguments; every option defaults to a BENCH_* environment variable."""
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description='WebSocket load generator for yellow-server')
+    parser.add_argument('--server-url', default=env('SERVER_URL', 'ws://localhost:8084'),
+                        help='WebSocket URL of the server (default: $SERVER_URL or ws://localhost:8084)')
+    parser.add_argument('--sessions', type=int, default=int(env('BENCH_SESSIONS', '1000')),
+                        help='Concurrent WebSocket sessions (default: $BENCH_SESSIONS or 1000)')
+    parser.add_argument('--accounts', type=int, default=int(env('BENCH_ACCOUNTS', '0')) or None,
+                        help='Number of accounts the sessions log in to, round-robin (default: $BENCH_ACCOUNTS or --sessions)')
+    parser.add_argument('--user-pattern', default=env('BENCH_USER_PATTERN', 'bench{i}@localhost'),
+                        help='Account address, {i} is replaced by the account number (default: bench{i}@localhost)')
+    parser.add_argument('--password', default=env('BENCH_PASSWORD', 'password'),
+                        help='Password of every account (default: $BENCH_PASSWORD or password)')
+    parser.add_argument('--rate', type=float, default=float(env('BENCH_RATE', '100')),
+                        help='Messages per second over all sessions (default: $BENCH_RATE or 100)')
+    parser.add_argument('--duration', type=float, default=float(env('BENCH_DURATION', '60')),
+                        help='Seconds to send messages for (default: $BENCH_DURATION or 60)')
+    parser.add_argument('--ramp-up', type=float, default=float(env('BENCH_RAMP_UP', '10')),
+                        help='Seconds over which the sessions are opened (default: $BENCH_RAMP_UP or 10)')
+    parser.add_argument('--connect-concurrency', type=int, default=int(env('BENCH_CONNECT_CONCURRENCY', '200')),
+                        help='Maximum number of sessions connecting and logging in at once (default: 200)')
+    parser.add_argument('--request-timeout', type=float, default=float(env('BENCH_REQUEST_TIMEOUT', '10')),
+                        help='Seconds a request may take (default: $BENCH_REQUEST_TIMEOUT or 10)')
+    parser.add_argument('--json', dest='json_path', default=env('BENCH_JSON'),
+                        help='Write the results to this JSON file (default: $BENCH_JSON, else stdout only)')
+    return parser.parse_args()
+
+def summarize(latencies):
+    """Return count, mean and nearest-rank percentiles (in ms) of latencies given in seconds."""
+    if not latencies:
+        return {'count': 0}
+    values = sorted(latencies)
+
+    def percentile(p):
+        return round(values[max(0, math.ceil(p / 100 * len(values)) - 1)] * 1000, 2)
+
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 2),
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': round(values[-1] * 1000, 2),
+    }
+
+class RequestError(Exception):
+    """The server answered a request with an error."""
+
+class Session:
+    """One WebSocket connection logged in as one account."""
+
+    def __init__(self, url, address, password, ssl_context, on_event):
+        self.url = url
+        self.address = address
+        self.password = password
+        self.ssl_context = ssl_context
+        self.on_event = on_event
+        self.session_id = None
+        self.websocket = None
+        self.request_ids = itertools.count(1)
+        self.pending = {}
+        self.reader = None
+
+    async def open(self, timeout):
+        """Connect, log in and subscribe to new messages."""
+        self.websocket = await websockets.connect(self.url, ssl=self.ssl_context, open_timeout=timeout,
+                                                  max_size=None, ping_interval=None)
+        self.reader = asyncio.create_task(self.read())
+        response = await self.request(CORE_TARGET, LOGIN_COMMAND,
+                                      {'address': self.address, 'password': self.password}, timeout)
+        self.session_id = response.get('data', {}).get('sessionID')
+        await self.request(MESSAGES_TARGET, SUBSCRIBE_COMMAND, {'event': NEW_MESSAGE_EVENT}, timeout)
+
+    async def read(self):
+        """Resolve pending requests with their responses and pass events on."""
+        try:
+            async for raw in self.websocket:
+                message = json.loads(raw)
+                future = self.pending.pop(message.get('requestID'), None)
+                if future is not None:
+                    if not future.done():
+                        future.set_result(message)
+                elif message.get('event'):
+                    self.on_event(self, message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('connection closed'))
+            self.pending.clear()
+
+    async def request(self, target, command, params, timeout):
+        """Send a request and return its response; raises RequestError if the server reports an error."""
+        request_id = next(self.request_ids)
+        request = {'requestID': request_id, 'target': target, 'data': {'command': command, 'params': params}}
+        if self.session_id:
+            request['sessionID'] = self.session_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            await self.websocket.send(json.dumps(request))
+            response = await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(request_id, None)
+        if response.get('error'):
+            raise RequestError(f"{command}: {response.get('message') or response.get('error')}")
+        return response
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+        if self.reader is not None:
+            await self.reader
+
+class Benchmark:
+    """Opens the sessions, drives the message rate and collects latencies."""
+
+    def __init__(self, args):
+        self.args = args
+        self.ssl_context = None
+        if args.server_url.startswith('wss://'):
+            # The test stack uses self-signed certificates
+            self.ssl_context = ssl.create_default_context()
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        accounts = args.accounts or args.sessions
+        self.addresses = [args.user_pattern.format(i=i) for i in range(1, accounts + 1)]
+        self.sessions = []
+        self.connect_latencies = []
+        self.connect_failures = 0
+        self.send_latencies = []
+        self.delivery_latencies = []
+        # uid -> (recipient address, scheduled send time) of messages not delivered yet
+        self.in_flight = {}
+        self.sent = 0
+        self.acknowledged = 0
+        self.errors = Counter()
+
+    def on_event(self, session, message):
+        """Record the delivery of a benchmark message to (the first session of) its recipient."""
+        if message.get('event') != NEW_MESSAGE_EVENT:
+            return
+        uid = (message.get('data') or {}).get('uid')
+        pending = self.in_flight.get(uid)
+        if pending and pending[0] == session.address:
+            del self.in_flight[uid]
+            self.delivery_latencies.append(time.perf_counter() - pending[1])
+
+    async def open_session(self, index, start_time, semaphore):
+        """Open session index at its place in the ramp-up."""
+        await asyncio.sleep(max(0.0, start_time + index * self.args.ramp_up / self.args.sessions - time.perf_counter()))
+        address = self.addresses[index % len(self.addresses)]
+        session = Session(self.args.server_url, address, self.args.password, self.ssl_context, self.on_event)
+        async with semaphore:
+            begin = time.perf_counter()
+            try:
+                await session.open(self.args.request_timeout)
+            except (OSError, asyncio.TimeoutError, RequestError, websockets.WebSocketException) as e:
+                self.connect_failures += 1
+                self.errors[f"connect: {str(e) or type(e).__name__}"] += 1
+                await session.close()
+                return
+        self.connect_latencies.append(time.perf_counter() - begin)
+        self.sessions.append(session)
+
+    async def send_message(self, sender, recipient, scheduled):
+        uid = f"bench-{uuid.uuid4().hex}"
+        self.in_flight[uid] = (recipient, scheduled)
+        self.sent += 1
+        try:
+            await sender.request(MESSAGES_TARGET, SEND_COMMAND,
+                                 {'address': recipient, 'message': uid, 'format': 'plaintext', 'uid': uid},
+                                 self.args.request_timeout)
+        except (OSError, asyncio.TimeoutError, RequestError, websockets.WebSocketException) as e:
+            self.errors[f"send: {str(e) or type(e).__name__}"] += 1
+            self.in_flight.pop(uid, None)
+            return
+        self.acknowledged += 1
+        self.send_latencies.append(time.perf_counter() - scheduled)
+
+    async def drive(self):
+        """Send messages between random accounts on a fixed schedule. Returns the seconds spent sending."""
+        interval = 1 / self.args.rate
+        addresses = sorted({session.address for session in self.sessions})
+        tasks = set()
+        start_time = time.perf_counter()
+        scheduled = start_time
+        while scheduled < start_time + self.args.duration:
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            sender = random.choice(self.sessions)
+            recipients = [address for address in random.sample(addresses, min(2, len(addresses))) if address != sender.address]
+            recipient = recipients[0] if recipients else sender.address
+            task = asyncio.create_task(self.send_message(sender, recipient, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            scheduled += interval
+        sending_time = time.perf_counter() - start_time
+        if tasks:
+            await asyncio.wait(tasks)
+        # Give the last deliveries a moment to arrive
+        deadline = time.perf_counter() + DRAIN_TIMEOUT
+        while self.in_flight and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+        return sending_time
+
+    async def run(self):
+        print(f"[BENCH] Opening {self.args.sessions} sessions to {self.args.server_url} "
+              f"({len(self.addresses)} accounts) over {self.args.ramp_up}s...", flush=True)
+        semaphore = asyncio.Semaphore(self.args.connect_concurrency)
+        start_time = time.perf_counter()
+        await asyncio.gather(*[self.open_session(i, start_time, semaphore) for i in range(self.args.sessions)])
+        print(f"[BENCH] {len(self.sessions)} sessions logged in, {self.connect_failures} failed "
+              f"in {time.perf_counter() - start_time:.1f}s", flush=True)
+
+        sending_time = 0
+        if self.sessions:
+            print(f"[BENCH] Sending {self.args.rate} messages/s for {self.args.duration}s...", flush=True)
+            sending_time = await self.drive()
+
+        await asyncio.gather(*[session.close() for session in self.sessions], return_exceptions=True)
+        return self.results(sending_time)
+
+    def results(self, sending_time):
+        per_second = (lambda count: round(count / sending_time, 2)) if sending_time else (lambda count: 0)
+        return {
+            'server_url': self.args.server_url,
+            'config': {
+                'sessions': self.args.sessions,
+                'accounts': len(self.addresses),
+                'rate': self.args.rate,
+                'duration': self.args.duration,
+                'ramp_up': self.args.ramp_up,
+            },
+            'sessions': {
+                'logged_in': len(self.sessions),
+                'failed': self.connect_failures,
+                'connect_latency': summarize(self.connect_latencies),
+            },
+            'messages': {
+                'sent': self.sent,
+                'acknowledged': self.acknowledged,
+                'delivered': len(self.delivery_latencies),
+                'lost': len(self.in_flight),
+                'errors': self.sent - self.acknowledged,
+            },
+            'throughput': {
+                'sent_per_second': per_second(self.sent),
+                'acknowledged_per_second': per_second(self.acknowledged),
+                'delivered_per_second': per_second(len(self.delivery_latencies)),
+            },
+            'latency': {
+                'send': summarize(self.send_latencies),
+                'delivery': summarize(self.delivery_latencies),
+            },
+            'errors': dict(self.errors.most_common(20)),
+        }
+
+def main():
+    """Main function to run the benchmark."""
+    args = parse_args()
+    results = asyncio.run(Benchmark(args).run())
+
+    print(json.dumps(results, indent=2))
+    if args.json_path:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json_path)), exist_ok=True)
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"[BENCH] Wrote {args.json_path}")
+
+    return 0 if results['sessions']['logged_in'] and results['messages']['acknowledged'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
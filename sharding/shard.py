@@ -1,64 +1,543 @@
 import click
+import heapq
+import json
+import os
+import queue
+import shutil
 import subprocess
 import sys
+import threading
+import time
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
-def run_local(command, cwd=None):
-	result = subprocess.run(command, cwd=cwd, shell=True, capture_output=True, text=True)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'scripts'))
+from build_images import load_build_plan
+from generate_compose import get_instance_name, get_stack_project_name
+from timing_history import DEFAULT_DB, connect, iter_report_tests, record_run
+
+# Instance the shards run: ci-run.sh HOLLOW HOST_NETWORK HTTP
+HOLLOW, HOST_NETWORK, HTTP = True, True, True
+INSTANCE_ARGS = ' '.join(str(flag).lower() for flag in (HOLLOW, HOST_NETWORK, HTTP))
+
+# Instance of the stacks of --local: full mode, so the stacks don't share bind-mounted sources, and stack network mode,
+# where only the published ports differ between the stacks (generate_compose.py --stack-index)
+LOCAL_HOLLOW, LOCAL_HOST_NETWORK, LOCAL_HTTP = False, False, True
+LOCAL_INSTANCE_FLAGS = ' '.join(f"--{name}={str(flag).lower()}" for name, flag in
+	[('hollow', LOCAL_HOLLOW), ('host-network', LOCAL_HOST_NETWORK), ('http', LOCAL_HTTP)])
+
+# All ssh and scp connections to a host share one master connection
+SSH_OPTIONS = '-o ControlMaster=auto -o ControlPath=~/.ssh/yellow-shard-%C -o ControlPersist=10m'
+
+# Local registry the built images are pushed to, and pulled from by the hosts through a reverse tunnel
+REGISTRY_CONTAINER = 'yellow-dev-shard-registry'
+REGISTRY_IMAGE = 'registry:2'
+REGISTRY_PORT = 5000
+
+# Per-test-file durations learned from previous runs
+HISTORY_PATH = os.path.join(PROJECT_ROOT, '.cache', 'test-durations.json')
+
+# Where the Playwright reports of each shard are collected, and the merged report is written
+REPORTS_DIR = os.path.join(PROJECT_ROOT, 'ci-artifacts', 'shards')
+BLOB_REPORTS_DIR = os.path.join(PROJECT_ROOT, 'ci-artifacts', 'blob-reports')
+MERGED_HTML_DIR = os.path.join(PROJECT_ROOT, 'ci-artifacts', 'playwright-report')
+MERGED_JSON_PATH = os.path.join(PROJECT_ROOT, 'ci-artifacts', 'results.json')
+TIMING_PATH = os.path.join(REPORTS_DIR, 'timing.json')
+REMOTE_REPORT = 'yellow-dev/test-results/results.json'
+REMOTE_BLOB_REPORT = 'yellow-dev/test-results/blob-report/*.zip'
+
+# Lines of output kept per remote command, repeated at the end when it fails
+OUTPUT_TAIL_LINES = 40
+
+# Weight of the newest run in the duration history (exponential moving average)
+HISTORY_ALPHA = 0.5
+
+# Assumed duration of a test file that has never been seen, when there is no history at all
+DEFAULT_DURATION = 60.0
+
+# Serializes the interleaved output of the hosts
+print_lock = threading.Lock()
+
+
+def run_local(command, cwd=None, capture=True):
+	result = subprocess.run(command, cwd=cwd, shell=True, capture_output=capture, text=True)
 	if result.returncode != 0:
-		print(f"[LOCAL ERROR] {command}\n{result.stderr}", file=sys.stderr)
+		print(f"[LOCAL ERROR] {command}\n{result.stderr or ''}", file=sys.stderr)
 		sys.exit(result.returncode)
-	return result.stdout.strip()
+	return (result.stdout or '').strip()
+
+
+def log(ssh_host, message):
+	with print_lock:
+		print(f"[{ssh_host}] {message}", flush=True)
+
+
+def stream_command(label, full_cmd, env=None):
+	"""Run a shell command, streaming its output line by line prefixed with label. Returns (label, last lines of output, exit code, seconds)."""
+	start_time = time.time()
+	tail = deque(maxlen=OUTPUT_TAIL_LINES)
+	process = subprocess.Popen(full_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+		text=True, errors='replace', bufsize=1, cwd=PROJECT_ROOT, env=env)
+	for line in process.stdout:
+		line = line.rstrip('\n')
+		tail.append(line)
+		log(label, line)
+	code = process.wait()
+	return label, '\n'.join(tail), code, time.time() - start_time
 
 
 def run_remote(ssh_host, command):
-	full_cmd = f'ssh {ssh_host} "{command.replace(\'"\', r\'\\\"\')}"'
-	result = subprocess.run(full_cmd, shell=True, capture_output=True, text=True)
-	output = result.stdout
+	"""Run command on the host, streaming its output line by line. Returns (host, last lines of output, exit code, seconds)."""
+	escaped_command = command.replace('"', '\\"')
+	return stream_command(ssh_host, f'ssh {SSH_OPTIONS} {ssh_host} "{escaped_command}"')
+
+
+def load_history():
+	if not os.path.exists(HISTORY_PATH):
+		return {}
+	with open(HISTORY_PATH) as f:
+		return json.load(f)
+
+
+def save_history(history):
+	os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
+	with open(HISTORY_PATH, 'w') as f:
+		json.dump(history, f, indent=1, sort_keys=True)
+
+
+def report_file_durations(report):
+	"""Sum the durations (in seconds, including retries) of all test results per test file of a Playwright JSON report."""
+	durations = {}
+	for test_file, title, project, status, seconds, attempts in iter_report_tests(report):
+		durations[test_file] = durations.get(test_file, 0.0) + seconds
+	return durations
+
+
+def update_history(history, report_path):
+	with open(report_path) as f:
+		durations = report_file_durations(json.load(f))
+	for test_file, duration in durations.items():
+		previous = history.get(test_file)
+		history[test_file] = duration if previous is None else HISTORY_ALPHA * duration + (1 - HISTORY_ALPHA) * previous
+	return len(durations)
+
+
+def list_test_files():
+	"""List the client's Playwright test files, using the local yellow-client checkout."""
+	result = subprocess.run('npx playwright test --list --reporter=json', cwd=os.path.join(PROJECT_ROOT, 'yellow-client'),
+		shell=True, capture_output=True, text=True)
 	if result.returncode != 0:
-		output += f"\n[ERROR on {ssh_host}]\n{result.stderr}"
-	return ssh_host, output, result.returncode
+		return []
+	try:
+		report = json.loads(result.stdout)
+	except json.JSONDecodeError:
+		return []
+	return sorted({suite.get('file') or suite.get('title') for suite in report.get('suites', [])})
 
 
-@click.command()
-@click.option('--ssh', multiple=True, required=True, help='SSH connection strings (user@host[:port])')
-def main(ssh):
-	# (1) Get current git head hash (in yellow-client)
-	client_head = run_local("git -C yellow-client rev-parse HEAD")
-	print(f"GIT HEAD of yellow-client: {client_head}")
+def file_filter(test_files):
+	"""
+	Playwright arguments that select exactly test_files. Playwright searches every argument as a regular expression in
+	the absolute path of each test file, so anchor it at a path separator and the end, and bracket the metacharacters
+	instead of escaping them with backslashes, which the shells and shlex.split() on the way would remove.
+	"""
+	return ' '.join('/' + ''.join(c if c.isalnum() or c in '/_-' else f'[{c}]' for c in test_file) + '$'
+		for test_file in test_files)
+
+
+def estimate_durations(test_files, history):
+	"""Look up each file's duration; files never seen get the median of the known ones."""
+	known = sorted(history[test_file] for test_file in test_files if test_file in history)
+	default = known[len(known) // 2] if known else DEFAULT_DURATION
+	return {test_file: history.get(test_file, default) for test_file in test_files}
+
+
+def partition(durations, bins):
+	"""Longest-processing-time-first: give each file, longest first, to the currently lightest bin."""
+	heap = [(0.0, i, []) for i in range(bins)]
+	for test_file in sorted(durations, key=lambda f: (-durations[f], f)):
+		total, i, files = heapq.heappop(heap)
+		files.append(test_file)
+		heapq.heappush(heap, (total + durations[test_file], i, files))
+	return [(total, files) for total, i, files in sorted(heap, key=lambda item: item[1])]
+
+
+def fetch(ssh_host, remote_path, target):
+	"""Copy a file from the host; returns target, or None if it could not be fetched."""
+	result = subprocess.run(f'scp {SSH_OPTIONS} -q "{ssh_host}:{remote_path}" "{target}"', shell=True, capture_output=True, text=True)
+	if result.returncode != 0:
+		log(ssh_host, f"Could not fetch {remote_path}: {result.stderr.strip()}")
+		return None
+	return target
+
+
+def fetch_reports(ssh_host, name):
+	"""
+	Copy the host's Playwright JSON report to REPORTS_DIR/<name>/results.json and its blob report
+	to BLOB_REPORTS_DIR/<name>.zip. Returns the path of the JSON report or None.
+	"""
+	target_dir = os.path.join(REPORTS_DIR, name)
+	os.makedirs(target_dir, exist_ok=True)
+	os.makedirs(BLOB_REPORTS_DIR, exist_ok=True)
+	fetch(ssh_host, REMOTE_BLOB_REPORT, os.path.join(BLOB_REPORTS_DIR, f"{name}.zip"))
+	return fetch(ssh_host, REMOTE_REPORT, os.path.join(target_dir, 'results.json'))
+
+
+def merge_reports():
+	"""Merge the fetched blob reports into one HTML report and one JSON report, using the client's Playwright."""
+	if not os.path.isdir(BLOB_REPORTS_DIR) or not os.listdir(BLOB_REPORTS_DIR):
+		print("No blob reports to merge")
+		return False
+	env = dict(os.environ,
+		PLAYWRIGHT_HTML_OUTPUT_DIR=MERGED_HTML_DIR,
+		PLAYWRIGHT_HTML_REPORT=MERGED_HTML_DIR,
+		PLAYWRIGHT_HTML_OPEN='never',
+		PLAYWRIGHT_JSON_OUTPUT_FILE=MERGED_JSON_PATH)
+	result = subprocess.run(['npx', 'playwright', 'merge-reports', '--reporter', 'html,json', BLOB_REPORTS_DIR],
+		cwd=os.path.join(PROJECT_ROOT, 'yellow-client'), env=env, capture_output=True, text=True)
+	if result.returncode != 0:
+		print(f"Merging reports failed:\n{result.stdout}{result.stderr}", file=sys.stderr)
+		return False
+	print(f"Merged {len(os.listdir(BLOB_REPORTS_DIR))} reports into {MERGED_HTML_DIR} and {MERGED_JSON_PATH}")
+	return True
+
+
+def print_timing(results):
+	"""Print and save how long each shard job took."""
+	print("\n== Shard timing ==")
+	for result in sorted(results, key=lambda result: -result['seconds']):
+		files = f"{result['files']} files" if result['files'] is not None else ''
+		print(f"{result['name']:>8} {result['host']:<30} {files:>10} {result['seconds']:8.1f}s  EXIT {result['code']}")
+	os.makedirs(REPORTS_DIR, exist_ok=True)
+	with open(TIMING_PATH, 'w') as f:
+		json.dump(results, f, indent=2)
+
+
+def build_and_publish_images():
+	"""Generate and build the shards' instance here, and push its images to the local registry. Returns the image names."""
+	compose_file = os.path.join('generated', f"docker-compose.{get_instance_name(HOLLOW, HOST_NETWORK, HTTP)}.yml")
+	flags = ' '.join(f"--{name}={str(flag).lower()}" for name, flag in [('hollow', HOLLOW), ('host-network', HOST_NETWORK), ('http', HTTP)])
+	run_local(f"scripts/generate_compose.py {flags}", cwd=PROJECT_ROOT, capture=False)
+	run_local(f"scripts/build_images.py {compose_file}", cwd=PROJECT_ROOT, capture=False)
+	images = sorted(plan['image'] for plan in load_build_plan(os.path.join(PROJECT_ROOT, compose_file)).values())
+
+	if not run_local(f"docker ps -q --filter name=^{REGISTRY_CONTAINER}$"):
+		print(f"Starting local registry {REGISTRY_CONTAINER} on 127.0.0.1:{REGISTRY_PORT}")
+		run_local(f"docker rm -f {REGISTRY_CONTAINER} >/dev/null 2>&1; "
+			f"docker run -d --name {REGISTRY_CONTAINER} -p 127.0.0.1:{REGISTRY_PORT}:5000 "
+			f"-v {REGISTRY_CONTAINER}:/var/lib/registry {REGISTRY_IMAGE}")
+	# The registry keeps its volume between runs, so only new layers are pushed
+	for image in images:
+		print(f"Pushing {image} to the local registry")
+		run_local(f"docker tag {image} localhost:{REGISTRY_PORT}/{image} && docker push -q localhost:{REGISTRY_PORT}/{image}")
+	return images
 
-	# (2) Push current HEAD to all remotes
-	print("Running 'git push' ...")
-	run_local("git push")
 
-	# (3) Build remote command(s) to run with sharding
-	total_shards = len(ssh)
-	print(f"Running with {total_shards} shards")
+def ship_to_host(ssh_host, images):
+	"""
+	Pull the images the host is missing from the local registry, through a reverse tunnel over the
+	host's master connection (so only the layers the host does not have yet are transferred),
+	and copy the generated files. Returns True on success.
+	"""
+	start_time = time.time()
+	# Opens the master connection the tunnel is attached to
+	_, tail, code, seconds = run_remote(ssh_host, "true")
+	if code == 0:
+		code = subprocess.run(f"ssh {SSH_OPTIONS} -O forward -R {REGISTRY_PORT}:localhost:{REGISTRY_PORT} {ssh_host}", shell=True).returncode
+	if code != 0:
+		log(ssh_host, f"Could not set up the registry tunnel\n{tail}")
+		return False
 
-	print("\n== Executing remote jobs in parallel ==\n")
+	pulls = '; '.join(
+		f"docker image inspect {image} >/dev/null 2>&1 || "
+		f"(docker pull -q localhost:{REGISTRY_PORT}/{image} && docker tag localhost:{REGISTRY_PORT}/{image} {image} && docker rmi -f localhost:{REGISTRY_PORT}/{image} >/dev/null) || exit 1"
+		for image in images
+	)
+	_, tail, code, seconds = run_remote(ssh_host, pulls)
+	subprocess.run(f"ssh {SSH_OPTIONS} -O cancel -R {REGISTRY_PORT}:localhost:{REGISTRY_PORT} {ssh_host}", shell=True, capture_output=True)
+	if code != 0:
+		log(ssh_host, f"Pulling images failed\n{tail}")
+		return False
 
-	# (4) Run all SSH jobs in parallel with different shard parameters
+	result = subprocess.run(f'scp {SSH_OPTIONS} -q -r "{os.path.join(PROJECT_ROOT, "generated")}" "{ssh_host}:yellow-dev/"',
+		shell=True, capture_output=True, text=True)
+	if result.returncode != 0:
+		log(ssh_host, f"Copying generated files failed: {result.stderr.strip()}")
+		return False
+	log(ssh_host, f"Images and generated files shipped in {time.time() - start_time:.1f}s")
+	return True
+
+
+def ci_run_args(run_tests, playwright_params, shipped):
+	"""Positional ci-run.sh arguments of a shard. With shipped images, the copied generated files and images are used as they are."""
+	generate = 'false' if shipped else 'true'
+	return f"{INSTANCE_ARGS} {str(run_tests).lower()} {generate} true true false \"{playwright_params}\" {generate}"
+
+
+def checkout_command(client_head):
+	return (
+		"cd yellow-dev;"
+		"./pl.sh;"
+		"pushd yellow-client;"
+		f"git checkout {client_head};"
+		"popd;"
+	)
+
+
+def job_result(name, ssh_host, code, seconds, files, report):
+	return {'name': name, 'host': ssh_host, 'code': code, 'seconds': round(seconds, 1), 'files': files, 'report': report}
+
+
+def run_shards(ssh, client_head, playwright_params, file_counts, shipped):
+	"""Run one full ci-run.sh per host, each with its own playwright parameters. Returns the job results."""
+	results = []
 	with ThreadPoolExecutor(max_workers=len(ssh)) as executor:
 		jobs = {}
-		for i, host in enumerate(ssh):
-			shard_param = f"--shard={i+1}/{total_shards}"
+		for i, (host, params) in enumerate(zip(ssh, playwright_params)):
 			remote_shell_cmd = (
-				"cd yellow-dev;"
-				"./pl.sh;"
-				"pushd yellow-client;"
-				f"git checkout {client_head};"
-				"popd;"
-				f"./ci-run.sh true true true true true true true false \"{shard_param}\""
+				checkout_command(client_head) +
+				f"./ci-run.sh {ci_run_args(True, params, shipped)}"
 			)
-			jobs[executor.submit(run_remote, host, remote_shell_cmd)] = host
-		
+			jobs[executor.submit(run_remote, host, remote_shell_cmd)] = i
+
 		for future in as_completed(jobs):
-			host = jobs[future]
-			ssh_host, output, code = future.result()
-			print(f"--- [{ssh_host}] EXIT {code} ---\n{output}\n")
+			i = jobs[future]
+			ssh_host, tail, code, seconds = future.result()
+			log(ssh_host, f"--- EXIT {code} after {seconds:.1f}s ---" + (f"\n{tail}" if code != 0 else ""))
+			results.append(job_result(str(i), ssh_host, code, seconds, file_counts[i], fetch_reports(ssh_host, str(i))))
+	return results
+
+
+def steal_worker(index, ssh_host, client_head, work_queue, results, shipped):
+	"""Bring up a stack on the host, then keep pulling the next test file from the coordinator's queue until it is empty."""
+	log(ssh_host, "Starting stack...")
+	setup = checkout_command(client_head) + f"DETACH=true ./ci-run.sh {ci_run_args(False, '', shipped)}"
+	_, tail, code, seconds = run_remote(ssh_host, setup)
+	results.append(job_result(f"{index}-up", ssh_host, code, seconds, None, None))
+	if code != 0:
+		log(ssh_host, f"Stack setup failed with exit code {code}\n{tail}")
+		return
+
+	count = 0
+	while True:
+		try:
+			test_file = work_queue.get_nowait()
+		except queue.Empty:
+			break
+		count += 1
+		log(ssh_host, f"Running {test_file}...")
+		_, tail, code, seconds = run_remote(ssh_host,
+			f"cd yellow-dev; docker compose --project-directory . -f last.yaml run --rm -e PLAYWRIGHT_PARAMS='{file_filter([test_file])}' playwright")
+		log(ssh_host, f"{test_file}: EXIT {code} after {seconds:.1f}s" + (f"\n{tail}" if code != 0 else ""))
+		# Each run overwrites the host's reports, so fetch them right away
+		name = f"{index}-{count}"
+		results.append(job_result(name, ssh_host, code, seconds, 1, fetch_reports(ssh_host, name)))
+
+	log(ssh_host, "Queue empty, shutting down stack")
+	run_remote(ssh_host, "cd yellow-dev; docker compose --project-directory . -f last.yaml down")
+
+
+def local_compose_file(stack_index):
+	return os.path.join('generated', f"docker-compose.{get_instance_name(LOCAL_HOLLOW, LOCAL_HOST_NETWORK, LOCAL_HTTP, stack_index=stack_index)}.yml")
+
+
+def prepare_local_stacks(stack_indexes):
+	"""Generate the compose files of the local stacks, and build their images once: all stacks use the same images."""
+	for stack_index in stack_indexes:
+		run_local(f"scripts/generate_compose.py {LOCAL_INSTANCE_FLAGS} --stack-index={stack_index}", cwd=PROJECT_ROOT, capture=False)
+	run_local(f"scripts/build_images.py {local_compose_file(stack_indexes[0])}", cwd=PROJECT_ROOT, capture=False)
+
+
+def copy_local_reports(stack_index, name):
+	"""Copy a local stack's Playwright JSON and blob reports like fetch_reports() does. Returns the path of the JSON report or None."""
+	results_dir = os.path.join(PROJECT_ROOT, f"test-results-stack{stack_index}")
+	target_dir = os.path.join(REPORTS_DIR, name)
+	os.makedirs(target_dir, exist_ok=True)
+	os.makedirs(BLOB_REPORTS_DIR, exist_ok=True)
+	blob_dir = os.path.join(results_dir, 'blob-report')
+	for blob in sorted(os.listdir(blob_dir)) if os.path.isdir(blob_dir) else []:
+		if blob.endswith('.zip'):
+			shutil.copy(os.path.join(blob_dir, blob), os.path.join(BLOB_REPORTS_DIR, f"{name}.zip"))
+	report = os.path.join(results_dir, 'results.json')
+	if not os.path.exists(report):
+		log(f"stack{stack_index}", f"No report in {report}")
+		return None
+	return shutil.copy(report, os.path.join(target_dir, 'results.json'))
+
+
+def run_local_stack(name, stack_index, playwright_params, files, workers):
+	"""Bring up one local stack, run the Playwright service with its parameters against it and tear it down. Returns the job result."""
+	label = f"stack{stack_index}"
+	env = dict(os.environ, COMPOSE_PROJECT_NAME=get_stack_project_name(stack_index, PROJECT_ROOT))
+	if workers:
+		env['PLAYWRIGHT_WORKERS'] = str(workers)
+	compose = f"docker compose --project-directory . -f {local_compose_file(stack_index)}"
+	os.makedirs(os.path.join(PROJECT_ROOT, f"test-results-stack{stack_index}"), exist_ok=True)
+
+	# A stack left over from an aborted run would keep its database; clean.py removes its volumes except the
+	# dependency caches, which `down --volumes` would remove as well
+	stream_command(label, f"{compose} down --remove-orphans && ./clean.py", env)
+	_, tail, code, seconds = stream_command(label,
+		f"{compose} up --no-build --remove-orphans --force-recreate --detach && "
+		f"scripts/wait_ready.py --host-network={str(LOCAL_HOST_NETWORK).lower()} --http={str(LOCAL_HTTP).lower()} --stack-index={stack_index} && "
+		f"{compose} run --rm -e PLAYWRIGHT_PARAMS='{playwright_params}' playwright", env)
+	log(label, f"--- EXIT {code} after {seconds:.1f}s ---" + (f"\n{tail}" if code != 0 else ""))
+	report = copy_local_reports(stack_index, name)
+
+	log(label, "Tearing down stack")
+	stream_command(label, f"{compose} down --remove-orphans && ./clean.py", env)
+	return job_result(name, label, code, seconds, files, report)
+
+
+def run_local_shards(stack_indexes, playwright_params, file_counts, workers):
+	"""Run the shards on stacks side by side on this machine; each stack is torn down as soon as its shard is done."""
+	with ThreadPoolExecutor(max_workers=len(stack_indexes)) as executor:
+		return list(executor.map(lambda i: run_local_stack(str(i), stack_indexes[i], playwright_params[i], file_counts[i], workers),
+			range(len(stack_indexes))))
+
+
+def run_work_stealing(ssh, client_head, durations, shipped):
+	"""Hosts pull test files, longest first, from a queue held by this process until it is empty."""
+	work_queue = queue.Queue()
+	for test_file in sorted(durations, key=lambda f: -durations[f]):
+		work_queue.put(test_file)
+
+	results = []
+	threads = [threading.Thread(target=steal_worker, args=(i, host, client_head, work_queue, results, shipped)) for i, host in enumerate(ssh)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return results
+
+
+@click.command()
+@click.option('--ssh', multiple=True, help='SSH connection strings (user@host[:port])')
+@click.option('--local', type=click.IntRange(min=1), default=None,
+	help='Instead of SSH hosts, run this many stacks side by side on this machine (stack indexes from --first-stack-index)')
+@click.option('--first-stack-index', type=click.IntRange(min=0), default=1, show_default=True,
+	help='With --local: stack index of the first stack; stack 0 is the one ci-run.sh uses by default')
+@click.option('--workers', type=click.IntRange(min=1), default=None,
+	help='With --local: Playwright workers per stack (default: $PLAYWRIGHT_WORKERS or 4)')
+@click.option('--strategy', type=click.Choice(['static', 'balanced', 'steal']), default='balanced', show_default=True,
+	help='static: --shard=i/N; balanced: files split by historical duration; steal: hosts pull files from a queue')
+@click.option('--ship-images', is_flag=True,
+	help='Build the images once here and ship them to the hosts through a local registry, instead of building on every host')
+def main(ssh, local, first_stack_index, workers, strategy, ship_images):
+	start_time = time.time()
+	phases = {}
+
+	if bool(ssh) == bool(local):
+		raise click.UsageError('Pass either --ssh hosts or --local N')
+	if local and (strategy == 'steal' or ship_images):
+		raise click.UsageError('--local supports the static and balanced strategies, and needs no --ship-images')
+
+	if local:
+		client_head = None
+		stack_indexes = list(range(first_stack_index, first_stack_index + local))
+		# Build args and the server-init chown use them, as in ci-run.sh
+		os.environ.setdefault('USER_ID', str(os.getuid()))
+		os.environ.setdefault('GROUP_ID', str(os.getgid()))
+	else:
+		# (1) Get current git head hash (in yellow-client)
+		client_head = run_local("git -C yellow-client rev-parse HEAD")
+		print(f"GIT HEAD of yellow-client: {client_head}")
+
+		# (2) Push current HEAD to all remotes
+		print("Running 'git push' ...")
+		run_local("git push")
+
+	# (3) Decide which tests each host runs
+	total_shards = local or len(ssh)
+	history = load_history()
+	durations = {}
+	if strategy != 'static':
+		# Without the list, files added since the last run would be in no shard
+		test_files = list_test_files()
+		if test_files:
+			durations = estimate_durations(test_files, history)
+		else:
+			print("Could not list the test files, falling back to static sharding")
+			strategy = 'static'
+
+	# Reports of a previous run must not end up in this run's merged report
+	for directory in [REPORTS_DIR, BLOB_REPORTS_DIR]:
+		shutil.rmtree(directory, ignore_errors=True)
+
+	# (4) Build once here and let every host pull what it is missing
+	if local:
+		prepare_start_time = time.time()
+		prepare_local_stacks(stack_indexes)
+		phases['prepare_stacks'] = time.time() - prepare_start_time
+	elif ship_images:
+		ship_start_time = time.time()
+		images = build_and_publish_images()
+		with ThreadPoolExecutor(max_workers=len(ssh)) as executor:
+			shipped = list(executor.map(lambda host: ship_to_host(host, images), ssh))
+		if not all(shipped):
+			print("Shipping images failed", file=sys.stderr)
+			sys.exit(1)
+		phases['ship_images'] = time.time() - ship_start_time
+
+	print(f"Running with {total_shards} shards ({strategy})")
+	print(f"\n== Executing {'local' if local else 'remote'} jobs in parallel ==\n")
+
+	# (5) Run all jobs in parallel
+	if local:
+		if strategy == 'balanced':
+			bins = partition(durations, total_shards)
+			for stack_index, (total, files) in zip(stack_indexes, bins):
+				print(f"[stack{stack_index}] {len(files)} files, estimated {total:.0f}s")
+			# Stacks without files are simply not started
+			bins = [(stack_index, files) for stack_index, (total, files) in zip(stack_indexes, bins) if files]
+			results = run_local_shards([stack_index for stack_index, files in bins], [file_filter(files) for stack_index, files in bins],
+				[len(files) for stack_index, files in bins], workers)
+		else:
+			results = run_local_shards(stack_indexes, [f"--shard={i+1}/{total_shards}" for i in range(total_shards)],
+				[None] * total_shards, workers)
+	elif strategy == 'steal':
+		results = run_work_stealing(ssh, client_head, durations, ship_images)
+	elif strategy == 'balanced':
+		bins = partition(durations, total_shards)
+		for host, (total, files) in zip(ssh, bins):
+			print(f"[{host}] {len(files)} files, estimated {total:.0f}s")
+		# An empty file list would make a host run the whole suite
+		busy = [(host, files) for host, (total, files) in zip(ssh, bins) if files]
+		results = run_shards([host for host, files in busy], client_head,
+			[file_filter(files) for host, files in busy], [len(files) for host, files in busy], ship_images)
+	else:
+		results = run_shards(ssh, client_head,
+			[f"--shard={i+1}/{total_shards}" for i in range(total_shards)], [None] * total_shards, ship_images)
+
+	# (6) Learn test file durations from the reports of this run
+	updated = 0
+	for result in results:
+		if result['report']:
+			updated += update_history(history, result['report'])
+	if updated:
+		save_history(history)
+		print(f"Updated durations of {updated} test files in {HISTORY_PATH}")
+
+	# (7) One report for the whole run
+	merge_reports()
+	print_timing(results)
+
+	failed = [result for result in results if result['code'] != 0]
+
+	# (8) Timing history: every job's duration and every test result of the run
+	phases.update({f"job.{result['name']}": result['seconds'] for result in results})
+	phases['total'] = time.time() - start_time
+	instance = get_instance_name(LOCAL_HOLLOW, LOCAL_HOST_NETWORK, LOCAL_HTTP) if local else get_instance_name(HOLLOW, HOST_NETWORK, HTTP)
+	timing_db = os.environ.get('TIMING_DB', DEFAULT_DB)
+	record_run(connect(timing_db), 'shard-local' if local else 'shard', instance, phases,
+		[('client', result['report']) for result in results if result['report']], 1 if failed else 0, started_at=start_time)
+	print(f"Recorded the run in {timing_db}")
 
-	print("All done.")
+	print("All done." if not failed else f"{len(failed)} job(s) failed.")
+	sys.exit(1 if failed else 0)
 
 
 if __name__ == '__main__':